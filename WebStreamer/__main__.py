@@ -12,7 +12,8 @@ from WebStreamer import bot_loop, utils
 from WebStreamer import StreamBot
 from WebStreamer.server import web_server
 from WebStreamer.bot.clients import initialize_clients
-from WebStreamer.bot import cached_bot_info
+from WebStreamer.bot import cached_bot_info, multi_clients
+from WebStreamer.server.stream_routes import get_byte_streamer
 from WebStreamer.utils import upload_to_github, download_from_github
 from WebStreamer.bot import session_name as bot_session_name
 
@@ -28,7 +29,8 @@ logging.getLogger("pyrogram").setLevel(logging.ERROR)
 #logging.getLogger("pyrogram").setLevel(logging.DEBUG)
 #logging.getLogger("aiohttp.web").setLevel(logging.ERROR)
 
-server = web.AppRunner(web_server())
+# Handlers are cancelled when the client disconnects, so streams stop their Telegram fetches right away
+server = web.AppRunner(web_server(), handler_cancellation=True)
 
 # Session file named based on BOT_ID from env (e.g., "123456789.session")
 session_file = f"{bot_session_name}.session"
@@ -289,6 +291,14 @@ async def start_services():
         await initialize_clients()
         logging.info("------------------------------ DONE ------------------------------")
         
+        if utils.metadata_index:
+            logging.info("--------------------- Opening Metadata Index ---------------------")
+            await utils.metadata_index.start()
+            logging.info("------------------------------ DONE ------------------------------")
+
+        if utils.access_log:
+            await utils.access_log.start()
+        
         # Pre-cache BIN_CHANNEL peer to avoid "Peer id invalid" errors
         if Var.BIN_CHANNEL:
             logging.info("------------------ Pre-caching BIN_CHANNEL Peer ------------------")
@@ -300,6 +310,10 @@ async def start_services():
             except Exception as e:
                 logging.error(f"Failed to pre-cache BIN_CHANNEL: {e}")
                 logging.info("--------------------------- FAILED ------------------------------")
+        if Var.PREWARM_MEDIA_SESSIONS:
+            logging.info("----------------- Warming Up Media Sessions (bg) -----------------")
+            streamers = {index: get_byte_streamer(index) for index in multi_clients}
+            asyncio.create_task(utils.prewarm_media_sessions(streamers, Var.PREWARM_DC_IDS, Var.PREWARM_INTERVAL))
         if Var.ON_HEROKU:
             logging.info("------------------ Starting Keep Alive Service ------------------")
             logging.info("")
@@ -329,6 +343,18 @@ async def cleanup():
     except Exception as e:
         logging.error(f"Error during server cleanup: {e}")
     
+    try:
+        if utils.metadata_index:
+            await utils.metadata_index.close()
+    except Exception as e:
+        logging.error(f"Error while closing the metadata index: {e}")
+
+    try:
+        if utils.access_log:
+            await utils.access_log.close()
+    except Exception as e:
+        logging.error(f"Error while closing the access log: {e}")
+    
     try:
         # Check if StreamBot is already stopped before attempting to stop
         if StreamBot.is_connected:
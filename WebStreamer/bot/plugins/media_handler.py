@@ -8,6 +8,7 @@ from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from WebStreamer.bot import StreamBot
 from WebStreamer.vars import Var
 from pyrogram.file_id import FileId
+from WebStreamer.utils.metadata_cache import remember_metadata
 
 # Media types we want to track
 MEDIA_FILTER = (
@@ -137,6 +138,22 @@ async def get_bot_user_id(client) -> int:
         # Return a fallback based on client id (not ideal but prevents crash)
         return client_id
 
+def index_media(message: Message):
+    """Record the media metadata in the shared cache and the persistent index (if enabled)"""
+    media = message.video or message.audio or message.document
+    if not media or not message.chat:
+        return
+    remember_metadata({
+        "unique_id": media.file_unique_id,
+        "file_id": media.file_id,
+        "file_name": getattr(media, 'file_name', None) or "",
+        "file_size": getattr(media, 'file_size', 0),
+        "mime_type": getattr(media, 'mime_type', None) or "",
+        "dc_id": FileId.decode(media.file_id).dc_id,
+        "channel_id": message.chat.id,
+        "message_id": message.id,
+    })
+
 async def store_and_reply_to_media(client, message: Message):
     """
     Store media file and reply with DL Link button
@@ -146,6 +163,9 @@ async def store_and_reply_to_media(client, message: Message):
         message: Message containing media
     """
     try:
+        # Index the file even when links aren't sent, so lookups never need Telegram
+        index_media(message)
+        
         # Check if sending links to channels is enabled
         if not Var.SEND_LINKS_TO_CHANNELS:
             logging.debug(f"Skipping link reply - SEND_LINKS_TO_CHANNELS is disabled")
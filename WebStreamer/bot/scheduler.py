@@ -0,0 +1,156 @@
+# Client selection for new streams
+import abc
+import math
+import time
+import logging
+from typing import Callable, Collection, Dict, List, Optional
+from ..vars import Var
+from . import work_loads
+
+# Assumed bandwidth of a client before anything was measured (bytes/sec)
+DEFAULT_CAPACITY = 20 * 1024 * 1024
+# Time constants (seconds) of the bandwidth average and of the observed peak bandwidth
+RATE_TIME_CONSTANT = 5.0
+CAPACITY_TIME_CONSTANT = 600.0
+# Score multiplier for a client that still has to create a media session for the DC
+COLD_DC_FACTOR = 0.5
+# Seconds a FLOOD_WAIT keeps lowering the score of a client after it ended
+FLOOD_PENALTY_DECAY = 300.0
+
+
+class ClientStats:
+    __slots__ = ("rate", "capacity", "last_update", "in_flight", "flood_until", "dc_flood_until", "warm_dcs")
+
+    def __init__(self, now: float):
+        self.rate = 0.0
+        self.capacity = 0.0
+        self.last_update = now
+        self.in_flight = 0
+        self.flood_until = 0.0
+        self.dc_flood_until: Dict[int, float] = {}
+        self.warm_dcs = set()
+
+
+class ClientScheduler(abc.ABC):
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """Base scheduler: keeps per-client statistics and picks the client for a new stream.
+        attributes:
+            clock: time source, replaceable for simulations.
+            stats: ClientStats by client index.
+
+        functions:
+            choose: returns the client index for a new stream of a file on `dc_id`.
+            rank: returns the client indices from best to worst, quarantined clients last.
+            record_flood_wait: quarantines a client, or only its media sessions of a DC.
+        """
+        self.clock = clock
+        self.stats: Dict[int, ClientStats] = {}
+
+    def client_stats(self, index: int) -> ClientStats:
+        stats = self.stats.get(index)
+        if stats is None:
+            stats = self.stats[index] = ClientStats(self.clock())
+        return stats
+
+    def record_bytes(self, index: int, size: int) -> None:
+        """Adds bytes fetched by a client to its bandwidth average (called for every chunk)"""
+        stats = self.client_stats(index)
+        now = self.clock()
+        elapsed = now - stats.last_update
+        # Exponentially decayed byte count divided by the time constant estimates bytes/sec
+        stats.rate = stats.rate * math.exp(-elapsed / RATE_TIME_CONSTANT) + size / RATE_TIME_CONSTANT
+        stats.capacity = max(stats.capacity * math.exp(-elapsed / CAPACITY_TIME_CONSTANT), stats.rate)
+        stats.last_update = now
+
+    def request_started(self, index: int) -> None:
+        self.client_stats(index).in_flight += 1
+
+    def request_finished(self, index: int) -> None:
+        self.client_stats(index).in_flight -= 1
+
+    def record_flood_wait(self, index: int, seconds: float, dc_id: Optional[int] = None) -> None:
+        """Takes a client (or only its media sessions for `dc_id`) out of selection until a FLOOD_WAIT ends"""
+        stats = self.client_stats(index)
+        until = self.clock() + seconds
+        if dc_id is None:
+            stats.flood_until = max(stats.flood_until, until)
+        else:
+            stats.dc_flood_until[dc_id] = max(stats.dc_flood_until.get(dc_id, 0.0), until)
+        logging.warning(
+            f"Client {index} quarantined for {seconds}s after a FLOOD_WAIT"
+            + (f" on DC {dc_id}" if dc_id is not None else "")
+        )
+
+    def available_at(self, index: int, dc_id: Optional[int] = None) -> float:
+        """Returns the time at which the client can be used again for a file on `dc_id`"""
+        stats = self.client_stats(index)
+        if dc_id is None:
+            return stats.flood_until
+        return max(stats.flood_until, stats.dc_flood_until.get(dc_id, 0.0))
+
+    def is_available(self, index: int, dc_id: Optional[int] = None) -> bool:
+        return self.available_at(index, dc_id) <= self.clock()
+
+    def mark_warm(self, index: int, dc_id: int) -> None:
+        self.client_stats(index).warm_dcs.add(dc_id)
+
+    @abc.abstractmethod
+    def order(self, dc_id: Optional[int] = None) -> List[int]:
+        """Returns the client indices from best to worst according to the policy"""
+
+    def rank(self, dc_id: Optional[int] = None, exclude: Collection[int] = ()) -> List[int]:
+        now = self.clock()
+        ordered = [index for index in self.order(dc_id) if index not in exclude]
+        healthy = [index for index in ordered if self.available_at(index, dc_id) <= now]
+        # Quarantined clients are only a last resort, the one that recovers first comes first
+        quarantined = sorted(
+            (index for index in ordered if self.available_at(index, dc_id) > now),
+            key=lambda index: self.available_at(index, dc_id),
+        )
+        return healthy + quarantined
+
+    def choose(self, dc_id: Optional[int] = None) -> int:
+        return self.rank(dc_id)[0]
+
+
+class LeastLoadedScheduler(ClientScheduler):
+    """The original policy: fewest active streams (work_loads) first"""
+
+    def order(self, dc_id: Optional[int] = None) -> List[int]:
+        return sorted(work_loads, key=work_loads.get)
+
+
+class WeightedBandwidthScheduler(ClientScheduler):
+    """
+    Picks the client with the best expected throughput for a new stream: the unused
+    bandwidth of the client, or its fair share when it is saturated, lowered when the
+    client has no media session for the DC yet or recently came out of a FLOOD_WAIT.
+    """
+
+    def score(self, index: int, dc_id: Optional[int], now: float) -> float:
+        stats = self.client_stats(index)
+        # Clients that haven't streamed yet are assumed fast so that they get measured
+        capacity = stats.capacity or DEFAULT_CAPACITY
+        # Bytes/sec measured a while ago no longer describe the current load
+        rate = stats.rate * math.exp(-(now - stats.last_update) / RATE_TIME_CONSTANT)
+        # Streams that keep several GetFile requests in flight weigh more than idle ones
+        streams = max(work_loads.get(index, 0), math.ceil(stats.in_flight / max(Var.READ_AHEAD_CHUNKS, 1)))
+        score = max(capacity - rate, capacity / (streams + 1))
+        if dc_id is not None and dc_id not in stats.warm_dcs:
+            score *= COLD_DC_FACTOR
+        flooded_until = self.available_at(index, dc_id)
+        if flooded_until and now - flooded_until < FLOOD_PENALTY_DECAY:
+            score *= 0.5 + 0.5 * max(now - flooded_until, 0.0) / FLOOD_PENALTY_DECAY
+        return score
+
+    def order(self, dc_id: Optional[int] = None) -> List[int]:
+        now = self.clock()
+        return sorted(work_loads, key=lambda index: self.score(index, dc_id, now), reverse=True)
+
+
+SCHEDULERS = {
+    "weighted": WeightedBandwidthScheduler,
+    "least_loaded": LeastLoadedScheduler,
+}
+
+scheduler: ClientScheduler = SCHEDULERS.get(Var.CLIENT_SCHEDULER, WeightedBandwidthScheduler)()
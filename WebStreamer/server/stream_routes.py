@@ -1,22 +1,28 @@
 # Simplified streaming routes - no database, no auth, no R2
 import re
+import asyncio
 import time
-import math
 import logging
 import secrets
 import mimetypes
 from aiohttp import web
 from aiohttp.http_exceptions import BadStatusLine
+from pyrogram.errors import FloodWait
 from WebStreamer import bot_loop
 from functools import partial
 from WebStreamer.bot import multi_clients, work_loads
+from WebStreamer.bot.scheduler import scheduler
 from WebStreamer.server.exceptions import FileNotFound, InvalidHash
+from WebStreamer.utils.metrics import metrics, link_seconds, time_to_first_byte
 from WebStreamer import Var, utils, StartTime, __version__, StreamBot
 from concurrent.futures import ThreadPoolExecutor
 import urllib.parse
 
 THREADPOOL = ThreadPoolExecutor(max_workers=1000)
 
+# Body bytes stream_file wrote for a request, for the access log (typed keys only exist in newer aiohttp)
+BYTES_SENT = web.RequestKey("bytes_sent", int) if hasattr(web, "RequestKey") else "bytes_sent"
+
 
 def sanitize_header_value(value: str) -> str:
     """
@@ -100,10 +106,63 @@ async def favicon_handler(_):
     </svg>'''
     return web.Response(body=favicon_svg, content_type="image/svg+xml")
 
+@routes.get("/status", allow_head=True)
+async def status_route_handler(_):
+    """Report load and cache statistics as JSON"""
+    return web.json_response({
+        'version': __version__,
+        'uptime': utils.get_readable_time(time.time() - StartTime),
+        'loads': {str(index): load for index, load in work_loads.items()},
+        'chunk_cache': utils.chunk_cache.stats() if utils.chunk_cache else None,
+        'chunk_requests': utils.chunk_requests.stats(),
+        'metadata_cache': utils.file_metadata.stats(),
+        'file_cache': {
+            str(index): class_cache[client].cached_file_ids.stats()
+            for index, client in multi_clients.items() if client in class_cache
+        },
+        'scheduler': {
+            str(index): {
+                'bytes_per_second': int(stats.rate),
+                'in_flight': stats.in_flight,
+                'warm_dcs': sorted(stats.warm_dcs),
+                'quarantined': not scheduler.is_available(index),
+                'quarantined_dcs': sorted(dc_id for dc_id in stats.dc_flood_until if not scheduler.is_available(index, dc_id)),
+            }
+            for index, stats in scheduler.stats.items()
+        },
+        'stream_buffers': utils.stream_buffers.stats(),
+        'warmup': utils.warmup_status,
+        'media_sessions': {
+            str(index): {
+                str(dc_id): pool.stats() for dc_id, pool in class_cache[client].media_session_pools.items()
+            }
+            for index, client in multi_clients.items() if client in class_cache
+        },
+    })
+
+@routes.get("/metrics")
+async def metrics_route_handler(_):
+    """Prometheus metrics of the streaming hot path"""
+    return web.Response(
+        body=metrics.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
 # Public API to generate download link from channel/message
 @routes.get("/link/{path:.*}", allow_head=True)
 async def link_route_handler(request: web.Request):
     """Generate download link for a file from channel_id/message_id - No auth, no expiry"""
+    received_at = time.time()
+    started_at = time.monotonic()
+    response = await resolve_link(request)
+    link_seconds.observe((response.status,), time.monotonic() - started_at)
+    if utils.access_log:
+        utils.access_log.record(
+            request.method, request.raw_path, None, response.status, bytes_sent(request, response), received_at
+        )
+    return response
+
+async def resolve_link(request: web.Request) -> web.Response:
     try:
         # eg. path is /link/channelid/messageid
         parts = request.match_info['path'].split("/")
@@ -115,30 +174,33 @@ async def link_route_handler(request: web.Request):
 
         channel_id, message_id = parts
         
-        # Get file properties from Telegram
-        index = min(work_loads, key=work_loads.get)
-        faster_client = multi_clients[index]
-        
-        if Var.MULTI_CLIENT:
-            logging.info(f"Client {index} is now serving {request.remote}")
-
-        if faster_client in class_cache:
-            tg_connect = class_cache[faster_client]
-            logging.debug(f"Using cached ByteStreamer object for client {index}")
+        # Messages resolved before (by any client, or by a previous run through the metadata index)
+        # are answered without picking a client or asking Telegram
+        metadata = await utils.lookup_metadata(int(channel_id), int(message_id))
+        if metadata is not None and metadata["file_id"]:
+            unique_file_id = metadata["unique_id"]
+            telegram_file_id = metadata["file_id"]
+            file_name = metadata["file_name"]
+            file_size = metadata["file_size"]
+            mime_type = metadata["mime_type"]
         else:
-            logging.debug(f"Creating new ByteStreamer object for client {index}")
-            tg_connect = utils.ByteStreamer(faster_client)
-            class_cache[faster_client] = tg_connect
-        
-        logging.debug(f"Getting file properties for message {message_id} in channel {channel_id}")
-        file_id = await tg_connect.get_file_properties(int(message_id), int(channel_id))
-        
-        # Extract file information
-        unique_file_id = file_id.unique_id
-        telegram_file_id = file_id.file_id
-        file_name = file_id.file_name
-        file_size = file_id.file_size
-        mime_type = file_id.mime_type
+            # Get file properties from Telegram
+            index = scheduler.choose()
+            
+            if Var.MULTI_CLIENT:
+                logging.info(f"Client {index} is now serving {request.remote}")
+
+            tg_connect = get_byte_streamer(index)
+            
+            logging.debug(f"Getting file properties for message {message_id} in channel {channel_id}")
+            file_id = await tg_connect.get_file_properties(int(message_id), int(channel_id))
+            
+            # Extract file information
+            unique_file_id = file_id.unique_id
+            telegram_file_id = file_id.file_id
+            file_name = file_id.file_name
+            file_size = file_id.file_size
+            mime_type = file_id.mime_type
         
         # Build permanent download URL with new format
         fqdn = Var.FQDN
@@ -201,32 +263,45 @@ def get_error_page(error_title, error_message):
 </html>'''
     return html_content
 
-async def safe_yield_file(generator):
-    """
-    Wrapper for yield_file that catches exceptions during streaming.
-    If an error occurs during streaming, we can't send an HTML error page
-    because headers were already sent, but we can at least log it and stop gracefully.
-    """
-    try:
-        async for chunk in generator:
-            yield chunk
-    except Exception as e:
-        error_str = str(e)
-        logging.error(f"Error during file streaming: {error_str}", exc_info=True)
-        
-        # Log the specific error type for monitoring
-        if "FILE_REFERENCE" in error_str and "EXPIRED" in error_str:
-            logging.error("FILE_REFERENCE_EXPIRED during streaming - connection already established")
-        elif "FLOOD_WAIT" in error_str:
-            logging.error("FLOOD_WAIT during streaming - rate limited")
-        
-        # Can't send error page here as headers already sent
-        # Connection will be closed and client will see incomplete download
-        raise
-
 @routes.get("/dl/{unique_file_id}/{file_id}/{size}/{filename}", allow_head=True)
 async def direct_download(request: web.Request):
     """Stream file directly using file_id - metadata from URL path"""
+    received_at = time.time()
+    trace = utils.start_trace(Var.TRACE_SAMPLE_RATE)
+    if trace is not None:
+        trace.fields.update(method=request.method, path=request.path, range=request.headers.get("Range"))
+    response = None
+    try:
+        response = await stream_file(request, trace)
+        # Responses that aren't streamed send their headers after the handler returns
+        if trace is not None and not response.prepared:
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
+    finally:
+        # No response: the handler was cancelled because the client disconnected
+        status = response.status if response is not None else None
+        if trace is not None:
+            trace.fields["status"] = status
+            utils.finish_trace(trace, Var.SLOW_REQUEST_MS)
+        if utils.access_log:
+            utils.access_log.record(
+                request.method, request.raw_path, request.headers.get("Range"), status,
+                bytes_sent(request, response), received_at
+            )
+
+
+def bytes_sent(request: web.Request, response: web.StreamResponse) -> int:
+    """Body bytes written for a request: counted by stream_file for streams, the body otherwise"""
+    if BYTES_SENT in request:
+        return request[BYTES_SENT]
+    body = getattr(response, "body", None)
+    if request.method == "HEAD" or not isinstance(body, (bytes, bytearray)):
+        return 0
+    return len(body)
+
+async def stream_file(request: web.Request, trace: "utils.RequestTrace") -> web.StreamResponse:
+    """Handles a /dl request, the phases are timed into `trace` when the request is traced"""
+    started_at = time.monotonic()
     try:
         unique_file_id = request.match_info['unique_file_id']
         file_id = request.match_info['file_id']
@@ -239,21 +314,27 @@ async def direct_download(request: web.Request):
         
         logging.debug(f"Download request: {unique_file_id} - {file_name}")
         
-        # Get a client to stream with
-        index = min(work_loads, key=work_loads.get)
-        faster_client = multi_clients[index]
-        
-        if faster_client in class_cache:
-            tg_connect = class_cache[faster_client]
-        else:
-            tg_connect = utils.ByteStreamer(faster_client)
-            class_cache[faster_client] = tg_connect
-        
         # Decode file_id to get file properties
         from pyrogram.file_id import FileId
-        file_id_obj = FileId.decode(file_id)
+        with utils.trace_span("decode"):
+            file_id_obj = FileId.decode(file_id)
+        
+        # The chunk cache, reference refreshes and the ETag are keyed on unique_file_id: a URL pairing
+        # one file's unique id with another file's file_id would serve (and cache) the wrong bytes
+        if unique_file_id != utils.file_unique_id(file_id_obj):
+            error_page = get_error_page("The link doesn't match its file", "Invalid Link")
+            return web.Response(text=error_page, content_type="text/html", status=400)
+        
+        # Get a client to stream with (prefers clients with a media session on the file's DC)
+        with utils.trace_span("select"):
+            index = scheduler.choose(file_id_obj.dc_id)
+            faster_client = multi_clients[index]
+            tg_connect = get_byte_streamer(index)
+        if trace is not None:
+            trace.fields.update(client=index, dc=file_id_obj.dc_id)
         
         # Use metadata from URL path
+        setattr(file_id_obj, "unique_id", unique_file_id)
         setattr(file_id_obj, "file_size", file_size)
         setattr(file_id_obj, "file_name", file_name)
         
@@ -263,10 +344,40 @@ async def direct_download(request: web.Request):
         
         logging.debug(f"Using URL metadata: {file_name} ({file_size} bytes)")
         
-        # If file_size is 0, we need to get it from Telegram
+        # Revalidation: the ETag only depends on unique_file_id, so answer it before any Telegram call
+        etag = utils.file_etag(unique_file_id)
+        if utils.none_match(request.headers.get("If-None-Match"), etag):
+            headers = {"ETag": etag}
+            cache_control = utils.cache_control_for(mime_type)
+            if cache_control:
+                headers["Cache-Control"] = cache_control
+            return web.Response(status=304, headers=headers)
+        
+        # If file_size is 0, try the metadata caches before asking Telegram
+        if file_size == 0:
+            with utils.trace_span("metadata"):
+                metadata = await utils.lookup_metadata_by_unique_id(unique_file_id)
+            if metadata and metadata["file_size"]:
+                file_size = metadata["file_size"]
+                setattr(file_id_obj, "file_size", file_size)
+                if metadata["file_name"]:
+                    file_name = metadata["file_name"]
+                    setattr(file_id_obj, "file_name", file_name)
+                if metadata["mime_type"]:
+                    mime_type = metadata["mime_type"]
+                    setattr(file_id_obj, "mime_type", mime_type)
+                logging.debug(f"Using indexed metadata for {unique_file_id} ({file_size} bytes)")
+        
+        # If file_size is still 0, we need to get it from Telegram
         if file_size == 0:
             try:
-                message = await faster_client.get_messages(file_id_obj.chat_id, file_id_obj.message_id)
+                with utils.trace_span("get_messages"):
+                    try:
+                        message = await faster_client.get_messages(file_id_obj.chat_id, file_id_obj.message_id)
+                    except FloodWait as e:
+                        # get_messages runs on the client's main connection, the whole client is rate limited
+                        utils.record_flood_wait(index, e.value)
+                        raise
                 media = message.video or message.audio or message.document
                 if media:
                     file_size = media.file_size
@@ -296,46 +407,24 @@ async def direct_download(request: web.Request):
                 file_size = 1024 * 1024 * 1024  # 1GB default
                 setattr(file_id_obj, "file_size", file_size)
         
-        # Handle range requests
-        range_header = request.headers.get("Range", 0)
-        if range_header:
-            from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
-            from_bytes = int(from_bytes)
-            until_bytes = int(until_bytes) if until_bytes else file_size - 1
-        else:
-            from_bytes = request.http_range.start or 0
-            until_bytes = (request.http_range.stop or file_size) - 1
-        
-        if (until_bytes > file_size) or (from_bytes < 0) or (until_bytes < from_bytes):
-            error_page = get_error_page("Range Not Satisfiable", "Invalid Request Range")
-            return web.Response(
-                text=error_page,
-                content_type="text/html",
-                status=416,
-                headers={"Content-Range": f"bytes */{file_size}"},
-            )
-        
-        chunk_size = 1024 * 1024
-        until_bytes = min(until_bytes, file_size - 1)
-        
-        offset = from_bytes - (from_bytes % chunk_size)
-        first_part_cut = from_bytes - offset
-        last_part_cut = until_bytes % chunk_size + 1
-        
-        req_length = until_bytes - from_bytes + 1
-        part_count = math.ceil(until_bytes / chunk_size) - math.floor(offset / chunk_size)
+        # Handle range requests (RFC 7233), the Range header is ignored when If-Range doesn't match
+        range_header = request.headers.get("Range")
+        ranges = None
+        if range_header and utils.if_range_matches(request.headers.get("If-Range"), etag):
+            try:
+                ranges = utils.parse_range_header(range_header, file_size)
+            except utils.RangeNotSatisfiable:
+                error_page = get_error_page("Range Not Satisfiable", "Invalid Request Range")
+                return web.Response(
+                    text=error_page,
+                    content_type="text/html",
+                    status=416,
+                    headers={"Content-Range": f"bytes */{file_size}"},
+                )
         
         # Skip pre-validation - file info (fileId, name, size) is already in URL path
-        # Validation will happen during actual streaming, errors are handled in safe_yield_file
-        logging.debug(f"Starting stream for file: {file_name} (size: {file_size})")
-        
-        # Get the file generator
-        file_generator = tg_connect.yield_file(
-            file_id_obj, index, offset, first_part_cut, last_part_cut, part_count, chunk_size
-        )
-        
-        # Wrap it with error handling
-        body = safe_yield_file(file_generator)
+        # Validation will happen during actual streaming, errors are logged by the file generators
+        logging.debug(f"Starting stream for file: {file_name} (size: {file_size}, ranges: {ranges})")
         
         disposition = "attachment"
         
@@ -346,19 +435,135 @@ async def direct_download(request: web.Request):
         if "video/" in mime_type or "audio/" in mime_type or "/html" in mime_type:
             disposition = "inline"
         
-        logging.debug(f"Streaming: {file_name}")
+        headers = {
+            "Content-Type": f"{mime_type}",
+            "Content-Disposition": f'{disposition}; filename="{file_name}"',
+            "Accept-Ranges": "bytes",
+        }
+        if etag:
+            headers["ETag"] = etag
+        cache_control = utils.cache_control_for(mime_type)
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        multipart = None
+        if ranges is None:
+            ranges = [(0, file_size - 1)] if file_size else []
+            status = 200
+            headers["Content-Length"] = str(file_size)
+        elif len(ranges) == 1:
+            status = 206
+            headers["Content-Range"] = f"bytes {ranges[0][0]}-{ranges[0][1]}/{file_size}"
+            headers["Content-Length"] = str(ranges[0][1] - ranges[0][0] + 1)
+        else:
+            status = 206
+            multipart = utils.MultipartByteranges(ranges, mime_type, file_size)
+            headers["Content-Type"] = multipart.content_type
+            headers["Content-Length"] = str(multipart.content_length)
+        
+        response = web.StreamResponse(status=status, headers=headers)
+        if request.method == "HEAD":
+            if trace is not None:
+                response.headers["Server-Timing"] = trace.server_timing()
+            await response.prepare(request)
+            return response
         
-        return web.Response(
-            status=206 if range_header else 200,
-            body=body,
-            headers={
-                "Content-Type": f"{mime_type}",
-                "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
-                "Content-Length": str(req_length),
-                "Content-Disposition": f'{disposition}; filename="{file_name}"',
-                "Accept-Ranges": "bytes",
-            },
-        )
+        logging.debug(f"Streaming: {file_name}")
+        connection = utils.stream_buffers.open(request.transport, request.remote)
+        generators = []
+        first_byte_at = None
+        body_size = int(headers["Content-Length"])
+        sent = 0
+        unwritten = 0
+        
+        def record_first_byte():
+            nonlocal first_byte_at
+            first_byte_at = time.monotonic()
+            time_to_first_byte.observe((index, file_id_obj.dc_id), first_byte_at - started_at)
+            if trace is not None:
+                trace.mark("first_byte")
+        
+        async def write(data) -> None:
+            """Writes body bytes, `unwritten` holds the ones in hand while the write is pending"""
+            nonlocal sent, unwritten
+            unwritten = len(data)
+            await response.write(data)
+            sent += unwritten
+            unwritten = 0
+        
+        def open_streams(first: int, last: int) -> list:
+            """Creates the file generators for the bytes first..last, they are closed with the response"""
+            streams = open_file_streams(tg_connect, index, file_id_obj, unique_file_id, first, last, connection)
+            generators.extend(streams)
+            return streams
+        
+        async def body():
+            """Yields the pieces of the body, a chunk is fetched before anything of its part is yielded"""
+            if multipart is None:
+                for first, last in ranges:
+                    for generator in open_streams(first, last):
+                        async for chunk in generator:
+                            if first_byte_at is None:
+                                record_first_byte()
+                            yield chunk
+            else:
+                # Ranges close to each other are cut out of one stream so shared chunks are fetched once
+                max_chunk_size = utils.normalize_chunk_size(Var.MAX_CHUNK_SIZE)
+                for first, last, group in utils.group_ranges(ranges, max_chunk_size):
+                    part = None
+                    async for part_index, chunk in utils.slice_ranges(open_streams(first, last), first, group):
+                        if first_byte_at is None:
+                            record_first_byte()
+                        if part_index != part:
+                            part = part_index
+                            yield multipart.part_header(part)
+                        yield chunk
+                yield multipart.closing
+        
+        pieces = body()
+        try:
+            # The first chunk is fetched before the headers go out, so Server-Timing covers the
+            # media session, auth export and first GetFile, and a failure still gets an error page
+            first_piece = None
+            if body_size:
+                try:
+                    first_piece = await pieces.__anext__()
+                except StopAsyncIteration:
+                    pass
+            if trace is not None:
+                response.headers["Server-Timing"] = trace.server_timing()
+            await response.prepare(request)
+            if first_piece is not None:
+                # write() waits for the transport to drain once its buffer is over the high-water
+                # mark, so a slow client stops pulling chunks and its read-ahead stops fetching
+                await write(first_piece)
+                async for piece in pieces:
+                    await write(piece)
+            await response.write_eof()
+        except (ConnectionResetError, asyncio.CancelledError) as e:
+            # The client went away: aiohttp cancels the handler (or the write fails), and closing the
+            # generators below cancels their GetFile requests and read-ahead right away.
+            # Only what reached the write site counts, read-ahead the client never asked for doesn't
+            if sent < body_size:
+                utils.stream_buffers.disconnects += 1
+                utils.stream_buffers.undelivered_bytes += unwritten
+            logging.debug(f"Client {request.remote} closed the connection while streaming {file_name}")
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        except Exception:
+            if not response.prepared:
+                # Nothing was sent yet, the error page handler below answers
+                raise
+            # Headers are already sent and the generator logged the error: drop the connection
+            # so the client sees an incomplete download instead of a truncated file
+            if request.transport is not None:
+                request.transport.close()
+        finally:
+            await pieces.aclose()
+            for generator in generators:
+                await generator.aclose()
+            utils.stream_buffers.close(connection)
+            request[BYTES_SENT] = sent
+        return response
         
     except Exception as e:
         error_str = str(e)
@@ -392,8 +597,123 @@ async def direct_download(request: web.Request):
         error_page = get_error_page("Service Error", "Failed to Stream File")
         return web.Response(text=error_page, content_type="text/html", status=500)
 
+def open_file_streams(
+    tg_connect: "utils.ByteStreamer",
+    index: int,
+    file_id_obj,
+    unique_file_id: str,
+    first: int,
+    last: int,
+    connection,
+) -> list:
+    """
+    Returns the generators that yield the bytes first..last of a file, one per chunk size segment.
+    Long ranges are striped over several clients when STRIPED_DOWNLOADS is enabled.
+    """
+    # Pick GetFile chunk sizes for the range. No small ramp when the chunk cache takes the file:
+    # it only stores full size chunks, so a ramped first block would never be cached
+    max_chunk_size = utils.normalize_chunk_size(Var.MAX_CHUNK_SIZE)
+    if Var.ADAPTIVE_CHUNK_SIZE:
+        cacheable = utils.chunk_cache is not None and utils.chunk_cache.accepts(unique_file_id, max_chunk_size)
+        segments = utils.plan_segments(
+            first, last, Var.MIN_CHUNK_SIZE, max_chunk_size, Var.READ_AHEAD_CHUNKS, ramp=not cacheable
+        )
+    else:
+        segments = [(first, last, max_chunk_size)]
+
+    generators = []
+    for start, end, chunk_size in segments:
+        offset, first_part_cut, last_part_cut, part_count = utils.plan_range(start, end, chunk_size)
+        if Var.STRIPED_DOWNLOADS and len(multi_clients) > 1 and part_count > Var.STRIPE_CHUNKS:
+            # Large range: fetch stripes through the least loaded clients at the same time
+            stripe_clients = scheduler.rank(file_id_obj.dc_id)[:Var.MAX_STRIPES_PER_REQUEST]
+            streamers = [(i, get_byte_streamer(i)) for i in stripe_clients]
+            generators.append(utils.yield_file_striped(
+                streamers, file_id_obj, offset, first_part_cut, last_part_cut, part_count, chunk_size,
+                Var.STRIPE_CHUNKS, Var.MAX_STRIPES_PER_REQUEST, connection
+            ))
+        else:
+            generators.append(tg_connect.yield_file(
+                file_id_obj, index, offset, first_part_cut, last_part_cut, part_count, chunk_size,
+                get_byte_streamer, connection
+            ))
+    return generators
+
 class_cache = {}
 
+def get_byte_streamer(index: int) -> "utils.ByteStreamer":
+    """Returns the cached ByteStreamer of a client, creating it on first use"""
+    client = multi_clients[index]
+    if client in class_cache:
+        logging.debug(f"Using cached ByteStreamer object for client {index}")
+        return class_cache[client]
+    logging.debug(f"Creating new ByteStreamer object for client {index}")
+    tg_connect = utils.ByteStreamer(client, index)
+    class_cache[client] = tg_connect
+    return tg_connect
+
+def cache_stats() -> dict:
+    """Hits and misses of the caches in front of Telegram, coalesced GetFile requests count as hits"""
+    file_caches = [class_cache[client].cached_file_ids.stats() for client in multi_clients.values() if client in class_cache]
+    chunk_requests = utils.chunk_requests.stats()
+    stats = {
+        "metadata": utils.file_metadata.stats(),
+        "file_id": {
+            "hits": sum(cache["hits"] for cache in file_caches),
+            "misses": sum(cache["misses"] for cache in file_caches),
+        },
+        "chunk_requests": {"hits": chunk_requests["coalesced"], "misses": chunk_requests["started"]},
+    }
+    if utils.chunk_cache:
+        stats["chunk"] = utils.chunk_cache.stats()
+    return stats
+
+# Metrics read from the existing statistics when /metrics is scraped
+metrics.collect(
+    "webstreamer_cache_hits_total", "Lookups answered by a cache", "counter", ("cache",),
+    lambda: [((name,), stats["hits"]) for name, stats in cache_stats().items()],
+)
+metrics.collect(
+    "webstreamer_cache_misses_total", "Lookups that missed a cache", "counter", ("cache",),
+    lambda: [((name,), stats["misses"]) for name, stats in cache_stats().items()],
+)
+metrics.collect(
+    "webstreamer_client_load", "Streams and stripes assigned to a client (work_loads)", "gauge", ("client",),
+    lambda: [((index,), load) for index, load in work_loads.items()],
+)
+metrics.collect(
+    "webstreamer_client_bytes_per_second", "Recent GetFile bandwidth of a client", "gauge", ("client",),
+    lambda: [((index,), round(stats.rate)) for index, stats in scheduler.stats.items()],
+)
+metrics.collect(
+    "webstreamer_client_quarantined", "1 while a client is quarantined after a FLOOD_WAIT", "gauge", ("client",),
+    lambda: [((index,), int(not scheduler.is_available(index))) for index in scheduler.stats],
+)
+metrics.collect(
+    "webstreamer_media_sessions", "Open media sessions of a client per DC", "gauge", ("client", "dc"),
+    lambda: [
+        ((index, dc_id), len(pool.sessions))
+        for index, client in multi_clients.items() if client in class_cache
+        for dc_id, pool in class_cache[client].media_session_pools.items()
+    ],
+)
+metrics.collect(
+    "webstreamer_read_ahead_bytes", "Memory reserved by read-ahead GetFile requests", "gauge", (),
+    lambda: [((), utils.stream_buffers.read_ahead_bytes)],
+)
+metrics.collect(
+    "webstreamer_client_disconnects_total", "Downloads aborted by the HTTP client", "counter", (),
+    lambda: [((), utils.stream_buffers.disconnects)],
+)
+metrics.collect(
+    "webstreamer_undelivered_bytes_total", "Body bytes being written when the HTTP client went away", "counter", (),
+    lambda: [((), utils.stream_buffers.undelivered_bytes)],
+)
+metrics.collect(
+    "webstreamer_dropped_read_ahead_bytes_total", "Read-ahead bytes fetched from Telegram but never written",
+    "counter", (), lambda: [((), utils.stream_buffers.dropped_read_ahead_bytes)],
+)
+
 async def formatFileSize(bytes_size: int) -> str:
     """Format file size in human readable format"""
     if bytes_size == 0:
@@ -4,7 +4,27 @@
 from .keepalive import ping_server
 from .config_parser import TokenParser
 from .time_format import get_readable_time
-from .file_properties import get_hash, get_name
-from .custom_dl import ByteStreamer
+from .file_properties import file_unique_id, get_hash, get_name
+from .custom_dl import ByteStreamer, chunk_requests, record_flood_wait
 from .cryptography import verify_sha256_key, decrypt
 from .github_utils import upload_to_github, download_from_github
+from .striped_dl import yield_file_striped
+from .chunking import normalize_chunk_size, plan_range, plan_segments
+from .stream_buffers import stream_buffers
+from .metrics import metrics
+from .tracing import RequestTrace, finish_trace, start_trace, trace_span
+from .access_log import access_log
+from .ranges import (
+    RangeNotSatisfiable,
+    MultipartByteranges,
+    file_etag,
+    group_ranges,
+    if_range_matches,
+    parse_range_header,
+    slice_ranges,
+)
+from .http_cache import cache_control_for, none_match
+from .chunk_cache import chunk_cache
+from .metadata_cache import file_metadata, lookup_metadata, lookup_metadata_by_unique_id
+from .metadata_index import metadata_index
+from .warmup import prewarm_media_sessions, warmup_status
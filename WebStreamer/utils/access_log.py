@@ -0,0 +1,117 @@
+# Compact log of /dl and /link requests, replayed against an instance by benchmarks/replay.py
+import gzip
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, Optional
+from WebStreamer.vars import Var
+
+FIELDS = ("time", "method", "path", "range", "status", "bytes", "duration_ms")
+HEADER = "#access-log v1 " + " ".join(FIELDS)
+# Status of requests whose client went away before the handler finished (nginx's convention)
+CLIENT_CLOSED = 499
+
+
+def open_log(path: str, mode: str):
+    """Opens an access log as text, gzipped when the name ends with .gz (appended gzip members read as one file)"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def format_entry(started_at: float, method: str, path: str, range_header: Optional[str],
+                 status: int, bytes_sent: int, duration: float) -> str:
+    # Paths are percent-encoded, only the Range header can carry whitespace
+    range_value = "".join(range_header.split()) if range_header else "-"
+    return f"{started_at:.3f}\t{method}\t{path}\t{range_value}\t{status}\t{bytes_sent}\t{duration * 1000:.1f}\n"
+
+
+def parse_entry(line: str) -> Dict:
+    started_at, method, path, range_value, status, bytes_sent, duration_ms = line.rstrip("\n").split("\t")
+    return {
+        "time": float(started_at),
+        "method": method,
+        "path": path,
+        "range": None if range_value == "-" else range_value,
+        "status": int(status),
+        "bytes": int(bytes_sent),
+        "duration_ms": float(duration_ms),
+    }
+
+
+def read_access_log(path: str) -> Iterator[Dict]:
+    """Yields the entries of an access log in the order they were written"""
+    with open_log(path, "r") as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                yield parse_entry(line)
+
+
+class AccessLog:
+    def __init__(self, path: str, flush_interval: float):
+        """Append-only log of the /dl and /link requests, one tab-separated line per request.
+        attributes:
+            path: the log file (gzipped when it ends with .gz).
+            flush_interval: seconds between background writes of the queued lines.
+            pending: lines waiting for the next write.
+
+        A line holds the start time, method, path, Range header, status, the body bytes actually
+        written before the response ended or the client went away, and the duration.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending: Deque[str] = deque()
+        self.max_pending = 100_000
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self._write_header)
+        self._task = asyncio.create_task(self._writer())
+        logging.info(f"Recording /dl and /link requests to {self.path}")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def record(self, method: str, path: str, range_header: Optional[str], status: Optional[int],
+               bytes_sent: int, started_at: float) -> None:
+        """Queues one request, `started_at` is its time.time() when it came in"""
+        if len(self.pending) >= self.max_pending:
+            logging.warning("Access log write queue is full, dropping oldest entry")
+            self.pending.popleft()
+        self.pending.append(format_entry(
+            started_at, method, path, range_header, status or CLIENT_CLOSED, bytes_sent, time.time() - started_at
+        ))
+
+    async def flush(self) -> None:
+        if not self.pending:
+            return
+        lines, self.pending = self.pending, deque()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, lines)
+        except OSError as e:
+            logging.error(f"Failed to write {len(lines)} entries to the access log: {e}")
+
+    async def _writer(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _write_header(self) -> None:
+        try:
+            with open_log(self.path, "r") as f:
+                if f.readline():
+                    return
+        except (OSError, EOFError):
+            pass
+        self._write([HEADER + "\n"])
+
+    def _write(self, lines: Iterable[str]) -> None:
+        with open_log(self.path, "a") as f:
+            f.writelines(lines)
+
+
+access_log = AccessLog(Var.ACCESS_LOG, Var.ACCESS_LOG_FLUSH_INTERVAL) if Var.ACCESS_LOG else None
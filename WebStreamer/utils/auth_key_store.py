@@ -0,0 +1,85 @@
+# Encrypted local store of media DC auth keys, so restarts don't repeat the DH exchange and auth export
+import os
+import json
+import base64
+import asyncio
+import logging
+from hashlib import sha256
+from typing import Dict, Optional
+from Crypto.Cipher import AES
+from WebStreamer.vars import Var
+
+
+class AuthKeyStore:
+    def __init__(self, path: str, secret: str):
+        """Per-client, per-DC auth keys kept in one AES-GCM encrypted file.
+        attributes:
+            path: the encrypted file.
+            keys: the decrypted auth keys as "client_name:dc_id:test_mode" -> auth key.
+        """
+        self.path = path
+        self.key = sha256(secret.encode("utf-8")).digest()
+        self.keys: Dict[str, bytes] = {}
+        self.load()
+
+    @staticmethod
+    def key_name(client_name: str, dc_id: int, test_mode: bool) -> str:
+        return f"{client_name}:{dc_id}:{int(bool(test_mode))}"
+
+    def get(self, client_name: str, dc_id: int, test_mode: bool) -> Optional[bytes]:
+        return self.keys.get(self.key_name(client_name, dc_id, test_mode))
+
+    async def set(self, client_name: str, dc_id: int, test_mode: bool, auth_key: bytes) -> None:
+        self.keys[self.key_name(client_name, dc_id, test_mode)] = auth_key
+        await self.save()
+
+    async def discard(self, client_name: str, dc_id: int, test_mode: bool) -> None:
+        if self.keys.pop(self.key_name(client_name, dc_id, test_mode), None) is not None:
+            await self.save()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            nonce, tag, ciphertext = data[:12], data[12:28], data[28:]
+            cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+            stored = json.loads(cipher.decrypt_and_verify(ciphertext, tag))
+            self.keys = {name: base64.b64decode(key) for name, key in stored.items()}
+            logging.info(f"Loaded {len(self.keys)} media auth keys from {self.path}")
+        except (ValueError, KeyError, OSError) as e:
+            # Wrong secret or corrupted file: start over, keys are recreated on demand
+            logging.warning(f"Ignoring unreadable auth key store {self.path}: {e}")
+            self.keys = {}
+
+    async def save(self) -> None:
+        stored = {name: base64.b64encode(key).decode("ascii") for name, key in self.keys.items()}
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=os.urandom(12))
+        ciphertext, tag = cipher.encrypt_and_digest(json.dumps(stored).encode("utf-8"))
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._write, cipher.nonce + tag + ciphertext
+            )
+        except OSError as e:
+            logging.warning(f"Failed to save auth key store {self.path}: {e}")
+
+    def _write(self, data: bytes) -> None:
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        # Owner-only from the start, the keys never sit in a readable file
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+if Var.AUTH_KEY_STORE and not Var.AUTH_KEY_STORE_SECRET:
+    logging.warning("AUTH_KEY_STORE is set without AUTH_KEY_STORE_SECRET, media auth keys won't be stored")
+auth_key_store = (
+    AuthKeyStore(Var.AUTH_KEY_STORE, Var.AUTH_KEY_STORE_SECRET)
+    if Var.AUTH_KEY_STORE and Var.AUTH_KEY_STORE_SECRET else None
+)
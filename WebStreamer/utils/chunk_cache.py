@@ -0,0 +1,170 @@
+# Local disk cache for file chunks - content addressed by (unique_file_id, chunk_index)
+import os
+import re
+import asyncio
+import logging
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from WebStreamer.vars import Var
+
+# unique_file_id comes from the URL, only allow the base64url alphabet Telegram uses
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class ChunkCache:
+    def __init__(self, root: str, max_bytes: int, policy: str = "lru", chunk_size: int = 1024 * 1024):
+        """Disk backed chunk cache with a size limit and LRU or LFU eviction.
+        attributes:
+            root: directory the chunk files are stored in (one sub directory per file).
+            max_bytes: total size of cached chunks before eviction kicks in.
+            policy: "lru" evicts the least recently used chunk, "lfu" the least frequently used one.
+            chunk_size: only chunks fetched with this GetFile limit are cached.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.policy = policy if policy in ("lru", "lfu") else "lru"
+        self.chunk_size = chunk_size
+        # key -> [size, hits], ordered from least to most recently used
+        self.entries: "OrderedDict[Tuple[str, int], list]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = set()
+        # Keys being written, so concurrent streams of the same chunk write it once
+        self._writing = set()
+        os.makedirs(self.root, exist_ok=True)
+        self.load()
+
+    def load(self) -> None:
+        """Rebuilds the index from the chunks already on disk, oldest first"""
+        found = []
+        for unique_id in os.listdir(self.root):
+            directory = os.path.join(self.root, unique_id)
+            if not os.path.isdir(directory) or not _SAFE_ID.match(unique_id):
+                continue
+            for name in os.listdir(directory):
+                if name.endswith(".tmp"):
+                    # Left over by a write that didn't finish
+                    os.remove(os.path.join(directory, name))
+                    continue
+                if not name.isdigit():
+                    continue
+                stat = os.stat(os.path.join(directory, name))
+                found.append((stat.st_mtime, (unique_id, int(name)), stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = [size, 0]
+            self.total_bytes += size
+        self.evict()
+        logging.info(f"Chunk cache loaded {len(self.entries)} chunks ({self.total_bytes} bytes) from {self.root}")
+
+    def accepts(self, unique_id: Optional[str], chunk_size: int) -> bool:
+        return bool(unique_id) and chunk_size == self.chunk_size and bool(_SAFE_ID.match(unique_id))
+
+    def path(self, unique_id: str, chunk_index: int) -> str:
+        return os.path.join(self.root, unique_id, str(chunk_index))
+
+    def contains(self, unique_id: str, chunk_index: int) -> bool:
+        return (unique_id, chunk_index) in self.entries
+
+    def touch(self, key: Tuple[str, int]) -> None:
+        entry = self.entries[key]
+        entry[1] += 1
+        self.entries.move_to_end(key)
+
+    async def get(self, unique_id: str, chunk_index: int) -> Optional[bytes]:
+        """Returns the cached chunk, or None when it isn't cached (misses are counted by the caller)"""
+        key = (unique_id, chunk_index)
+        if key not in self.entries:
+            return None
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(None, self._read, self.path(*key))
+        except OSError as e:
+            logging.warning(f"Dropping unreadable cached chunk {key}: {e}")
+            if key in self.entries:
+                self.discard(key)
+            return None
+        # The chunk may have been evicted while it was read
+        if key in self.entries:
+            self.touch(key)
+        self.hits += 1
+        return data
+
+    def put(self, unique_id: str, chunk_index: int, data: bytes) -> None:
+        """Stores a chunk in the background, the caller never waits for the disk"""
+        key = (unique_id, chunk_index)
+        if key in self.entries or key in self._writing or not data or len(data) > self.max_bytes:
+            return
+        self._writing.add(key)
+        task = asyncio.ensure_future(self._put(key, data))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _put(self, key: Tuple[str, int], data: bytes) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, self.path(*key), data)
+        except OSError as e:
+            logging.warning(f"Failed to cache chunk {key}: {e}")
+            return
+        finally:
+            self._writing.discard(key)
+        if key not in self.entries:
+            self.entries[key] = [len(data), 0]
+            self.total_bytes += len(data)
+            self.evict()
+
+    def evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self.entries:
+            if self.policy == "lfu":
+                key = min(self.entries, key=lambda k: self.entries[k][1])
+            else:
+                key = next(iter(self.entries))
+            self.discard(key)
+            self.evictions += 1
+
+    def discard(self, key: Tuple[str, int]) -> None:
+        size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+        try:
+            os.remove(self.path(*key))
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "chunks": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # A temporary file of its own per write, only complete chunks are ever renamed into place
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+chunk_cache = (
+    ChunkCache(Var.CHUNK_CACHE_DIR, Var.CHUNK_CACHE_MAX_BYTES, Var.CHUNK_CACHE_POLICY)
+    if Var.CHUNK_CACHE_DIR else None
+)
@@ -0,0 +1,78 @@
+# GetFile chunk sizes and byte range -> part math
+from typing import List, Tuple, Union
+
+# upload.GetFile limits: power-of-two chunks of 4 KiB to 1 MiB, aligned to their size,
+# so a chunk never crosses a 1 MiB boundary
+SMALLEST_CHUNK_SIZE = 4 * 1024
+LARGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def normalize_chunk_size(chunk_size: int) -> int:
+    """Clamps a chunk size to the GetFile limits and rounds it down to a power of two"""
+    chunk_size = min(max(chunk_size, SMALLEST_CHUNK_SIZE), LARGEST_CHUNK_SIZE)
+    return 1 << (chunk_size.bit_length() - 1)
+
+
+def plan_range(from_bytes: int, until_bytes: int, chunk_size: int) -> Tuple[int, int, int, int]:
+    """
+    Returns (offset, first_part_cut, last_part_cut, part_count) for fetching the bytes
+    `from_bytes`..`until_bytes` (inclusive) in chunks of `chunk_size`: the fetch starts at
+    the aligned `offset`, the first part is cut before `first_part_cut` and the last part
+    after `last_part_cut`.
+    """
+    offset = from_bytes - from_bytes % chunk_size
+    first_part_cut = from_bytes - offset
+    last_part_cut = until_bytes % chunk_size + 1
+    part_count = until_bytes // chunk_size - offset // chunk_size + 1
+    return offset, first_part_cut, last_part_cut, part_count
+
+
+def plan_segments(
+    from_bytes: int,
+    until_bytes: int,
+    min_chunk_size: int,
+    max_chunk_size: int,
+    ramp_parts: int,
+    ramp: bool = True,
+) -> List[Tuple[int, int, int]]:
+    """
+    Splits the bytes `from_bytes`..`until_bytes` into (start, end, chunk_size) segments.
+    A range that fits in one large chunk uses the smallest chunk size covering it. A longer
+    range starts with `ramp_parts` smaller chunks up to the next `max_chunk_size` boundary,
+    fetched together so the first bytes of a seek arrive quickly, then continues with
+    `max_chunk_size` chunks.
+    """
+    min_chunk_size = normalize_chunk_size(min_chunk_size)
+    max_chunk_size = normalize_chunk_size(max(max_chunk_size, min_chunk_size))
+    length = until_bytes - from_bytes + 1
+    if length <= max_chunk_size:
+        chunk_size = min_chunk_size
+        while chunk_size < length:
+            chunk_size *= 2
+        return [(from_bytes, until_bytes, chunk_size)]
+
+    ramp_chunk_size = normalize_chunk_size(max(min_chunk_size, max_chunk_size // max(ramp_parts, 1)))
+    if not ramp or ramp_chunk_size >= max_chunk_size:
+        return [(from_bytes, until_bytes, max_chunk_size)]
+    ramp_end = from_bytes - from_bytes % max_chunk_size + max_chunk_size - 1
+    return [(from_bytes, ramp_end, ramp_chunk_size), (ramp_end + 1, until_bytes, max_chunk_size)]
+
+
+def cut_chunk(
+    chunk: bytes, current_part: int, part_count: int, first_part_cut: int, last_part_cut: int
+) -> Union[bytes, memoryview]:
+    """
+    Trims a chunk to the requested byte range: the first part starts at `first_part_cut`
+    and the last part ends at `last_part_cut`. Trimmed parts are memoryview slices of the
+    chunk, so the bytes are never copied on their way to the transport.
+    """
+    if part_count == 1:
+        if first_part_cut == 0 and last_part_cut >= len(chunk):
+            return chunk
+        return memoryview(chunk)[first_part_cut:last_part_cut]
+    elif current_part == 1:
+        return memoryview(chunk)[first_part_cut:] if first_part_cut else chunk
+    elif current_part == part_count:
+        return memoryview(chunk)[:last_part_cut] if last_part_cut < len(chunk) else chunk
+    return chunk
+
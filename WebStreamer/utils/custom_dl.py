@@ -1,17 +1,46 @@
 import math
+import time
 import asyncio
 import logging
+from collections import deque
 from WebStreamer import Var
-from typing import Dict, Union
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional, Tuple, Union
 from WebStreamer.bot import work_loads
+from WebStreamer.bot.scheduler import scheduler
 from pyrogram import Client, utils, raw
 from .file_properties import get_file_ids
+from .chunk_cache import chunk_cache
+from .stream_buffers import StreamConnection
+from .tracing import trace_span, traced
+from .chunking import cut_chunk
+from .metrics import (
+    active_streams,
+    flood_wait_seconds,
+    flood_waits,
+    getfile_seconds,
+    media_sessions_created,
+    streamed_bytes,
+    telegram_bytes,
+)
+from .single_flight import SingleFlight
+from .lru_cache import LRUCache
+from .session_pool import MediaSessionPool
+from .auth_key_store import auth_key_store
+from .metadata_cache import lookup_metadata, lookup_metadata_by_unique_id, file_id_from_metadata
 from pyrogram.session import Session, Auth
 import inspect
-from pyrogram.errors import AuthBytesInvalid, FloodWait
+from pyrogram.errors import AuthBytesInvalid, FloodWait, FileReferenceExpired
 from WebStreamer.server.exceptions import FileNotFound
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
 
+# Concurrent fetches of the same chunk share one GetFile request (across all clients)
+chunk_requests = SingleFlight(Var.SINGLE_FLIGHT_MAX_KEYS)
+
+# Expired file references are refreshed once per file and shared with every stream of that file,
+# as (file_reference, access_hash) pairs
+reference_refreshes = SingleFlight(Var.SINGLE_FLIGHT_MAX_KEYS)
+refreshed_references = LRUCache(Var.FILE_CACHE_MAX_ENTRIES, Var.FILE_CACHE_TTL)
+
 # Locks to prevent concurrent auth exports per DC (prevents FloodWait)
 _dc_session_locks: Dict[int, asyncio.Lock] = {}
 
@@ -46,216 +75,183 @@ def get_dc_config(dc_id, test_mode):
     return dc_configs.get(dc_id, ("149.154.167.51", 443))
 
 
-async def create_auth_safe(client, dc_id, test_mode):
+# Constructor arguments we know how to provide to Auth/Session, by parameter name
+KNOWN_CONSTRUCTOR_ARGS = ("client", "dc_id", "server_address", "port", "auth_key", "test_mode", "is_media")
+
+# Constructor factories resolved for the installed Pyrogram fork, keyed by class
+_constructor_factories: Dict[type, Callable[..., Any]] = {}
+_dc_addresses: Dict[Tuple[int, bool], Tuple[str, int]] = {}
+
+
+def resolve_dc_address(dc_id, test_mode) -> Tuple[str, int]:
     """
-    Safely create an Auth object and get auth_key with compatibility for different Pyrogram versions.
-    Tries multiple signature patterns to find the one that works.
+    Returns (server_address, port) for a DC, from Pyrogram's internal DC map when it
+    exposes one, or from the hardcoded DC addresses.
     """
-    # Get the Auth.__init__ signature to understand what parameters it accepts
-    sig = inspect.signature(Auth.__init__)
-    param_names = [p for p in sig.parameters.keys() if p != 'self']
-    
-    logging.debug(f"Auth.__init__ parameters: {param_names}")
-    
-    # Check if we need server_address and port (newer Pyrogram versions)
-    if 'server_address' in param_names and 'port' in param_names:
+    key = (dc_id, bool(test_mode))
+    if key not in _dc_addresses:
         try:
-            # Pattern 4: With server_address and port (newest version)
-            logging.debug("Trying Auth pattern 4: with server_address and port")
-            
-            # Try to get DC configuration from Pyrogram's internal DC map
-            try:
-                from pyrogram.session.internals import DataCenter
-                dc = DataCenter(dc_id, test_mode)
-                server_address = dc.address
-                port = dc.port
-                logging.debug(f"Using DataCenter class: {server_address}:{port}")
-            except Exception:
-                # Fallback to hardcoded DC addresses
-                server_address, port = get_dc_config(dc_id, test_mode)
-                logging.info(f"Using hardcoded DC config: {server_address}:{port} for DC {dc_id}")
-            
-            auth = Auth(
-                client,
-                dc_id,
-                server_address,
-                port,
-                test_mode
-            )
-            return await auth.create()
-        except Exception as e:
-            logging.debug(f"Auth pattern 4 failed: {e}")
-    
-    # Try Pattern 1: Old style positional arguments (client, dc_id, test_mode)
-    try:
-        logging.debug("Trying Auth pattern 1: positional arguments")
-        auth = Auth(client, dc_id, test_mode)
-        return await auth.create()
-    except TypeError as e:
-        logging.debug(f"Auth pattern 1 failed: {e}")
-    
-    # Try Pattern 2: Keyword arguments
-    try:
-        logging.debug("Trying Auth pattern 2: keyword arguments")
-        auth = Auth(
-            client=client,
-            dc_id=dc_id,
-            test_mode=test_mode
+            from pyrogram.session.internals import DataCenter
+            dc = DataCenter(dc_id, test_mode)
+            _dc_addresses[key] = (dc.address, dc.port)
+            logging.debug(f"Using DataCenter class: {dc.address}:{dc.port}")
+        except Exception:
+            _dc_addresses[key] = get_dc_config(dc_id, test_mode)
+            logging.info(f"Using hardcoded DC config: {_dc_addresses[key][0]}:{_dc_addresses[key][1]} for DC {dc_id}")
+    return _dc_addresses[key]
+
+
+def get_constructor_factory(cls) -> Callable[..., Any]:
+    """
+    Returns a factory that constructs `cls` (Auth or Session) for the installed Pyrogram fork.
+    The constructor signature is inspected once per process and the factory is cached, so every
+    later call is a direct constructor call with the arguments the fork accepts.
+    The factory takes keyword arguments from KNOWN_CONSTRUCTOR_ARGS; server_address and port are
+    filled in from the DC map when the fork needs them.
+    """
+    factory = _constructor_factories.get(cls)
+    if factory is not None:
+        return factory
+
+    params = [
+        p for p in inspect.signature(cls.__init__).parameters.values()
+        if p.name != "self" and p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)
+    ]
+    param_names = [p.name for p in params]
+    unknown = [p.name for p in params if p.name not in KNOWN_CONSTRUCTOR_ARGS and p.default is p.empty]
+    if unknown:
+        logging.error(f"Failed to resolve {cls.__name__} constructor, unknown required parameters: {unknown}")
+        raise RuntimeError(
+            f"Could not create {cls.__name__} with any known signature. "
+            f"{cls.__name__}.__init__ parameters: {param_names}"
         )
-        return await auth.create()
-    except TypeError as e:
-        logging.debug(f"Auth pattern 2 failed: {e}")
-    
-    # Try Pattern 3: With server_address and port using keyword args
-    if 'server_address' in param_names and 'port' in param_names:
-        try:
-            logging.debug("Trying Auth pattern 3: keyword arguments with server_address and port")
-            server_address, port = get_dc_config(dc_id, test_mode)
-            auth = Auth(
-                client=client,
-                dc_id=dc_id,
-                server_address=server_address,
-                port=port,
-                test_mode=test_mode
-            )
-            return await auth.create()
-        except TypeError as e:
-            logging.debug(f"Auth pattern 3 failed: {e}")
-    
-    # If all patterns fail, log the signature and raise an error
-    logging.error(f"Failed to create Auth. Signature: {sig}")
-    logging.error(f"Parameters attempted: client={type(client).__name__}, dc_id={dc_id}, test_mode={test_mode}")
-    raise RuntimeError(f"Could not create Auth with any known signature. Auth.__init__ parameters: {param_names}")
+    accepted = [name for name in param_names if name in KNOWN_CONSTRUCTOR_ARGS]
+    needs_address = "server_address" in accepted
+
+    def factory(**kwargs):
+        if needs_address and "server_address" not in kwargs:
+            kwargs["server_address"], kwargs["port"] = resolve_dc_address(kwargs["dc_id"], kwargs["test_mode"])
+        return cls(**{name: kwargs[name] for name in accepted if name in kwargs})
+
+    logging.debug(f"Resolved {cls.__name__} constructor with parameters: {accepted}")
+    _constructor_factories[cls] = factory
+    return factory
+
+
+async def create_auth_safe(client, dc_id, test_mode):
+    """
+    Create an Auth object and get auth_key with compatibility for different Pyrogram versions.
+    """
+    auth = get_constructor_factory(Auth)(client=client, dc_id=dc_id, test_mode=test_mode)
+    return await auth.create()
 
 
 def create_session_safe(client, dc_id, auth_key, test_mode, is_media=True):
     """
-    Safely create a Session object with compatibility for different Pyrogram versions.
-    Tries multiple signature patterns to find the one that works.
+    Create a Session object with compatibility for different Pyrogram versions.
     """
-    # Get the Session.__init__ signature to understand what parameters it accepts
-    sig = inspect.signature(Session.__init__)
-    param_names = [p for p in sig.parameters.keys() if p != 'self']
-    
-    logging.debug(f"Session.__init__ parameters: {param_names}")
-    
-    # Try different patterns based on parameter names
-    
-    # Check if we need server_address and port (newer Pyrogram versions)
-    if 'server_address' in param_names and 'port' in param_names:
-        try:
-            # Pattern 4: With server_address and port (newest version)
-            logging.debug("Trying pattern 4: with server_address and port")
-            
-            # Get DC configuration from Pyrogram's internal DC map
-            from pyrogram.session.internals import DataCenter
-            dc = DataCenter(dc_id, test_mode)
-            
-            return Session(
-                client,
-                dc_id,
-                dc.address,  # server_address
-                dc.port,     # port
-                auth_key,
-                test_mode,
-                is_media=is_media
-            )
-        except Exception as e:
-            logging.debug(f"Pattern 4 failed: {e}")
-            
-            # Fallback: Try to get DC info from client or use hardcoded values
-            try:
-                logging.debug("Trying pattern 4b: with hardcoded DC addresses")
-                
-                # Hardcoded DC addresses as fallback (Telegram's standard DCs)
-                dc_configs = {
-                    1: ("149.154.175.53", 443),
-                    2: ("149.154.167.51", 443),
-                    3: ("149.154.175.100", 443),
-                    4: ("149.154.167.91", 443),
-                    5: ("91.108.56.128", 443),
-                }
-                
-                if test_mode:
-                    dc_configs = {
-                        1: ("149.154.175.10", 443),
-                        2: ("149.154.167.40", 443),
-                        3: ("149.154.175.117", 443),
-                    }
-                
-                server_address, port = dc_configs.get(dc_id, ("149.154.167.51", 443))
-                logging.info(f"Using DC config: {server_address}:{port} for DC {dc_id}")
-                
-                return Session(
-                    client,
-                    dc_id,
-                    server_address,
-                    port,
-                    auth_key,
-                    test_mode,
-                    is_media=is_media
-                )
-            except Exception as e2:
-                logging.debug(f"Pattern 4b failed: {e2}")
-                pass
-    
-    try:
-        # Pattern 1: Positional arguments (old style)
-        if len(param_names) >= 4:
-            logging.debug("Trying pattern 1: positional arguments")
-            return Session(client, dc_id, auth_key, test_mode, is_media=is_media)
-    except TypeError as e:
-        logging.debug(f"Pattern 1 failed: {e}")
-        pass
-    
-    try:
-        # Pattern 2: Keyword arguments
-        logging.debug("Trying pattern 2: keyword arguments")
-        return Session(
-            client=client,
-            dc_id=dc_id,
-            auth_key=auth_key,
-            test_mode=test_mode,
-            is_media=is_media
-        )
-    except TypeError as e:
-        logging.debug(f"Pattern 2 failed: {e}")
-        pass
-    
+    return get_constructor_factory(Session)(
+        client=client,
+        dc_id=dc_id,
+        auth_key=auth_key,
+        test_mode=test_mode,
+        is_media=is_media,
+    )
+
+
+async def start_stored_media_session(client: Client, dc_id: int, test_mode: bool) -> Union[Session, None]:
+    """
+    Starts a media session with the auth key stored for this client and DC by a previous run.
+    Returns None (and forgets the key) when there is no stored key or it isn't authorized anymore.
+    """
+    if not auth_key_store:
+        return None
+    auth_key = auth_key_store.get(client.name, dc_id, test_mode)
+    if auth_key is None:
+        return None
+
+    media_session = create_session_safe(client, dc_id, auth_key, test_mode, is_media=True)
     try:
-        # Pattern 3: Without is_media parameter
-        logging.debug("Trying pattern 3: without is_media")
-        return Session(client, dc_id, auth_key, test_mode)
-    except TypeError as e:
-        logging.debug(f"Pattern 3 failed: {e}")
-        pass
-    
-    # If all patterns fail, log the signature and raise an error
-    logging.error(f"Failed to create Session. Signature: {sig}")
-    logging.error(f"Parameters attempted: client={type(client).__name__}, dc_id={dc_id}, auth_key=<bytes>, test_mode={test_mode}, is_media={is_media}")
-    raise RuntimeError(f"Could not create Session with any known signature. Session.__init__ parameters: {param_names}")
+        await media_session.start()
+        # Any call that needs an authorization fails with AUTH_KEY_UNREGISTERED for a stale key
+        await media_session.invoke(raw.functions.users.GetUsers(id=[raw.types.InputUserSelf()]))
+    except Exception as e:
+        logging.info(f"Stored auth key for DC {dc_id} is no longer valid, exporting a new one: {e}")
+        try:
+            await media_session.stop()
+        except Exception:
+            pass
+        await auth_key_store.discard(client.name, dc_id, test_mode)
+        return None
+    logging.debug(f"Reused stored auth key for DC {dc_id}")
+    return media_session
+
+
+def log_stream_error(error: Exception) -> None:
+    """
+    Logs an error that ended a stream. Headers were already sent, so no error page can be
+    shown: the connection is closed and the client sees an incomplete download.
+    """
+    error_str = str(error)
+    logging.error(f"Error during file streaming: {error_str}", exc_info=True)
+
+    # Log the specific error type for monitoring
+    if "FILE_REFERENCE" in error_str and "EXPIRED" in error_str:
+        logging.error("FILE_REFERENCE_EXPIRED during streaming and the reference could not be refreshed")
+    elif "FLOOD_WAIT" in error_str:
+        logging.error("FLOOD_WAIT during streaming - rate limited")
+
+
+def record_flood_wait(index: int, seconds: float, dc_id: Optional[int] = None) -> None:
+    """
+    Quarantines the client in the scheduler and counts the FLOOD_WAIT in the metrics.
+    With a `dc_id` only the client's media sessions of that DC are quarantined, without one
+    (a FLOOD_WAIT on the client's main connection) the whole client is.
+    """
+    scheduler.record_flood_wait(index, seconds, dc_id)
+    labels = (index, dc_id if dc_id is not None else "main")
+    flood_waits.inc(labels)
+    flood_wait_seconds.observe(labels, seconds)
+
+
+def cancel_pending(tasks, connection: StreamConnection = None) -> None:
+    """
+    Cancels read-ahead tasks, retrieving the error of the ones that already failed.
+    With a `connection`, results that are dropped and requests that are cancelled are counted.
+    """
+    for task in tasks:
+        if task.done() and not task.cancelled():
+            # Retrieve the result so a failed read-ahead doesn't log "exception was never retrieved"
+            if task.exception() is None and connection is not None:
+                connection.discard(task.result())
+        else:
+            task.cancel()
+            if connection is not None:
+                connection.buffers.cancelled_requests += 1
 
 
 class ByteStreamer:
-    def __init__(self, client: Client):
+    def __init__(self, client: Client, index: int = 0):
         """A custom class that holds the cache of a specific client and class functions.
         attributes:
             client: the client that the cache is for.
-            cached_file_ids: a dict of cached file IDs.
-            cached_file_properties: a dict of cached file properties.
+            index: the index of the client in multi_clients.
+            cached_file_ids: an LRU cache of file IDs keyed by (channel_id, message_id).
+                The client independent metadata is shared through `lookup_metadata`.
+            media_session_pools: a dict of media session pools keyed by DC ID.
         
         functions:
             generate_file_properties: returns the properties for a media of a specific message contained in Tuple.
-            generate_media_session: returns the media session for the DC that contains the media file.
+            generate_media_session: returns the media session pool for the DC that contains the media file.
             yield_file: yield a file from telegram servers for streaming.
             
         This is a modified version of the <https://github.com/eyaadh/megadlbot_oss/blob/master/mega/telegram/utils/custom_download.py>
         Thanks to Eyaadh <https://github.com/eyaadh>
         """
-        self.clean_timer = 30 * 60
         self.client: Client = client
-        self.cached_file_ids: Dict[int, FileId] = {}
-        asyncio.create_task(self.clean_cache())
+        self.index = index
+        self.cached_file_ids = LRUCache(Var.FILE_CACHE_MAX_ENTRIES, Var.FILE_CACHE_TTL)
+        self.media_session_pools: Dict[int, MediaSessionPool] = {}
 
     async def get_file_properties(self, message_id: int, channel_id) -> FileId:
         """
@@ -263,10 +259,18 @@ class ByteStreamer:
         if the properties are cached, then it'll return the cached results.
         or it'll generate the properties from the Message ID and cache them.
         """
-        if message_id not in self.cached_file_ids:
-            await self.generate_file_properties(message_id, channel_id)
-            logging.debug(f"Cached file properties for message with ID {message_id}")
-        return self.cached_file_ids[message_id]
+        file_id = self.cached_file_ids.get((int(channel_id), message_id))
+        if file_id is None:
+            metadata = await lookup_metadata(int(channel_id), message_id)
+            if metadata is not None and metadata["file_id"]:
+                # Another client (or a previous run) already resolved this message, no need to ask Telegram again
+                file_id = file_id_from_metadata(metadata)
+                self.cached_file_ids.set((int(channel_id), message_id), file_id)
+                logging.debug(f"Using shared file properties for message with ID {message_id}")
+            else:
+                file_id = await self.generate_file_properties(message_id, channel_id)
+                logging.debug(f"Cached file properties for message with ID {message_id}")
+        return file_id
     
     async def generate_file_properties(self, message_id: int, channel_id) -> FileId:
         """
@@ -274,93 +278,149 @@ class ByteStreamer:
         returns ths properties in a FIleId class.
         """
         logging.debug(f"Logging Channel ID {channel_id}")
-        file_id = await get_file_ids(self.client, int(channel_id), message_id)
+        try:
+            file_id = await get_file_ids(self.client, int(channel_id), message_id)
+        except FloodWait as e:
+            # get_messages runs on the client's main connection, the whole client is rate limited
+            record_flood_wait(self.index, e.value)
+            raise
         logging.debug(f"Generated file ID and Unique ID for message with ID {message_id}")
         if not file_id:
             logging.debug(f"Message with ID {message_id} not found")
             raise FileNotFound
-        self.cached_file_ids[message_id] = file_id
+        self.cached_file_ids.set((int(channel_id), message_id), file_id)
         logging.debug(f"Cached media message with ID {message_id}")
-        return self.cached_file_ids[message_id]
+        return file_id
 
-    async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
+    async def generate_media_session(self, client: Client, file_id: FileId) -> MediaSessionPool:
         """
-        Generates the media session for the DC that contains the media file.
+        Generates the pool of media sessions for the DC that contains the media file.
         This is required for getting the bytes from Telegram servers.
+        """
+        return await self.generate_dc_media_session(client, file_id.dc_id)
+
+    @traced("media_session")
+    async def generate_dc_media_session(self, client: Client, dc_id: int) -> MediaSessionPool:
+        """
+        Generates the pool of media sessions for a DC.
+        The pool starts with the client's media session and opens more sessions with the same
+        auth key when it gets busy, so auth export/import only happens once per DC.
         Uses locks to prevent concurrent auth exports (which cause FloodWait).
         """
+        pool = self.media_session_pools.get(dc_id)
+        if pool is not None:
+            logging.debug(f"Using cached media session pool for DC {dc_id}")
+            return pool
+
+        # Use a lock to prevent multiple concurrent auth exports for the same DC
+        async with get_dc_lock(dc_id):
+            # Double-check after acquiring lock (another request might have created it)
+            pool = self.media_session_pools.get(dc_id)
+            if pool is not None:
+                logging.debug(f"Media session pool created by another request for DC {dc_id}")
+                return pool
 
-        media_session = client.media_sessions.get(file_id.dc_id, None)
+            media_session = client.media_sessions.get(dc_id, None)
+            if media_session is None:
+                try:
+                    media_session = await self.create_media_session(client, dc_id)
+                except FloodWait as e:
+                    # A flooded auth export already quarantined the whole client in create_media_session
+                    if scheduler.is_available(self.index):
+                        record_flood_wait(self.index, e.value, dc_id)
+                    raise
+                client.media_sessions[dc_id] = media_session
+                media_sessions_created.inc((self.index, dc_id, "primary"))
+            test_mode = await client.storage.test_mode()
+            auth_key = media_session.auth_key
 
-        if media_session is None:
-            # Use a lock to prevent multiple concurrent auth exports for the same DC
-            dc_lock = get_dc_lock(file_id.dc_id)
+            async def create_pooled_session() -> Session:
+                session = create_session_safe(client, dc_id, auth_key, test_mode, is_media=True)
+                await session.start()
+                media_sessions_created.inc((self.index, dc_id, "pooled"))
+                return session
+
+            pool = MediaSessionPool(
+                dc_id,
+                media_session,
+                create_pooled_session,
+                Var.MEDIA_SESSION_POOL_SIZE,
+                Var.MEDIA_SESSION_GROW_THRESHOLD,
+                Var.MEDIA_SESSION_IDLE_TIMEOUT,
+            )
+            self.media_session_pools[dc_id] = pool
+            scheduler.mark_warm(self.index, dc_id)
+        return pool
+
+    async def create_media_session(self, client: Client, dc_id: int) -> Session:
+        """
+        Creates and starts a media session for a DC.
+        For a DC other than the client's home DC, the authorization is exported and imported,
+        unless an auth key stored by a previous run is still authorized.
+        """
+        if dc_id != await client.storage.dc_id():
+            test_mode = await client.storage.test_mode()
+            media_session = await start_stored_media_session(client, dc_id, test_mode)
+            if media_session is not None:
+                return media_session
+
+            auth_key = await create_auth_safe(
+                client, dc_id, test_mode
+            )
             
-            async with dc_lock:
-                # Double-check after acquiring lock (another request might have created it)
-                media_session = client.media_sessions.get(file_id.dc_id, None)
-                if media_session is not None:
-                    logging.debug(f"Media session created by another request for DC {file_id.dc_id}")
-                    return media_session
-                
-                if file_id.dc_id != await client.storage.dc_id():
-                    test_mode = await client.storage.test_mode()
-                    auth_key = await create_auth_safe(
-                        client, file_id.dc_id, test_mode
-                    )
-                    
-                    # Use safe session creation
-                    media_session = create_session_safe(
-                        client, file_id.dc_id, auth_key, test_mode, is_media=True
-                    )
-                    await media_session.start()
+            # Use safe session creation
+            media_session = create_session_safe(
+                client, dc_id, auth_key, test_mode, is_media=True
+            )
+            await media_session.start()
 
-                    for _ in range(6):
-                        try:
-                            exported_auth = await client.invoke(
-                                raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id)
-                            )
-                        except FloodWait as e:
-                            logging.warning(f"FloodWait for {e.value} seconds on auth.ExportAuthorization for DC {file_id.dc_id}")
-                            # Wait for the flood wait period
-                            await asyncio.sleep(e.value + 1)
-                            exported_auth = await client.invoke(
-                                raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id)
-                            )
+            with trace_span("auth_export"):
+                for _ in range(6):
+                    try:
+                        exported_auth = await client.invoke(
+                            raw.functions.auth.ExportAuthorization(dc_id=dc_id)
+                        )
+                    except FloodWait as e:
+                        # The export runs on the client's main connection: the whole client is quarantined,
+                        # and the error is raised so the caller uses another one
+                        logging.warning(f"FloodWait for {e.value} seconds on auth.ExportAuthorization for DC {dc_id}")
+                        record_flood_wait(self.index, e.value)
+                        await media_session.stop()
+                        raise
 
-                        try:
-                            await media_session.invoke(
-                                raw.functions.auth.ImportAuthorization(
-                                    id=exported_auth.id, bytes=exported_auth.bytes
-                                )
+                    try:
+                        await media_session.invoke(
+                            raw.functions.auth.ImportAuthorization(
+                                id=exported_auth.id, bytes=exported_auth.bytes
                             )
-                            break
-                        except AuthBytesInvalid:
-                            logging.debug(
-                                f"Invalid authorization bytes for DC {file_id.dc_id}"
-                            )
-                            continue
-                    else:
-                        await media_session.stop()
-                        raise AuthBytesInvalid
+                        )
+                        break
+                    except AuthBytesInvalid:
+                        logging.debug(
+                            f"Invalid authorization bytes for DC {dc_id}"
+                        )
+                        continue
                 else:
-                    # Use safe session creation
-                    media_session = create_session_safe(
-                        client,
-                        file_id.dc_id,
-                        await client.storage.auth_key(),
-                        await client.storage.test_mode(),
-                        is_media=True
-                    )
-                    await media_session.start()
-                logging.debug(f"Created media session for DC {file_id.dc_id}")
-                client.media_sessions[file_id.dc_id] = media_session
+                    await media_session.stop()
+                    raise AuthBytesInvalid
+
+            if auth_key_store:
+                await auth_key_store.set(client.name, dc_id, test_mode, auth_key)
         else:
-            logging.debug(f"Using cached media session for DC {file_id.dc_id}")
+            # Use safe session creation
+            media_session = create_session_safe(
+                client,
+                dc_id,
+                await client.storage.auth_key(),
+                await client.storage.test_mode(),
+                is_media=True
+            )
+            await media_session.start()
+        logging.debug(f"Created media session for DC {dc_id}")
         return media_session
 
-
     @staticmethod
+    @traced("location")
     async def get_location(file_id: FileId) -> Union[raw.types.InputPhotoFileLocation,
                                                      raw.types.InputDocumentFileLocation,
                                                      raw.types.InputPeerPhotoFileLocation,]:
@@ -405,6 +465,245 @@ class ByteStreamer:
             )
         return location
 
+    @staticmethod
+    async def fetch_chunk(
+        media_session: MediaSessionPool,
+        location,
+        offset: int,
+        chunk_size: int,
+    ) -> Union[bytes, None]:
+        """
+        Fetches a single chunk of the media file with upload.GetFile.
+        Returns None when Telegram doesn't answer with the file bytes (e.g. a CDN redirect).
+        """
+        r = await media_session.invoke(
+            raw.functions.upload.GetFile(
+                location=location, offset=offset, limit=chunk_size
+            ),
+            # Don't sleep through FLOOD_WAITs here, the stream can move to another client instead
+            sleep_threshold=0,
+        )
+        if isinstance(r, raw.types.upload.File):
+            return r.bytes
+        return None
+
+    @traced("getfile")
+    async def fetch_chunk_shared(
+        self,
+        media_session: MediaSessionPool,
+        location,
+        file_id: FileId,
+        offset: int,
+        chunk_size: int,
+    ) -> Union[bytes, None]:
+        """
+        Same as fetch_chunk, but concurrent readers of the same (media_id, offset, limit)
+        share a single in-flight GetFile request and its result, whichever client they stream with.
+        A FLOOD_WAIT only quarantines the client that made the request: readers that joined it
+        from another client make the request again on their own client.
+        """
+        key = (file_id.media_id, file_id.thumbnail_size, offset, chunk_size)
+        labels = (self.index, file_id.dc_id)
+        owner = False
+
+        async def fetch() -> Union[bytes, None]:
+            try:
+                return await self.fetch_chunk(media_session, location, offset, chunk_size)
+            except FloodWait as e:
+                record_flood_wait(self.index, e.value, file_id.dc_id)
+                raise
+
+        def start() -> Awaitable[Union[bytes, None]]:
+            # Only called for the reader that makes the request
+            nonlocal owner
+            owner = True
+            return fetch()
+
+        scheduler.request_started(self.index)
+        started_at = time.monotonic()
+        try:
+            try:
+                chunk = await chunk_requests.do(key, start)
+            except FloodWait:
+                if owner:
+                    raise
+                # The FLOOD_WAIT is the other client's, this one isn't rate limited
+                chunk = await fetch()
+        finally:
+            scheduler.request_finished(self.index)
+        getfile_seconds.observe(labels, time.monotonic() - started_at)
+        if chunk:
+            scheduler.record_bytes(self.index, len(chunk))
+            telegram_bytes.inc(labels, len(chunk))
+        return chunk
+
+    def iter_chunks(
+        self,
+        file_id: FileId,
+        offset: int,
+        part_count: int,
+        chunk_size: int,
+        connection: StreamConnection = None,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Returns an async generator of `part_count` raw chunks of the media file starting at `offset`.
+        Without a chunk cache for the file this is iter_remote_chunks itself, otherwise
+        iter_cached_chunks.
+        """
+        if chunk_cache is None or not chunk_cache.accepts(getattr(file_id, "unique_id", None), chunk_size):
+            return self.iter_remote_chunks(file_id, offset, part_count, chunk_size, connection)
+        return self.iter_cached_chunks(file_id, offset, part_count, chunk_size, connection)
+
+    async def iter_cached_chunks(
+        self,
+        file_id: FileId,
+        offset: int,
+        part_count: int,
+        chunk_size: int,
+        connection: StreamConnection = None,
+    ):
+        """
+        Yields `part_count` raw chunks of the media file starting at `offset`.
+        Chunks are served from the local chunk cache when possible, runs of missing chunks
+        are fetched from Telegram and fill the cache while they stream.
+        """
+        unique_id = getattr(file_id, "unique_id", None)
+        chunk_index = offset // chunk_size
+        last_index = chunk_index + part_count - 1
+        while chunk_index <= last_index:
+            if chunk_cache.contains(unique_id, chunk_index):
+                chunk = await chunk_cache.get(unique_id, chunk_index)
+                if chunk is not None:
+                    yield chunk
+                    chunk_index += 1
+                    continue
+
+            # Fetch the whole run of missing chunks with one read-ahead pipeline
+            run_end = chunk_index + 1
+            while run_end <= last_index and not chunk_cache.contains(unique_id, run_end):
+                run_end += 1
+            chunk_cache.misses += run_end - chunk_index
+            remote_chunks = self.iter_remote_chunks(
+                file_id, chunk_index * chunk_size, run_end - chunk_index, chunk_size, connection
+            )
+            try:
+                async for chunk in remote_chunks:
+                    chunk_cache.put(unique_id, chunk_index, chunk)
+                    yield chunk
+                    chunk_index += 1
+            finally:
+                await remote_chunks.aclose()
+            if chunk_index < run_end:
+                # Telegram ran out of bytes before the end of the run
+                return
+
+    async def iter_remote_chunks(
+        self,
+        file_id: FileId,
+        offset: int,
+        part_count: int,
+        chunk_size: int,
+        connection: StreamConnection = None,
+    ):
+        """
+        Yields `part_count` raw chunks of the media file starting at `offset` from Telegram.
+        Up to Var.READ_AHEAD_CHUNKS GetFile requests are kept in flight on the media session
+        (bounded by Var.READ_AHEAD_MAX_BYTES) so each chunk doesn't pay a full round trip to the DC.
+        With a `connection`, every request beyond the first one also needs room in the shared
+        read-ahead budget (Var.MAX_BUFFERED_BYTES).
+        """
+        media_session = await self.generate_media_session(self.client, file_id)
+        refreshed = refreshed_references.get((self.index, file_id.media_id, file_id.thumbnail_size))
+        if refreshed is not None:
+            # Another stream already refreshed the file reference of this file
+            file_id.file_reference, file_id.access_hash = refreshed
+        location = await self.get_location(file_id)
+
+        # Read-ahead window: never more than READ_AHEAD_MAX_BYTES buffered per stream
+        window = max(1, min(Var.READ_AHEAD_CHUNKS, Var.READ_AHEAD_MAX_BYTES // chunk_size, part_count))
+        pending = deque()
+        next_offset = offset
+        scheduled = 0
+        delivered = 0
+        refreshes = 0
+
+        def schedule_read_ahead():
+            nonlocal next_offset, scheduled
+            while len(pending) < window and scheduled < part_count:
+                if connection is not None and not connection.reserve(chunk_size, required=not pending):
+                    break
+                pending.append(asyncio.ensure_future(
+                    self.fetch_chunk_shared(media_session, location, file_id, next_offset, chunk_size)
+                ))
+                next_offset += chunk_size
+                scheduled += 1
+
+        def release(tasks: int):
+            if connection is not None:
+                connection.release(tasks * chunk_size)
+
+        try:
+            schedule_read_ahead()
+            while pending:
+                try:
+                    chunk = await pending.popleft()
+                except FileReferenceExpired:
+                    if refreshes >= 2:
+                        raise
+                    refreshes += 1
+                    # Drop the read-ahead (it uses the same expired reference) and resume at the current offset
+                    release(len(pending))
+                    cancel_pending(pending)
+                    pending.clear()
+                    await self.refresh_file_reference(file_id)
+                    location = await self.get_location(file_id)
+                    next_offset = offset + delivered * chunk_size
+                    scheduled = delivered
+                    schedule_read_ahead()
+                    continue
+                finally:
+                    release(1)
+                if not chunk:
+                    break
+                # Refill the window before handing the chunk over so requests stay in flight
+                schedule_read_ahead()
+                delivered += 1
+                yield chunk
+        finally:
+            release(len(pending))
+            cancel_pending(pending, connection)
+
+    async def refresh_file_reference(self, file_id: FileId) -> bytes:
+        """
+        Re-fetches the message of a file to get a fresh file_reference and updates `file_id` with it,
+        along with the access_hash of the fresh location. Concurrent streams of the same file share
+        one refresh, and the refreshed location is cached so new streams don't run into the expired one again.
+        """
+        # References are per client: each client refreshes its own through its own get_messages
+        key = (self.index, file_id.media_id, file_id.thumbnail_size)
+        unique_id = getattr(file_id, "unique_id", None)
+
+        async def refresh() -> Tuple[bytes, int]:
+            metadata = await lookup_metadata_by_unique_id(unique_id) if unique_id else None
+            if metadata is None:
+                logging.warning(f"Can't refresh the file reference of {unique_id}, its message is unknown")
+                raise FileReferenceExpired()
+            logging.info(
+                f"Refreshing file reference of {unique_id} from message "
+                f"{metadata['message_id']} in {metadata['channel_id']}"
+            )
+            try:
+                fresh_file_id = await get_file_ids(self.client, metadata["channel_id"], metadata["message_id"])
+            except FloodWait as e:
+                record_flood_wait(self.index, e.value)
+                raise
+            return fresh_file_id.file_reference, fresh_file_id.access_hash
+
+        refreshed = await reference_refreshes.do(key, refresh)
+        refreshed_references.set(key, refreshed)
+        file_id.file_reference, file_id.access_hash = refreshed
+        return file_id.file_reference
+
     async def yield_file(
         self,
         file_id: FileId,
@@ -414,63 +713,83 @@ class ByteStreamer:
         last_part_cut: int,
         part_count: int,
         chunk_size: int,
+        get_streamer: Callable[[int], "ByteStreamer"] = None,
+        connection: StreamConnection = None,
     ) -> Union[str, None]:
         """
         Custom generator that yields the bytes of the media file.
+        When the client hits a FLOOD_WAIT and `get_streamer` (client index -> ByteStreamer) is given,
+        the stream moves to the best healthy client and resumes at the current offset.
+        The read-ahead of the stream is accounted to `connection` when given.
         Modded from <https://github.com/eyaadh/megadlbot_oss/blob/master/mega/telegram/utils/custom_download.py#L20>
         Thanks to Eyaadh <https://github.com/eyaadh>
         """
-        client = self.client
         work_loads[index] += 1
+        labels = (index, file_id.dc_id)
+        active_streams.inc(labels)
         logging.debug(f"Starting to yielding file with client {index}.")
-        media_session = await self.generate_media_session(client, file_id)
 
         current_part = 1
-        location = await self.get_location(file_id)
+        bytes_streamed = 0
+        reroutes = 0
+        started_at = time.monotonic()
+        chunks = self.iter_chunks(file_id, offset, part_count, chunk_size, connection)
 
         try:
-            r = await media_session.invoke(
-                raw.functions.upload.GetFile(
-                    location=location, offset=offset, limit=chunk_size
-                ),
-            )
-            if isinstance(r, raw.types.upload.File):
-                while True:
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    elif part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
+            while True:
+                try:
+                    async for chunk in chunks:
+                        chunk = cut_chunk(chunk, current_part, part_count, first_part_cut, last_part_cut)
+                        bytes_streamed += len(chunk)
+                        streamed_bytes.inc(labels, len(chunk))
                         yield chunk
 
-                    current_part += 1
-                    offset += chunk_size
-
-                    if current_part > part_count:
-                        break
-
-                    r = await media_session.invoke(
-                        raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=chunk_size
-                        ),
+                        current_part += 1
+                        if current_part > part_count:
+                            break
+                    break
+                except FloodWait as e:
+                    await chunks.aclose()
+                    reroutes += 1
+                    if reroutes > len(work_loads):
+                        raise
+                    candidates = scheduler.rank(file_id.dc_id, exclude={index}) if get_streamer else []
+                    if candidates and scheduler.is_available(candidates[0], file_id.dc_id):
+                        logging.warning(
+                            f"Client {index} hit a FLOOD_WAIT of {e.value}s, moving the stream "
+                            f"to client {candidates[0]} at part {current_part}"
+                        )
+                        work_loads[index] -= 1
+                        active_streams.dec(labels)
+                        index = candidates[0]
+                        work_loads[index] += 1
+                        labels = (index, file_id.dc_id)
+                        active_streams.inc(labels)
+                        streamer = get_streamer(index)
+                    elif e.value <= Var.MAX_FLOOD_WAIT_SLEEP:
+                        logging.warning(f"No client can take over the stream, waiting {e.value}s on client {index}")
+                        with trace_span("flood_wait"):
+                            await asyncio.sleep(e.value)
+                        streamer = get_streamer(index) if get_streamer else self
+                    else:
+                        raise
+                    done = current_part - 1
+                    chunks = streamer.iter_chunks(
+                        file_id, offset + done * chunk_size, part_count - done, chunk_size, connection
                     )
         except (TimeoutError, AttributeError):
             pass
+        except Exception as e:
+            log_stream_error(e)
+            raise
         finally:
-            logging.debug("Finished yielding file with {current_part} parts.")
+            # Decrement before awaiting anything, the task may be cancelled again while closing
             work_loads[index] -= 1
-
-    
-    async def clean_cache(self) -> None:
-        """
-        function to clean the cache to reduce memory usage
-        """
-        while True:
-            await asyncio.sleep(self.clean_timer)
-            self.cached_file_ids.clear()
-            logging.debug("Cleaned the cache")
+            active_streams.dec(labels)
+            await chunks.aclose()
+            elapsed = time.monotonic() - started_at
+            throughput = bytes_streamed / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+            logging.debug(
+                f"Finished yielding file with {current_part - 1} parts on client {index}: "
+                f"{bytes_streamed} bytes in {elapsed:.2f}s ({throughput:.2f} MiB/s)"
+            )
@@ -1,9 +1,10 @@
 from pyrogram import Client, raw, utils
 from typing import Any, Optional
 from pyrogram.types import Message
-from pyrogram.file_id import FileId
+from pyrogram.file_id import FileId, FileUniqueId, FileUniqueType
 from pyrogram.raw.types.messages import Messages
 from WebStreamer.server.exceptions import FileNotFound
+from .metadata_cache import remember_metadata, metadata_from_file_id
 import logging
 
 
@@ -12,6 +13,10 @@ async def parse_file_id(message: "Message") -> Optional[FileId]:
     if media:
         return FileId.decode(media.file_id)
 
+def file_unique_id(file_id: FileId) -> str:
+    """The file_unique_id Telegram gives the media of a file_id (Pyrogram encodes all message media as documents)"""
+    return FileUniqueId(file_unique_type=FileUniqueType.DOCUMENT, media_id=file_id.media_id).encode()
+
 async def parse_file_unique_id(message: "Messages") -> Optional[str]:
     media = get_media_from_message(message)
     if media:
@@ -119,6 +124,8 @@ async def get_file_ids(client: Client, chat_id: int, message_id: int) -> Optiona
     setattr(file_id, "file_name", getattr(media, "file_name", ""))
     setattr(file_id, "unique_id", file_unique_id)
     setattr(file_id, "file_id", getattr(media, "file_id", ""))  # Store the actual file_id string
+    # Share with the other clients and the persistent index
+    remember_metadata(metadata_from_file_id(file_id, chat_id, message_id))
     return file_id
 
 def get_media_from_message(message: "Message") -> Any:
@@ -0,0 +1,43 @@
+# HTTP caching of /dl responses: Cache-Control policies per mime type and If-None-Match
+from fnmatch import fnmatch
+from typing import List, Optional, Tuple
+from WebStreamer.vars import Var
+
+
+def parse_cache_control_rules(value: str) -> List[Tuple[str, str]]:
+    """
+    Parses "mime pattern=Cache-Control value" rules separated by ";" (e.g.
+    "video/*=public, max-age=2592000, immutable;*=public, max-age=86400").
+    """
+    rules = []
+    for rule in value.split(";"):
+        pattern, separator, cache_control = rule.partition("=")
+        if separator and pattern.strip() and cache_control.strip():
+            rules.append((pattern.strip().lower(), cache_control.strip()))
+    return rules
+
+
+cache_control_rules = parse_cache_control_rules(Var.CACHE_CONTROL)
+
+
+def cache_control_for(mime_type: str) -> Optional[str]:
+    """Returns the Cache-Control value of the first rule matching the mime type, if any"""
+    mime_type = (mime_type or "").lower()
+    for pattern, cache_control in cache_control_rules:
+        if fnmatch(mime_type, pattern):
+            return cache_control
+    return None
+
+
+def none_match(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    Whether an If-None-Match header matches the ETag of the file, so a 304 can be sent.
+    Uses the weak comparison of RFC 7232: W/"x" matches "x".
+    """
+    if not if_none_match or etag is None:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
@@ -0,0 +1,94 @@
+# Process-wide file metadata shared by every client
+from typing import Dict, Optional
+from pyrogram.file_id import FileId
+from WebStreamer.vars import Var
+from .lru_cache import LRUCache
+from .metadata_index import metadata_index
+
+
+class MetadataStore:
+    def __init__(self, max_entries: int, ttl: float):
+        """File metadata that doesn't depend on the client which resolved it.
+        attributes:
+            by_message: metadata dicts keyed by (channel_id, message_id).
+            by_unique_id: (channel_id, message_id) keyed by unique_file_id.
+
+        Each metadata dict holds unique_id, file_id, file_name, file_size, mime_type, dc_id,
+        channel_id and message_id. Client specific pieces (access hash, file_reference) live in
+        the decoded FileId objects each ByteStreamer caches for itself.
+        """
+        self.by_message = LRUCache(max_entries, ttl)
+        self.by_unique_id = LRUCache(max_entries, ttl)
+
+    def get(self, channel_id: int, message_id: int) -> Optional[Dict]:
+        return self.by_message.get((channel_id, message_id))
+
+    def get_by_unique_id(self, unique_id: str) -> Optional[Dict]:
+        location = self.by_unique_id.get(unique_id)
+        if location is None:
+            return None
+        return self.by_message.get(location)
+
+    def put(self, metadata: Dict) -> None:
+        location = (metadata["channel_id"], metadata["message_id"])
+        self.by_message.set(location, metadata)
+        if metadata.get("unique_id"):
+            self.by_unique_id.set(metadata["unique_id"], location)
+
+    def stats(self) -> Dict[str, int]:
+        return self.by_message.stats()
+
+
+def metadata_from_file_id(file_id: FileId, channel_id: int, message_id: int) -> Dict:
+    """Extracts the shareable metadata from a FileId generated by get_file_ids"""
+    return {
+        "unique_id": getattr(file_id, "unique_id", ""),
+        "file_id": getattr(file_id, "file_id", ""),
+        "file_name": getattr(file_id, "file_name", ""),
+        "file_size": getattr(file_id, "file_size", 0),
+        "mime_type": getattr(file_id, "mime_type", ""),
+        "dc_id": file_id.dc_id,
+        "channel_id": channel_id,
+        "message_id": message_id,
+    }
+
+
+def file_id_from_metadata(metadata: Dict) -> FileId:
+    """Decodes the file_id of shared metadata and attaches the same attributes as get_file_ids"""
+    file_id = FileId.decode(metadata["file_id"])
+    setattr(file_id, "file_size", metadata["file_size"])
+    setattr(file_id, "mime_type", metadata["mime_type"])
+    setattr(file_id, "file_name", metadata["file_name"])
+    setattr(file_id, "unique_id", metadata["unique_id"])
+    setattr(file_id, "file_id", metadata["file_id"])
+    return file_id
+
+
+file_metadata = MetadataStore(Var.METADATA_CACHE_MAX_ENTRIES, Var.METADATA_CACHE_TTL)
+
+
+def remember_metadata(metadata: Dict) -> None:
+    """Stores metadata in the shared cache and queues it for the persistent index (if enabled)"""
+    file_metadata.put(metadata)
+    if metadata_index:
+        metadata_index.add(metadata)
+
+
+async def lookup_metadata(channel_id: int, message_id: int) -> Optional[Dict]:
+    """Looks up metadata in the shared cache first, then in the persistent index"""
+    metadata = file_metadata.get(channel_id, message_id)
+    if metadata is None and metadata_index:
+        metadata = await metadata_index.get(channel_id, message_id)
+        if metadata is not None:
+            file_metadata.put(metadata)
+    return metadata
+
+
+async def lookup_metadata_by_unique_id(unique_id: str) -> Optional[Dict]:
+    """Same as lookup_metadata, by unique_file_id"""
+    metadata = file_metadata.get_by_unique_id(unique_id)
+    if metadata is None and metadata_index:
+        metadata = await metadata_index.get_by_unique_id(unique_id)
+        if metadata is not None:
+            file_metadata.put(metadata)
+    return metadata
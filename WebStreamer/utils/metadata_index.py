@@ -0,0 +1,127 @@
+# Optional persistent metadata index (SQLite) so cold starts don't need Telegram round trips
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional
+from WebStreamer.vars import Var
+
+COLUMNS = ("channel_id", "message_id", "unique_id", "file_id", "file_name", "file_size", "mime_type", "dc_id")
+
+
+class MetadataIndex:
+    def __init__(self, path: str, batch_size: int, flush_interval: float):
+        """SQLite (WAL mode) table mapping (channel_id, message_id) and unique_file_id to file metadata.
+        attributes:
+            path: the database file.
+            batch_size: number of queued rows that triggers a write right away.
+            flush_interval: seconds between background writes of the queued rows.
+
+        Writes are queued by `add` and written in batches from the default executor,
+        so the bot's update handlers never wait for the disk.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending: Deque[tuple] = deque()
+        self.max_pending = batch_size * 50
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._open)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+        logging.info(f"Metadata index opened at {self.path}")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._conn:
+            await self.flush()
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    def add(self, metadata: Dict) -> None:
+        """Queues metadata for the next batched write"""
+        if len(self.pending) >= self.max_pending:
+            logging.warning("Metadata index write queue is full, dropping oldest entry")
+            self.pending.popleft()
+        self.pending.append(tuple(metadata.get(column) for column in COLUMNS))
+        if self._wakeup and len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        if not self.pending or not self._conn:
+            return
+        rows, self.pending = self.pending, deque()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, rows)
+            logging.debug(f"Wrote {len(rows)} entries to the metadata index")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to write {len(rows)} entries to the metadata index: {e}")
+
+    async def get(self, channel_id: int, message_id: int) -> Optional[Dict]:
+        return await self._query("channel_id = ? AND message_id = ?", (channel_id, message_id))
+
+    async def get_by_unique_id(self, unique_id: str) -> Optional[Dict]:
+        return await self._query("unique_id = ?", (unique_id,))
+
+    async def _query(self, where: str, params: tuple) -> Optional[Dict]:
+        if not self._conn:
+            return None
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self._select, where, params)
+        except sqlite3.Error as e:
+            logging.error(f"Metadata index lookup failed: {e}")
+            return None
+
+    async def _writer(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _open(self) -> None:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, unique_id TEXT, file_id TEXT, "
+            "file_name TEXT, file_size INTEGER, mime_type TEXT, dc_id INTEGER, "
+            "PRIMARY KEY (channel_id, message_id))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS files_unique_id ON files (unique_id)")
+        conn.commit()
+        self._conn = conn
+
+    def _write(self, rows: Iterable[tuple]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows,
+            )
+            self._conn.commit()
+
+    def _select(self, where: str, params: tuple) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM files WHERE {where} LIMIT 1", params
+            ).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+
+metadata_index = (
+    MetadataIndex(Var.METADATA_DB, Var.METADATA_DB_BATCH_SIZE, Var.METADATA_DB_FLUSH_INTERVAL)
+    if Var.METADATA_DB else None
+)
@@ -0,0 +1,201 @@
+# Prometheus metrics of the streaming hot path, rendered in the text exposition format
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Buckets (seconds) of request latencies: GetFile, time to first byte, /link resolution
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Buckets (seconds) of FLOOD_WAIT durations
+FLOOD_WAIT_BUCKETS = (1, 5, 10, 30, 60, 300, 900, 3600)
+
+Labels = Tuple
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def format_labels(label_names: Sequence[str], labels: Labels) -> str:
+    if not label_names:
+        return ""
+    pairs = []
+    for name, value in zip(label_names, labels):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        """
+        A counter per label set. Label values are passed as a tuple in the order of `label_names`,
+        updating one is a dict lookup so it can run for every chunk.
+        attributes:
+            values: value by label tuple.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Labels, float]]:
+        for labels, value in self.values.items():
+            yield self.name, self.label_names, labels, value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        values = self.values
+        values[labels] = values.get(labels, 0) - amount
+
+    def set(self, labels: Labels, value: float) -> None:
+        self.values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        """
+        A histogram per label set with fixed buckets.
+        attributes:
+            buckets: upper bounds of the buckets, +Inf is added when rendering.
+            values: per label tuple, the count of each bucket (not cumulative), the +Inf count and the sum.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Labels, List[float]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Labels, float]]:
+        bucket_label_names = self.label_names + ("le",)
+        for labels, entry in self.values.items():
+            count = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), entry):
+                count += bucket_count
+                yield self.name + "_bucket", bucket_label_names, labels + (format_value(bound),), count
+            yield self.name + "_sum", self.label_names, labels, entry[-1]
+            yield self.name + "_count", self.label_names, labels, count
+
+
+class CollectedMetric:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        label_names: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Labels, float]]],
+    ):
+        """A counter or gauge read from existing statistics when the metrics are scraped"""
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.collect = collect
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Labels, float]]:
+        for labels, value in self.collect():
+            yield self.name, self.label_names, labels, value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        All metrics exposed on /metrics.
+        attributes:
+            metrics: metrics by name, rendered in registration order.
+        """
+        self.metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(
+        self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def collect(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        label_names: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Labels, float]]],
+    ) -> CollectedMetric:
+        return self.register(CollectedMetric(name, documentation, kind, label_names, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_names, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(label_names, labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# Updated by the streaming code, labels are (client index, DC id)
+streamed_bytes = metrics.counter(
+    "webstreamer_streamed_bytes_total", "Bytes of file streams yielded to HTTP responses", ("client", "dc")
+)
+active_streams = metrics.gauge(
+    "webstreamer_active_streams", "File streams currently being yielded", ("client", "dc")
+)
+telegram_bytes = metrics.counter(
+    "webstreamer_telegram_bytes_total", "Bytes fetched from Telegram with upload.GetFile", ("client", "dc")
+)
+getfile_seconds = metrics.histogram(
+    "webstreamer_getfile_seconds", "Latency of upload.GetFile requests, shared requests included", ("client", "dc")
+)
+time_to_first_byte = metrics.histogram(
+    "webstreamer_time_to_first_byte_seconds", "Time from a /dl request to its first body bytes", ("client", "dc")
+)
+media_sessions_created = metrics.counter(
+    "webstreamer_media_sessions_created_total",
+    "Media sessions started, 'primary' ones need an auth export unless the key was stored",
+    ("client", "dc", "kind"),
+)
+flood_waits = metrics.counter(
+    "webstreamer_flood_waits_total", "FLOOD_WAIT errors received from Telegram", ("client", "dc")
+)
+flood_wait_seconds = metrics.histogram(
+    "webstreamer_flood_wait_seconds", "Durations of the FLOOD_WAIT errors", ("client", "dc"), FLOOD_WAIT_BUCKETS
+)
+link_seconds = metrics.histogram(
+    "webstreamer_link_seconds", "Time to resolve a /link request into a download URL", ("status",)
+)
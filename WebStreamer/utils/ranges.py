@@ -0,0 +1,166 @@
+# HTTP Range requests (RFC 7233): parsing, If-Range and multipart/byteranges bodies
+import re
+import secrets
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+# Ranges closer than this are merged into one range, a new part costs about as many bytes of headers
+COALESCE_GAP = 80
+# More ranges than this (after merging) are rejected instead of served part by part
+MAX_RANGES = 16
+
+RANGE_SPEC = re.compile(r"^(\d*)-(\d*)$")
+SAFE_ETAG = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlaps the file (answered with 416)"""
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parses a Range header into sorted, merged (first, last) byte ranges (inclusive) of a file of `size` bytes.
+    Returns None when the header has to be ignored (another unit or invalid syntax), so the whole
+    file is served. Raises RangeNotSatisfiable when no range overlaps the file or there are too many.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        spec = spec.strip()
+        if not spec:
+            continue
+        match = RANGE_SPEC.match(spec)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first:
+            first = int(first)
+            if last and int(last) < first:
+                return None
+            if first >= size:
+                continue
+            ranges.append((first, min(int(last), size - 1) if last else size - 1))
+        elif last:
+            # Suffix range: the last `last` bytes
+            suffix = int(last)
+            if suffix == 0 or size == 0:
+                continue
+            ranges.append((max(size - suffix, 0), size - 1))
+        else:
+            return None
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    ranges = merge_ranges(ranges, COALESCE_GAP)
+    if len(ranges) > MAX_RANGES:
+        raise RangeNotSatisfiable()
+    return ranges
+
+
+def merge_ranges(ranges: List[Tuple[int, int]], gap: int) -> List[Tuple[int, int]]:
+    """Sorts ranges and merges the ones that overlap or are less than `gap` bytes apart"""
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first - merged[-1][1] - 1 < gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def file_etag(unique_id: str) -> Optional[str]:
+    """Strong ETag of a file: the bytes behind a file_unique_id never change"""
+    if unique_id and SAFE_ETAG.match(unique_id):
+        return f'"{unique_id}"'
+    return None
+
+
+def if_range_matches(if_range: Optional[str], etag: Optional[str]) -> bool:
+    """
+    Whether the Range header applies under an If-Range precondition. Only a strong ETag can
+    match: files have no Last-Modified, so a date (or a weak ETag) means the full file is sent.
+    """
+    if if_range is None:
+        return True
+    return etag is not None and if_range.strip() == etag
+
+
+class MultipartByteranges:
+    def __init__(self, ranges: List[Tuple[int, int]], content_type: str, size: int):
+        """
+        Framing of a multipart/byteranges body with one part per range.
+        attributes:
+            boundary: the multipart boundary.
+            content_type: the Content-Type header of the response.
+            content_length: the exact length of the body.
+        """
+        self.boundary = secrets.token_hex(16)
+        self.content_type = f"multipart/byteranges; boundary={self.boundary}"
+        self.headers = [
+            (
+                ("\r\n" if i else "")
+                + f"--{self.boundary}\r\n"
+                + f"Content-Type: {content_type}\r\n"
+                + f"Content-Range: bytes {first}-{last}/{size}\r\n\r\n"
+            ).encode()
+            for i, (first, last) in enumerate(ranges)
+        ]
+        self.closing = f"\r\n--{self.boundary}--\r\n".encode()
+        self.content_length = (
+            sum(len(header) for header in self.headers)
+            + sum(last - first + 1 for first, last in ranges)
+            + len(self.closing)
+        )
+
+    def part_header(self, index: int) -> bytes:
+        return self.headers[index]
+
+
+def group_ranges(
+    ranges: List[Tuple[int, int]], gap: int
+) -> List[Tuple[int, int, List[Tuple[int, int, int]]]]:
+    """
+    Groups sorted ranges that are less than `gap` bytes apart, so each group is fetched as one
+    stream of chunks. Returns (first, last, [(range index, first, last), ...]) per group.
+    """
+    groups = []
+    for index, (first, last) in enumerate(ranges):
+        if groups and first - groups[-1][1] - 1 < gap:
+            group = groups[-1]
+            groups[-1] = (group[0], last, group[2] + [(index, first, last)])
+        else:
+            groups.append((first, last, [(index, first, last)]))
+    return groups
+
+
+async def slice_ranges(
+    streams: List[AsyncIterator[Union[bytes, memoryview]]],
+    position: int,
+    ranges: List[Tuple[int, int, int]],
+):
+    """
+    Yields (range index, bytes) for `ranges` [(range index, first, last), ...] out of `streams`,
+    which together produce the contiguous bytes of the file from `position` on. The bytes
+    between the ranges are skipped and the slices are memoryviews of the chunks.
+    """
+    current = 0
+    for stream in streams:
+        async for chunk in stream:
+            chunk_end = position + len(chunk)
+            while current < len(ranges):
+                index, first, last = ranges[current]
+                if first >= chunk_end:
+                    break
+                start, stop = max(first, position), min(last + 1, chunk_end)
+                if start == position and stop == chunk_end:
+                    yield index, chunk
+                elif start < stop:
+                    yield index, memoryview(chunk)[start - position:stop - position]
+                if last + 1 > chunk_end:
+                    break
+                current += 1
+            position = chunk_end
+            if current == len(ranges):
+                return
@@ -0,0 +1,122 @@
+# Pool of MTProto media sessions to one DC for one client
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+from pyrogram.session import Session
+
+# Consecutive connection failures after which a pooled session is dropped
+MAX_SESSION_FAILURES = 3
+
+
+class MediaSessionPool:
+    def __init__(
+        self,
+        dc_id: int,
+        primary: Session,
+        create_session: Callable[[], Awaitable[Session]],
+        max_size: int,
+        grow_threshold: int,
+        idle_timeout: float,
+    ):
+        """Several media sessions to the same DC, used like a single Session through `invoke`.
+        attributes:
+            dc_id: the DC the sessions are connected to.
+            primary: the client's own media session (client.media_sessions[dc_id]). It is never
+                closed by the pool, pyrogram reconnects it by itself.
+            sessions: the pooled sessions, the first one is `primary`.
+            create_session: coroutine function returning a new started session. It reuses the
+                auth key of the primary session, so auth export/import only happens once.
+            max_size: maximum number of sessions.
+            grow_threshold: in-flight requests on the least loaded session before the pool grows.
+            idle_timeout: seconds an extra session may stay idle before it is closed.
+        """
+        self.dc_id = dc_id
+        self.primary = primary
+        self.sessions: List[Session] = [primary]
+        self.create_session = create_session
+        self.max_size = max(1, max_size)
+        self.grow_threshold = grow_threshold
+        self.idle_timeout = idle_timeout
+        self.in_flight: Dict[Session, int] = {primary: 0}
+        self.last_used: Dict[Session, float] = {primary: time.monotonic()}
+        self.failures: Dict[Session, int] = {primary: 0}
+        self.growing: Optional[asyncio.Task] = None
+
+    def pick(self) -> Session:
+        """Returns the least loaded healthy session, growing the pool in the background when busy"""
+        healthy = [s for s in self.sessions if s.is_connected.is_set()] or self.sessions
+        session = min(healthy, key=self.in_flight.get)
+        if (
+            self.in_flight[session] >= self.grow_threshold
+            and len(self.sessions) < self.max_size
+            and self.growing is None
+        ):
+            self.growing = asyncio.ensure_future(self.grow())
+        return session
+
+    async def invoke(self, query, *args, **kwargs):
+        session = self.pick()
+        self.in_flight[session] += 1
+        try:
+            result = await session.invoke(query, *args, **kwargs)
+        except (OSError, TimeoutError):
+            # Health check: drop sessions whose connection keeps failing
+            if session in self.failures:
+                self.failures[session] += 1
+                if self.failures[session] >= MAX_SESSION_FAILURES:
+                    self.discard(session)
+            raise
+        finally:
+            self.release(session)
+        if session in self.failures:
+            self.failures[session] = 0
+        return result
+
+    async def grow(self) -> None:
+        try:
+            session = await self.create_session()
+        except Exception as e:
+            logging.warning(f"Failed to add a media session to the pool for DC {self.dc_id}: {e}")
+        else:
+            self.sessions.append(session)
+            self.in_flight[session] = 0
+            self.last_used[session] = time.monotonic()
+            self.failures[session] = 0
+            logging.debug(f"Media session pool for DC {self.dc_id} grew to {len(self.sessions)} sessions")
+        finally:
+            self.growing = None
+
+    def release(self, session: Session) -> None:
+        if session in self.in_flight:
+            self.in_flight[session] -= 1
+            self.last_used[session] = time.monotonic()
+        self.shrink()
+
+    def shrink(self) -> None:
+        """Closes extra sessions that have been idle for longer than idle_timeout"""
+        now = time.monotonic()
+        for session in self.sessions[1:]:
+            if self.in_flight[session] == 0 and now - self.last_used[session] > self.idle_timeout:
+                logging.debug(f"Closing idle media session for DC {self.dc_id}")
+                self.discard(session)
+
+    def discard(self, session: Session) -> None:
+        """Removes an unhealthy or idle extra session from the pool (the primary one is always kept)"""
+        if session is self.primary or session not in self.in_flight:
+            return
+        self.sessions.remove(session)
+        del self.in_flight[session], self.last_used[session], self.failures[session]
+        asyncio.ensure_future(self.stop_session(session))
+
+    async def stop_session(self, session: Session) -> None:
+        try:
+            await session.stop()
+        except Exception as e:
+            logging.debug(f"Error while stopping pooled media session for DC {self.dc_id}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.sessions),
+            "in_flight": sum(self.in_flight.values()),
+        }
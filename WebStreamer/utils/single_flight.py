@@ -0,0 +1,55 @@
+# Request coalescing - concurrent callers of the same key share one in-flight call
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self, max_keys: int):
+        """Shares one in-flight call and its result between concurrent callers of the same key.
+        attributes:
+            max_keys: maximum number of shared calls in flight, callers beyond that run their own call.
+            calls: the in-flight calls as key -> [task, waiter count].
+
+        Results are only held while a call is in flight and dropped as soon as it finishes,
+        so memory is bounded by max_keys results. A call is cancelled once every waiter is gone.
+        """
+        self.max_keys = max_keys
+        self.calls: Dict[Hashable, list] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.bypassed = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        call = self.calls.get(key)
+        if call is None:
+            if len(self.calls) >= self.max_keys:
+                self.bypassed += 1
+                return await factory()
+            call = [asyncio.ensure_future(factory()), 0]
+            self.calls[key] = call
+            call[0].add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        call[1] += 1
+        try:
+            # Shielded so one impatient waiter doesn't cancel the call for everyone else
+            return await asyncio.shield(call[0])
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not call[0].done():
+                call[0].cancel()
+                self._forget(key, call)
+
+    def _forget(self, key: Hashable, call: list) -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self.calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+        }
@@ -0,0 +1,104 @@
+# Memory held for downstream connections: read-ahead chunks and transport write buffers
+import logging
+from typing import Dict, List, Union
+from WebStreamer.vars import Var
+
+
+class StreamConnection:
+    def __init__(self, buffers: "StreamBuffers", transport, peer: str):
+        """
+        Buffered bytes of a single downstream connection.
+        attributes:
+            transport: the asyncio transport of the connection (its write buffer is counted too).
+            peer: the remote address, for logging.
+            read_ahead_bytes: bytes reserved by GetFile requests in flight or fetched but not yet written.
+        """
+        self.buffers = buffers
+        self.transport = transport
+        self.peer = peer
+        self.read_ahead_bytes = 0
+
+    @property
+    def write_buffer_bytes(self) -> int:
+        if self.transport is None or self.transport.is_closing():
+            return 0
+        return self.transport.get_write_buffer_size()
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self.read_ahead_bytes + self.write_buffer_bytes
+
+    def reserve(self, size: int, required: bool = False) -> bool:
+        """
+        Reserves memory for a read-ahead chunk. Returns False when the reservation would take
+        all connections over Var.MAX_BUFFERED_BYTES; `required` reservations (the one request
+        a stream needs to make progress) are always granted.
+        """
+        buffers = self.buffers
+        if not required and buffers.read_ahead_bytes + size > buffers.max_bytes:
+            buffers.throttled += 1
+            return False
+        self.read_ahead_bytes += size
+        buffers.read_ahead_bytes += size
+        return True
+
+    def release(self, size: int) -> None:
+        self.read_ahead_bytes -= size
+        self.buffers.read_ahead_bytes -= size
+
+    def discard(self, data: Union[bytes, List[bytes], None]) -> None:
+        """Counts a fetched chunk (or stripe of chunks) that will never be written to the client"""
+        chunks = data if isinstance(data, list) else [data]
+        self.buffers.dropped_read_ahead_bytes += sum(len(chunk) for chunk in chunks if chunk)
+
+
+class StreamBuffers:
+    def __init__(self, max_bytes: int):
+        """
+        Memory accounting of all streaming connections.
+        attributes:
+            max_bytes: read-ahead budget shared by all connections.
+            read_ahead_bytes: bytes currently reserved by read-ahead.
+            throttled: read-ahead requests held back because the budget was used up.
+            disconnects: connections closed by the client before the whole body was written.
+            undelivered_bytes: body bytes handed to response.write when their client went away.
+            dropped_read_ahead_bytes: read-ahead bytes fetched from Telegram but dropped because their stream ended first.
+            cancelled_requests: GetFile requests cancelled because their stream ended first.
+        """
+        self.max_bytes = max_bytes
+        self.read_ahead_bytes = 0
+        self.throttled = 0
+        self.disconnects = 0
+        self.undelivered_bytes = 0
+        self.dropped_read_ahead_bytes = 0
+        self.cancelled_requests = 0
+        self.connections = set()
+
+    def open(self, transport, peer: str) -> StreamConnection:
+        connection = StreamConnection(self, transport, peer)
+        self.connections.add(connection)
+        return connection
+
+    def close(self, connection: StreamConnection) -> None:
+        if connection.read_ahead_bytes:
+            logging.debug(f"Releasing {connection.read_ahead_bytes} read-ahead bytes left by {connection.peer}")
+            connection.release(connection.read_ahead_bytes)
+        self.connections.discard(connection)
+
+    def stats(self) -> Dict[str, int]:
+        buffered = [connection.buffered_bytes for connection in self.connections]
+        return {
+            "connections": len(self.connections),
+            "read_ahead_bytes": self.read_ahead_bytes,
+            "write_buffer_bytes": sum(buffered) - self.read_ahead_bytes,
+            "max_connection_bytes": max(buffered, default=0),
+            "max_bytes": self.max_bytes,
+            "throttled": self.throttled,
+            "disconnects": self.disconnects,
+            "undelivered_bytes": self.undelivered_bytes,
+            "dropped_read_ahead_bytes": self.dropped_read_ahead_bytes,
+            "cancelled_requests": self.cancelled_requests,
+        }
+
+
+stream_buffers = StreamBuffers(Var.MAX_BUFFERED_BYTES)
@@ -0,0 +1,155 @@
+# Striped downloads - one large file fetched through several clients at once
+import asyncio
+import logging
+from collections import deque
+from typing import List, Tuple
+from pyrogram.errors import FloodWait
+from pyrogram.file_id import FileId
+from WebStreamer.bot import work_loads
+from WebStreamer.bot.scheduler import scheduler
+from WebStreamer.vars import Var
+from .chunking import cut_chunk
+from .stream_buffers import StreamConnection
+from .metrics import active_streams, streamed_bytes
+from .tracing import trace_span
+from .custom_dl import ByteStreamer, cancel_pending, log_stream_error
+
+
+async def fetch_stripe(
+    streamers: List[Tuple[int, ByteStreamer]],
+    failed: set,
+    preferred: int,
+    file_id: FileId,
+    offset: int,
+    part_count: int,
+    chunk_size: int,
+    connection: StreamConnection = None,
+) -> List[bytes]:
+    """
+    Fetches `part_count` chunks starting at `offset` with the preferred client.
+    If a client fails partway through (or is quarantined after a FLOOD_WAIT), the remaining
+    chunks of the stripe are fetched with the next healthy client. A client that failed with
+    another error is left out for the rest of the request (`failed`), a flooded one only while
+    it is quarantined. When every client left is quarantined, waits for the first one to come
+    back (up to Var.MAX_FLOOD_WAIT_SLEEP), like yield_file does. Raises the last error once
+    every client has failed.
+    """
+    chunks = []
+    last_error = None
+    reroutes = 0
+    while True:
+        candidates = [streamers[(preferred + attempt) % len(streamers)] for attempt in range(len(streamers))]
+        candidates = [(index, streamer) for index, streamer in candidates if index not in failed]
+        if not candidates:
+            raise last_error or RuntimeError("No healthy client left to fetch the stripe")
+        available = [(index, streamer) for index, streamer in candidates if scheduler.is_available(index, file_id.dc_id)]
+        if not available:
+            delay = min(scheduler.available_at(index, file_id.dc_id) for index, _ in candidates) - scheduler.clock()
+            if delay > Var.MAX_FLOOD_WAIT_SLEEP:
+                raise last_error or RuntimeError("Every client is quarantined for too long to fetch the stripe")
+            logging.warning(f"Every client is quarantined, waiting {delay:.1f}s to fetch the stripe at offset {offset}")
+            with trace_span("flood_wait"):
+                await asyncio.sleep(max(0.0, delay))
+            continue
+
+        index, streamer = available[0]
+        work_loads[index] += 1
+        try:
+            async for chunk in streamer.iter_chunks(
+                file_id, offset + len(chunks) * chunk_size, part_count - len(chunks), chunk_size, connection
+            ):
+                chunks.append(chunk)
+            return chunks
+        except asyncio.CancelledError:
+            if connection is not None:
+                connection.discard(chunks)
+            raise
+        except FloodWait as e:
+            # The client is quarantined by the scheduler until the FLOOD_WAIT ends, it isn't broken
+            last_error = e
+            reroutes += 1
+            if reroutes > len(work_loads):
+                raise
+            logging.warning(
+                f"Client {index} hit a FLOOD_WAIT of {e.value}s while fetching stripe at offset {offset}, "
+                f"rerouting {part_count - len(chunks)} remaining parts"
+            )
+        except Exception as e:
+            last_error = e
+            failed.add(index)
+            logging.warning(
+                f"Client {index} failed while fetching stripe at offset {offset}, "
+                f"rerouting {part_count - len(chunks)} remaining parts: {e}"
+            )
+        finally:
+            work_loads[index] -= 1
+
+
+async def yield_file_striped(
+    streamers: List[Tuple[int, ByteStreamer]],
+    file_id: FileId,
+    offset: int,
+    first_part_cut: int,
+    last_part_cut: int,
+    part_count: int,
+    chunk_size: int,
+    stripe_chunks: int,
+    max_stripes: int,
+    connection: StreamConnection = None,
+):
+    """
+    Same contract as ByteStreamer.yield_file, but the range is split into chunk-aligned
+    stripes of `stripe_chunks` parts which are fetched concurrently (at most `max_stripes`
+    at a time) through the given (index, ByteStreamer) pairs and yielded back in order.
+    """
+    stripe_count = -(-part_count // stripe_chunks)
+    max_stripes = max(1, min(max_stripes, stripe_count))
+    failed = set()
+    pending = deque()
+    next_stripe = 0
+    current_part = 1
+    # The stripes come from several clients, the Telegram side is counted per client by fetch_chunk_shared
+    labels = ("striped", file_id.dc_id)
+
+    def schedule_stripes():
+        nonlocal next_stripe
+        while len(pending) < max_stripes and next_stripe < stripe_count:
+            first_part = next_stripe * stripe_chunks
+            pending.append(asyncio.ensure_future(fetch_stripe(
+                streamers,
+                failed,
+                next_stripe % len(streamers),
+                file_id,
+                offset + first_part * chunk_size,
+                min(stripe_chunks, part_count - first_part),
+                chunk_size,
+                connection,
+            )))
+            next_stripe += 1
+
+    logging.debug(
+        f"Starting striped download of {part_count} parts in {stripe_count} stripes "
+        f"with clients {[index for index, _ in streamers]}"
+    )
+    active_streams.inc(labels)
+    try:
+        schedule_stripes()
+        while pending:
+            chunks = await pending.popleft()
+            schedule_stripes()
+            for chunk in chunks:
+                if not chunk:
+                    return
+                chunk = cut_chunk(chunk, current_part, part_count, first_part_cut, last_part_cut)
+                streamed_bytes.inc(labels, len(chunk))
+                yield chunk
+                current_part += 1
+                if current_part > part_count:
+                    return
+    except Exception as e:
+        log_stream_error(e)
+        raise
+    finally:
+        active_streams.dec(labels)
+        cancel_pending(pending, connection)
+        logging.debug(f"Finished striped download with {current_part - 1} parts")
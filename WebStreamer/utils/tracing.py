@@ -0,0 +1,132 @@
+# Per-request phase timings: Server-Timing headers and the slow-request log
+import json
+import time
+import random
+import logging
+import functools
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Trace of the request being handled, seen by everything it awaits and by the tasks it starts
+current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_trace", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "name", "started_at")
+
+    def __init__(self, trace: "RequestTrace", name: str):
+        self.trace = trace
+        self.name = name
+        self.started_at = 0.0
+
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add(self.name, time.monotonic() - self.started_at)
+        return False
+
+
+class NullSpan:
+    """Span of a request that isn't traced"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class RequestTrace:
+    def __init__(self):
+        """
+        Phase timings of one request.
+        attributes:
+            started_at: monotonic time the request started.
+            phases: per phase name, [count, total seconds, seconds of the first occurrence].
+            marks: seconds from the start of the request to named points (e.g. first_byte).
+            fields: request details added to the slow-request log record.
+        """
+        self.started_at = time.monotonic()
+        self.phases: Dict[str, List[float]] = {}
+        self.marks: Dict[str, float] = {}
+        self.fields: Dict[str, Any] = {}
+        self.token = None
+
+    def span(self, name: str) -> Span:
+        return Span(self, name)
+
+    def add(self, name: str, seconds: float) -> None:
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [1, seconds, seconds]
+        else:
+            phase[0] += 1
+            phase[1] += seconds
+
+    def mark(self, name: str) -> None:
+        if name not in self.marks:
+            self.marks[name] = time.monotonic() - self.started_at
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def server_timing(self) -> str:
+        """Server-Timing header value with the phases finished so far and the time spent until now"""
+        entries = [f"{name};dur={total * 1000:.1f}" for name, (_, total, _) in self.phases.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def record(self) -> Dict[str, Any]:
+        """Structured record of the request for the slow-request log"""
+        record = dict(self.fields)
+        record.update({f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.marks.items()})
+        record["total_ms"] = round(self.elapsed() * 1000, 1)
+        record["phases"] = {
+            name: {"count": count, "ms": round(total * 1000, 1), "first_ms": round(first * 1000, 1)}
+            for name, (count, total, first) in self.phases.items()
+        }
+        return record
+
+
+def start_trace(sample_rate: float) -> Optional[RequestTrace]:
+    """Starts tracing the current request with probability `sample_rate`, returns None when it isn't sampled"""
+    if sample_rate <= 0 or (sample_rate < 1 and random.random() >= sample_rate):
+        return None
+    trace = RequestTrace()
+    trace.token = current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace: RequestTrace, slow_request_ms: int) -> None:
+    """
+    Stops tracing and logs the request when it was slow: the time to the first body byte,
+    or to the end of the request when it had no body, is over `slow_request_ms`.
+    """
+    current_trace.reset(trace.token)
+    latency = trace.marks.get("first_byte", trace.elapsed())
+    if latency * 1000 > slow_request_ms:
+        logging.warning(f"Slow request: {json.dumps(trace.record(), default=str)}")
+
+
+def trace_span(name: str):
+    """Context manager timing a phase of the current request (does nothing when it isn't traced)"""
+    trace = current_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return Span(trace, name)
+
+
+def traced(name: str):
+    """Decorator timing every call of a coroutine function as a phase of the current request"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with trace_span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,48 @@
+# Background warm-up of media sessions so the first download from a DC doesn't pay for auth export/import
+import asyncio
+import logging
+from typing import Dict, List
+from pyrogram.errors import FloodWait
+from .custom_dl import ByteStreamer
+
+# FLOOD_WAIT longer than this skips the remaining DCs of a client instead of waiting
+MAX_WARMUP_FLOOD_WAIT = 60
+
+warmup_status = {
+    "state": "disabled",
+    "ready": {},
+    "failed": {},
+}
+
+
+async def prewarm_media_sessions(streamers: Dict[int, ByteStreamer], dc_ids: List[int], interval: float) -> None:
+    """
+    Creates and authorizes the media session pools of every DC in `dc_ids` on every client,
+    one at a time with `interval` seconds in between. Progress is kept in `warmup_status`.
+    """
+    warmup_status["state"] = "running"
+    for index, streamer in streamers.items():
+        ready = warmup_status["ready"].setdefault(str(index), [])
+        failed = warmup_status["failed"].setdefault(str(index), {})
+        home_dc = await streamer.client.storage.dc_id()
+        # Home DC first, it doesn't need an auth export
+        for dc_id in sorted(dc_ids, key=lambda dc: dc != home_dc):
+            try:
+                await streamer.generate_dc_media_session(streamer.client, dc_id)
+                ready.append(dc_id)
+                logging.debug(f"Warmed up media session for DC {dc_id} on client {index}")
+            except FloodWait as e:
+                failed[str(dc_id)] = f"FLOOD_WAIT {e.value}s"
+                logging.warning(f"FloodWait for {e.value} seconds while warming up DC {dc_id} on client {index}")
+                if e.value > MAX_WARMUP_FLOOD_WAIT:
+                    break
+                await asyncio.sleep(e.value + 1)
+            except Exception as e:
+                failed[str(dc_id)] = str(e)
+                logging.warning(f"Failed to warm up media session for DC {dc_id} on client {index}: {e}")
+            await asyncio.sleep(interval)
+    warmup_status["state"] = "done"
+    logging.info(
+        f"Media session warm-up done: "
+        f"{sum(len(dcs) for dcs in warmup_status['ready'].values())} sessions ready"
+    )
@@ -52,3 +52,87 @@ class Var(object):
     # Toggle to enable/disable sending download links to channels
     # If False, bot still listens to channels but won't respond with links
     SEND_LINKS_TO_CHANNELS = environ.get("SEND_LINKS_TO_CHANNELS", "true").lower() == "true"
+
+    # Number of upload.GetFile requests kept in flight per stream (read-ahead window)
+    READ_AHEAD_CHUNKS = int(environ.get("READ_AHEAD_CHUNKS", "4"))
+    # Upper bound for bytes buffered by the read-ahead window of a single stream
+    READ_AHEAD_MAX_BYTES = int(environ.get("READ_AHEAD_MAX_BYTES", str(8 * 1024 * 1024)))  # 8 MiB
+    # Read-ahead budget shared by all connections, beyond it each stream keeps one request in flight
+    MAX_BUFFERED_BYTES = int(environ.get("MAX_BUFFERED_BYTES", str(512 * 1024 * 1024)))  # 512 MiB
+
+    # upload.GetFile chunk sizes (powers of two from 4 KiB to 1 MiB). With ADAPTIVE_CHUNK_SIZE, short
+    # ranges use the smallest chunk covering them and long ranges start with smaller chunks (unless the
+    # chunk cache stores the file, it only keeps MAX_CHUNK_SIZE chunks)
+    MIN_CHUNK_SIZE = int(environ.get("MIN_CHUNK_SIZE", str(64 * 1024)))  # 64 KiB
+    MAX_CHUNK_SIZE = int(environ.get("MAX_CHUNK_SIZE", str(1024 * 1024)))  # 1 MiB
+    ADAPTIVE_CHUNK_SIZE = environ.get("ADAPTIVE_CHUNK_SIZE", "true").lower() == "true"
+
+    # Striped downloads: fetch chunk-aligned stripes of one file through several clients at once
+    STRIPED_DOWNLOADS = environ.get("STRIPED_DOWNLOADS", "false").lower() == "true"
+    # Number of chunks per stripe (each chunk is one GetFile request)
+    STRIPE_CHUNKS = int(environ.get("STRIPE_CHUNKS", "4"))
+    # Maximum number of stripes fetched at the same time for a single request
+    MAX_STRIPES_PER_REQUEST = int(environ.get("MAX_STRIPES_PER_REQUEST", "4"))
+
+    # Local disk cache for downloaded chunks (disabled when CHUNK_CACHE_DIR is empty)
+    CHUNK_CACHE_DIR = str(environ.get("CHUNK_CACHE_DIR", ""))
+    CHUNK_CACHE_MAX_BYTES = int(environ.get("CHUNK_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))  # 2 GiB
+    # Eviction policy for the chunk cache: "lru" or "lfu"
+    CHUNK_CACHE_POLICY = str(environ.get("CHUNK_CACHE_POLICY", "lru")).lower()
+
+    # Maximum number of distinct GetFile requests shared between concurrent readers at once
+    SINGLE_FLIGHT_MAX_KEYS = int(environ.get("SINGLE_FLIGHT_MAX_KEYS", "256"))
+
+    # File properties cache: maximum entries per client and how long an entry stays valid
+    FILE_CACHE_MAX_ENTRIES = int(environ.get("FILE_CACHE_MAX_ENTRIES", "10000"))
+    FILE_CACHE_TTL = int(environ.get("FILE_CACHE_TTL", "3600"))  # 1 hour, file references go stale after a while
+
+    # Process-wide file metadata cache shared by all clients (size, mime type, name, unique id, dc id)
+    METADATA_CACHE_MAX_ENTRIES = int(environ.get("METADATA_CACHE_MAX_ENTRIES", "50000"))
+    METADATA_CACHE_TTL = int(environ.get("METADATA_CACHE_TTL", "86400"))  # 24 hours
+
+    # Optional SQLite index of file metadata that survives restarts (disabled when METADATA_DB is empty)
+    METADATA_DB = str(environ.get("METADATA_DB", ""))
+    METADATA_DB_BATCH_SIZE = int(environ.get("METADATA_DB_BATCH_SIZE", "100"))
+    METADATA_DB_FLUSH_INTERVAL = float(environ.get("METADATA_DB_FLUSH_INTERVAL", "2"))  # seconds
+
+    # Media session pool per DC per client: maximum sessions, in-flight requests per session
+    # before another session is opened, and idle seconds before an extra session is closed
+    MEDIA_SESSION_POOL_SIZE = int(environ.get("MEDIA_SESSION_POOL_SIZE", "4"))
+    MEDIA_SESSION_GROW_THRESHOLD = int(environ.get("MEDIA_SESSION_GROW_THRESHOLD", "8"))
+    MEDIA_SESSION_IDLE_TIMEOUT = int(environ.get("MEDIA_SESSION_IDLE_TIMEOUT", "300"))  # 5 minutes
+
+    # Pre-warm media sessions for all DCs on every client in the background after startup
+    PREWARM_MEDIA_SESSIONS = environ.get("PREWARM_MEDIA_SESSIONS", "false").lower() == "true"
+    PREWARM_DC_IDS = [int(dc_id) for dc_id in environ.get("PREWARM_DC_IDS", "1,2,3,4,5").split(",") if dc_id.strip()]
+    # Seconds between two warm-ups (keeps auth.ExportAuthorization below FLOOD_WAIT limits)
+    PREWARM_INTERVAL = float(environ.get("PREWARM_INTERVAL", "2"))
+
+    # Encrypted local store of media DC auth keys reused across restarts
+    # (disabled unless both AUTH_KEY_STORE and its own AUTH_KEY_STORE_SECRET are set)
+    AUTH_KEY_STORE = str(environ.get("AUTH_KEY_STORE", ""))
+    AUTH_KEY_STORE_SECRET = str(environ.get("AUTH_KEY_STORE_SECRET", ""))
+
+    # Client selection policy for new streams: "weighted" (least bandwidth, DC affinity) or "least_loaded"
+    CLIENT_SCHEDULER = str(environ.get("CLIENT_SCHEDULER", "weighted")).lower()
+    # Longest FLOOD_WAIT (seconds) a stream waits out when no other client can take it over
+    MAX_FLOOD_WAIT_SLEEP = int(environ.get("MAX_FLOOD_WAIT_SLEEP", "30"))
+
+    # Cache-Control of /dl responses by mime type: "pattern=value" rules separated by ";", the first match wins.
+    # A file_unique_id always names the same bytes, so edge caches can keep media for a long time
+    CACHE_CONTROL = str(environ.get(
+        "CACHE_CONTROL",
+        "video/*=public, max-age=2592000, immutable;"
+        "audio/*=public, max-age=2592000, immutable;"
+        "image/*=public, max-age=2592000, immutable;"
+        "*=public, max-age=86400",
+    ))
+
+    # Fraction of /dl requests traced into Server-Timing headers and the slow-request log (0, the default, disables tracing)
+    TRACE_SAMPLE_RATE = float(environ.get("TRACE_SAMPLE_RATE", "0"))
+    # Traced requests slower than this to their first body byte (milliseconds) are logged with their phases
+    SLOW_REQUEST_MS = int(environ.get("SLOW_REQUEST_MS", "3000"))
+
+    # Access log of /dl and /link requests for benchmarks/replay.py (disabled when ACCESS_LOG is empty, gzipped for *.gz)
+    ACCESS_LOG = str(environ.get("ACCESS_LOG", ""))
+    ACCESS_LOG_FLUSH_INTERVAL = float(environ.get("ACCESS_LOG_FLUSH_INTERVAL", "5"))  # seconds
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the per-request and per-chunk hot paths, run offline against an in-process
+ByteStreamer whose media session answers upload.GetFile from memory:
+
+- range parsing and part math of direct_download (parse_range_header, plan_segments, plan_range)
+- chunk slicing (cut_chunk) and the whole yield_file pipeline
+- FileId.decode plus the metadata lookup by unique_file_id
+- client selection over work_loads for both scheduler policies
+- is_message_processed with large tables of processed messages
+
+Every timing is the best of several interleaved repeats. Run from the repository root:
+python benchmarks/bench_hot_paths.py (or benchmarks/run_all.py to store the results as JSON)
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+# Offline: no disk chunk cache and no SQLite metadata index
+os.environ["CHUNK_CACHE_DIR"] = ""
+os.environ["METADATA_DB"] = ""
+
+from pyrogram import raw
+from pyrogram.file_id import FileId, FileType
+from WebStreamer.bot import work_loads
+from WebStreamer.bot.plugins import media_handler
+from WebStreamer.bot.scheduler import LeastLoadedScheduler, WeightedBandwidthScheduler
+from WebStreamer.utils.chunking import cut_chunk, plan_range, plan_segments
+from WebStreamer.utils.custom_dl import ByteStreamer
+from WebStreamer.utils.metadata_cache import file_metadata, lookup_metadata_by_unique_id
+from WebStreamer.utils.ranges import parse_range_header
+
+MIB = 1024 * 1024
+GIB = 1024 * MIB
+FILE_SIZE = 4 * GIB
+SEED = 42
+REPEAT = 7
+# Each repeat runs the operation for at least this long (seconds)
+MIN_REPEAT_TIME = 0.1
+RANGE_HEADERS = ["bytes=0-", "bytes=1048576-", "bytes=734003200-734068735", "bytes=-65536", "bytes=0-1,100-200,5000-"]
+CLIENT_COUNTS = (4, 16, 64)
+PROCESSED_TABLE_SIZES = (1_000, 10_000, 100_000)
+STREAM_BYTES = 256 * MIB
+
+
+def best_ns_per_op(operation, batch: int = 1) -> float:
+    """
+    Nanoseconds per call of `operation` (which runs `batch` operations per call): the
+    number of calls per repeat is calibrated to MIN_REPEAT_TIME, the best repeat counts.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            operation()
+        if time.perf_counter() - started >= MIN_REPEAT_TIME:
+            break
+        number *= 2
+    best = None
+    for _ in range(REPEAT):
+        started = time.perf_counter_ns()
+        for _ in range(number):
+            operation()
+        elapsed = (time.perf_counter_ns() - started) / (number * batch)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def best_async_ns_per_op(coroutine_function, batch: int) -> float:
+    """Same as best_ns_per_op for a coroutine function running `batch` operations, in one event loop"""
+    loop = asyncio.new_event_loop()
+    try:
+        return best_ns_per_op(lambda: loop.run_until_complete(coroutine_function()), batch)
+    finally:
+        loop.close()
+
+
+def bench_ranges() -> dict:
+    rng = random.Random(SEED)
+    requests = []
+    for _ in range(1000):
+        from_bytes = rng.randrange(FILE_SIZE - 64 * MIB)
+        requests.append((from_bytes, from_bytes + rng.randrange(1, 64 * MIB)))
+
+    def parse():
+        for header in RANGE_HEADERS:
+            parse_range_header(header, FILE_SIZE)
+
+    def plan():
+        for from_bytes, until_bytes in requests:
+            for start, end, chunk_size in plan_segments(from_bytes, until_bytes, 64 * 1024, MIB, 4):
+                plan_range(start, end, chunk_size)
+
+    return {
+        "range_parse_ns_per_header": round(best_ns_per_op(parse, len(RANGE_HEADERS))),
+        "range_plan_ns_per_request": round(best_ns_per_op(plan, len(requests))),
+    }
+
+
+def bench_cut_chunk() -> dict:
+    chunk = bytes(MIB)
+    parts = [(1, 10, 4096, MIB), (5, 10, 4096, MIB), (10, 10, 4096, 777), (1, 1, 100, 200)]
+
+    def cut():
+        for current_part, part_count, first_part_cut, last_part_cut in parts:
+            cut_chunk(chunk, current_part, part_count, first_part_cut, last_part_cut)
+
+    return {"cut_chunk_ns_per_chunk": round(best_ns_per_op(cut, len(parts)))}
+
+
+class FakeMediaSession:
+    """Answers upload.GetFile with slices of one preallocated buffer"""
+
+    def __init__(self):
+        self.data = bytes(2 * MIB)
+
+    async def invoke(self, query, **kwargs):
+        return raw.types.upload.File(
+            type=raw.types.storage.FileUnknown(), mtime=0, bytes=self.data[:query.limit]
+        )
+
+
+def fake_byte_streamer() -> ByteStreamer:
+    streamer = ByteStreamer.__new__(ByteStreamer)
+    streamer.client = None
+    streamer.index = 0
+    session = FakeMediaSession()
+
+    async def generate_media_session(client, file_id):
+        return session
+
+    streamer.generate_media_session = generate_media_session
+    return streamer
+
+
+def bench_yield_file() -> dict:
+    streamer = fake_byte_streamer()
+    file_id = FileId.decode(FileId(
+        file_type=FileType.DOCUMENT, dc_id=4, media_id=1, access_hash=2, file_reference=b"ref"
+    ).encode())
+    setattr(file_id, "unique_id", "AgADbench")
+
+    async def stream():
+        # Unaligned 8 MiB range requests, the way players read a file
+        for from_bytes in range(12345, STREAM_BYTES, 8 * MIB):
+            for start, end, chunk_size in plan_segments(from_bytes, from_bytes + 8 * MIB - 1, 64 * 1024, MIB, 4):
+                offset, first_part_cut, last_part_cut, part_count = plan_range(start, end, chunk_size)
+                async for _ in streamer.yield_file(
+                    file_id, 0, offset, first_part_cut, last_part_cut, part_count, chunk_size
+                ):
+                    pass
+
+    work_loads[0] = 0
+    try:
+        ns_per_gib = best_async_ns_per_op(stream, 1) * GIB / STREAM_BYTES
+    finally:
+        work_loads.pop(0, None)
+    return {"yield_file_ms_per_gib": round(ns_per_gib / 1e6, 1)}
+
+
+def bench_file_id_lookup() -> dict:
+    unique_ids = [f"AgADbench{i}" for i in range(1000)]
+    encoded = [
+        FileId(file_type=FileType.VIDEO, dc_id=4, media_id=i, access_hash=i * 7, file_reference=b"ref").encode()
+        for i in range(len(unique_ids))
+    ]
+    for i, unique_id in enumerate(unique_ids):
+        file_metadata.put({
+            "unique_id": unique_id, "file_id": encoded[i], "file_name": "video.mp4", "file_size": GIB,
+            "mime_type": "video/mp4", "dc_id": 4, "channel_id": -100, "message_id": i,
+        })
+    pairs = list(zip(encoded, unique_ids))
+
+    def decode():
+        for file_id, _ in pairs:
+            FileId.decode(file_id)
+
+    async def decode_and_lookup():
+        for file_id, unique_id in pairs:
+            FileId.decode(file_id)
+            await lookup_metadata_by_unique_id(unique_id)
+
+    return {
+        "file_id_decode_ns": round(best_ns_per_op(decode, len(pairs))),
+        "file_id_decode_and_lookup_ns": round(best_async_ns_per_op(decode_and_lookup, len(pairs))),
+    }
+
+
+def bench_client_selection() -> dict:
+    results = {}
+    rng = random.Random(SEED)
+    for clients in CLIENT_COUNTS:
+        work_loads.clear()
+        for index in range(clients):
+            work_loads[index] = rng.randrange(10)
+        for name, scheduler_class in (("least_loaded", LeastLoadedScheduler),
+                                      ("weighted", WeightedBandwidthScheduler)):
+            scheduler = scheduler_class()
+            for index in range(clients):
+                scheduler.record_bytes(index, rng.randrange(MIB, 64 * MIB))
+                scheduler.mark_warm(index, rng.randrange(1, 6))
+            results[f"select_{name}_{clients}_clients_ns"] = round(
+                best_ns_per_op(lambda: scheduler.choose(4))
+            )
+    work_loads.clear()
+    return results
+
+
+def bench_processed_messages() -> dict:
+    results = {}
+    now = time.time()
+    for size in PROCESSED_TABLE_SIZES:
+        media_handler._processed_messages.clear()
+        media_handler._processed_messages.update(
+            {(-100, message_id, 1): now for message_id in range(size)}
+        )
+
+        async def check():
+            # A new message: the whole table is scanned
+            await media_handler.is_message_processed(-100, size + 1, 1)
+
+        results[f"is_message_processed_{size}_entries_us"] = round(best_async_ns_per_op(check, 1) / 1000, 1)
+    media_handler._processed_messages.clear()
+    return results
+
+
+def run() -> dict:
+    results = {}
+    for bench in (bench_ranges, bench_cut_chunk, bench_yield_file, bench_file_id_lookup,
+                  bench_client_selection, bench_processed_messages):
+        results.update(bench())
+    return results
+
+
+if __name__ == "__main__":
+    for key, value in run().items():
+        print(f"{key}: {value}")
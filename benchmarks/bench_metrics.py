@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: CPU time per GiB streamed through ByteStreamer.yield_file and fetch_chunk_shared
+with the metrics updates in place versus replaced by no-ops, for the smallest and largest
+chunk sizes the streams use. Telegram is replaced by one preallocated chunk.
+
+Run from the repository root: python benchmarks/bench_metrics.py
+"""
+import os
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+import WebStreamer.utils.custom_dl as custom_dl
+from WebStreamer.bot import work_loads
+
+GIB = 1024 * 1024 * 1024
+CHUNK_SIZES = (64 * 1024, 1024 * 1024)
+ROUNDS = 5
+INSTRUMENTS = ("active_streams", "streamed_bytes", "telegram_bytes", "getfile_seconds")
+
+
+class NullMetric:
+    def inc(self, labels=(), amount=1):
+        pass
+
+    def dec(self, labels=(), amount=1):
+        pass
+
+    def observe(self, labels, value):
+        pass
+
+
+async def stream(chunk_size: int) -> int:
+    chunk = os.urandom(chunk_size)
+    streamer = custom_dl.ByteStreamer.__new__(custom_dl.ByteStreamer)
+    streamer.index = 0
+    file_id = SimpleNamespace(dc_id=4, media_id=1, thumbnail_size="")
+
+    async def fetch_chunk(media_session, location, offset, size):
+        return chunk
+
+    async def iter_chunks(file_id, offset, part_count, chunk_size, connection=None):
+        for part in range(part_count):
+            yield await streamer.fetch_chunk_shared(None, None, file_id, offset + part * chunk_size, chunk_size)
+
+    streamer.fetch_chunk = fetch_chunk
+    streamer.iter_chunks = iter_chunks
+    work_loads[0] = 0
+    part_count = GIB // chunk_size
+    written = 0
+    try:
+        async for data in streamer.yield_file(file_id, 0, 0, 0, chunk_size, part_count, chunk_size):
+            written += len(data)
+    finally:
+        work_loads.pop(0, None)
+    return written
+
+
+def measure(chunk_size: int, instrumented: bool) -> float:
+    """Returns the CPU milliseconds per GiB of one run"""
+    originals = {name: getattr(custom_dl, name) for name in INSTRUMENTS}
+    if not instrumented:
+        for name in INSTRUMENTS:
+            setattr(custom_dl, name, NullMetric())
+    try:
+        started = time.process_time()
+        written = asyncio.run(stream(chunk_size))
+        return (time.process_time() - started) / (written / GIB) * 1000
+    finally:
+        for name, value in originals.items():
+            setattr(custom_dl, name, value)
+
+
+def run() -> dict:
+    results = {}
+    for chunk_size in CHUNK_SIZES:
+        # Interleaved runs so both variants see the same machine noise, the best run counts
+        without, with_metrics = [], []
+        for _ in range(ROUNDS):
+            without.append(measure(chunk_size, False))
+            with_metrics.append(measure(chunk_size, True))
+        without, with_metrics = min(without), min(with_metrics)
+        kib = chunk_size // 1024
+        results[f"chunk_{kib}k_without_metrics_cpu_ms_per_gib"] = round(without, 1)
+        results[f"chunk_{kib}k_with_metrics_cpu_ms_per_gib"] = round(with_metrics, 1)
+        results[f"chunk_{kib}k_overhead_percent"] = round((with_metrics - without) / without * 100, 1)
+    return results
+
+
+if __name__ == "__main__":
+    for key, value in run().items():
+        print(f"{key}: {value}")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Simulation benchmark: client selection of the original least-loaded policy versus the
+weighted bandwidth scheduler, on clients with different bandwidths and a mix of small
+and large streams. Runs on a virtual clock; both policies replay the same arrivals.
+
+Run from the repository root: python benchmarks/bench_scheduler.py
+"""
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+from WebStreamer.bot import work_loads
+from WebStreamer.bot.scheduler import LeastLoadedScheduler, WeightedBandwidthScheduler
+
+MIB = 1024 * 1024
+# Bandwidth of every simulated client (bytes/sec), shared equally by its streams
+CLIENT_BANDWIDTH = [40 * MIB, 20 * MIB, 10 * MIB, 5 * MIB]
+# (probability, size) of the streams: short previews and full downloads
+STREAM_SIZES = [(0.8, 2 * MIB), (0.2, 200 * MIB)]
+DC_IDS = [1, 2, 3, 4, 5]
+# Seconds it takes a client to create a media session for a DC it hasn't used yet
+COLD_DC_DELAY = 1.5
+LOAD = 0.7
+DURATION = 600.0
+STEP = 0.05
+SEED = 7
+
+
+def arrivals() -> list:
+    rng = random.Random(SEED)
+    mean_size = sum(p * size for p, size in STREAM_SIZES)
+    rate = LOAD * sum(CLIENT_BANDWIDTH) / mean_size
+    now, streams = 0.0, []
+    while True:
+        now += rng.expovariate(rate)
+        if now >= DURATION:
+            return streams
+        size = STREAM_SIZES[-1][1]
+        pick = rng.random()
+        for p, candidate in STREAM_SIZES:
+            if pick < p:
+                size = candidate
+                break
+            pick -= p
+        streams.append((now, size, rng.choice(DC_IDS)))
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def simulate(scheduler_class) -> dict:
+    clock = [0.0]
+    scheduler = scheduler_class(clock=lambda: clock[0])
+    work_loads.clear()
+    work_loads.update({index: 0 for index in range(len(CLIENT_BANDWIDTH))})
+    pending = arrivals()
+    pending.reverse()
+    active = []  # [client, remaining, ready_at, started_at, size, dc_id]
+    session_ready = {}  # (client, dc_id) -> time its media session is usable
+    durations = {size: [] for _, size in STREAM_SIZES}
+
+    while pending or active:
+        now = clock[0]
+        while pending and pending[-1][0] <= now:
+            _, size, dc_id = pending.pop()
+            index = scheduler.choose(dc_id)
+            ready_at = session_ready.setdefault((index, dc_id), now + COLD_DC_DELAY)
+            work_loads[index] += 1
+            active.append([index, size, ready_at, now, size, dc_id])
+
+        for index, bandwidth in enumerate(CLIENT_BANDWIDTH):
+            streaming = [s for s in active if s[0] == index and s[2] <= now]
+            if not streaming:
+                continue
+            share = bandwidth * STEP / len(streaming)
+            delivered = 0
+            for stream in streaming:
+                scheduler.mark_warm(index, stream[5])
+                sent = min(share, stream[1])
+                stream[1] -= sent
+                delivered += sent
+            scheduler.record_bytes(index, int(delivered))
+
+        clock[0] = now + STEP
+        for stream in [s for s in active if s[1] <= 0]:
+            active.remove(stream)
+            work_loads[stream[0]] -= 1
+            durations[stream[4]].append(clock[0] - stream[3])
+
+    result = {}
+    for size, values in durations.items():
+        label = f"{size // MIB}mib"
+        result[f"{label}_mean_s"] = round(sum(values) / len(values), 3)
+        result[f"{label}_p95_s"] = round(percentile(values, 0.95), 3)
+    result["streams"] = sum(len(values) for values in durations.values())
+    return result
+
+
+def run() -> dict:
+    results = {}
+    for name, scheduler_class in (("least_loaded", LeastLoadedScheduler),
+                                  ("weighted", WeightedBandwidthScheduler)):
+        for key, value in simulate(scheduler_class).items():
+            results[f"{name}_{key}"] = value
+    work_loads.clear()
+    return results
+
+
+if __name__ == "__main__":
+    for key, value in run().items():
+        print(f"{key}: {value}")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: bytes copied and CPU time per GiB streamed through the real
+ByteStreamer.yield_file -> iter_chunks -> iter_remote_chunks chain, with the old bytes slicing,
+the safe_yield_file wrapper and the extra iter_chunks generator layer versus memoryview slicing
+straight to the transport. Telegram is replaced by a media session answering every GetFile
+with one preallocated 1 MiB chunk.
+
+Run from the repository root: python benchmarks/bench_zero_copy.py
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+# Every chunk comes from the fake session, not from a disk chunk cache
+os.environ["CHUNK_CACHE_DIR"] = ""
+
+import WebStreamer.utils.custom_dl as custom_dl
+from pyrogram import raw
+from pyrogram.file_id import FileId, FileType
+from WebStreamer.bot import work_loads
+from WebStreamer.utils.chunking import plan_range
+
+GIB = 1024 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+FILE_SIZE = 2 * GIB
+CHUNK = os.urandom(CHUNK_SIZE)
+SEED = 42
+
+
+def legacy_cut_chunk(chunk, current_part, part_count, first_part_cut, last_part_cut):
+    """The old cut: every trimmed part is a copied bytes slice"""
+    if part_count == 1:
+        return chunk[first_part_cut:last_part_cut]
+    elif current_part == 1:
+        return chunk[first_part_cut:]
+    elif current_part == part_count:
+        return chunk[:last_part_cut]
+    return chunk
+
+
+async def legacy_safe_yield_file(generator):
+    """The old wrapper generator between yield_file and aiohttp"""
+    try:
+        async for chunk in generator:
+            yield chunk
+    except Exception:
+        raise
+
+
+class FakeMediaSession:
+    """Answers every GetFile with CHUNK itself, so any copy is made by the streaming code"""
+
+    async def invoke(self, query, **kwargs):
+        return raw.types.upload.File(type=raw.types.storage.FileUnknown(), mtime=0, bytes=CHUNK)
+
+
+class Transport:
+    """Counts the bytes handed to the transport and the ones that had to be copied first"""
+
+    def __init__(self):
+        self.written = 0
+        self.copied = 0
+
+    def write(self, chunk):
+        self.written += len(chunk)
+        if chunk is not CHUNK and not isinstance(chunk, memoryview):
+            self.copied += len(chunk)
+
+
+def requests() -> list:
+    """Player-like range requests: half short probes and seeks, half longer reads, 1 GiB in total"""
+    rng = random.Random(SEED)
+    ranges, total = [], 0
+    while total < GIB:
+        length = rng.randrange(64 * 1024, CHUNK_SIZE) if rng.random() < 0.5 else rng.randrange(CHUNK_SIZE, 16 * CHUNK_SIZE)
+        from_bytes = rng.randrange(0, FILE_SIZE - length)
+        ranges.append((from_bytes, from_bytes + length - 1))
+        total += length
+    return ranges
+
+
+async def stream(legacy: bool) -> Transport:
+    streamer = custom_dl.ByteStreamer.__new__(custom_dl.ByteStreamer)
+    streamer.client = None
+    streamer.index = 0
+    session = FakeMediaSession()
+
+    async def generate_media_session(client, file_id):
+        return session
+
+    streamer.generate_media_session = generate_media_session
+    if legacy:
+        remote_chunks = streamer.iter_remote_chunks
+
+        async def iter_chunks(file_id, offset, part_count, chunk_size, connection=None):
+            """The old iter_chunks: one more generator around iter_remote_chunks without a cache"""
+            chunks = remote_chunks(file_id, offset, part_count, chunk_size, connection)
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+
+        streamer.iter_chunks = iter_chunks
+    file_id = FileId.decode(FileId(
+        file_type=FileType.DOCUMENT, dc_id=4, media_id=1, access_hash=2, file_reference=b"ref"
+    ).encode())
+    work_loads[0] = 0
+    transport = Transport()
+    cut_chunk = custom_dl.cut_chunk
+    if legacy:
+        custom_dl.cut_chunk = legacy_cut_chunk
+    try:
+        for from_bytes, until_bytes in requests():
+            offset, first_part_cut, last_part_cut, part_count = plan_range(from_bytes, until_bytes, CHUNK_SIZE)
+            body = streamer.yield_file(file_id, 0, offset, first_part_cut, last_part_cut, part_count, CHUNK_SIZE)
+            if legacy:
+                body = legacy_safe_yield_file(body)
+            async for chunk in body:
+                transport.write(chunk)
+    finally:
+        custom_dl.cut_chunk = cut_chunk
+        work_loads.pop(0, None)
+    return transport
+
+
+def measure(legacy: bool) -> dict:
+    started = time.process_time()
+    transport = asyncio.run(stream(legacy))
+    cpu = time.process_time() - started
+    gib = transport.written / GIB
+    return {
+        "copied_mib_per_gib": round(transport.copied / gib / (1024 * 1024), 1),
+        "cpu_ms_per_gib": round(cpu / gib * 1000, 1),
+    }
+
+
+def run() -> dict:
+    results = {}
+    for name, legacy in (("before", True), ("after", False)):
+        for key, value in measure(legacy).items():
+            results[f"{name}_{key}"] = value
+    return results
+
+
+if __name__ == "__main__":
+    for key, value in run().items():
+        print(f"{key}: {value}")
@@ -0,0 +1,410 @@
+"""
+Local stand-in for the Telegram DCs, for load tests of the real /dl pipeline without network
+access or bot bans. It implements the part of Telegram that ByteStreamer relies on:
+
+- upload.GetFile with per-request latency, per-client bandwidth, FLOOD_WAIT injection,
+  expired file references and the GetFile offset/limit rules
+- auth.ExportAuthorization on the client and auth.ImportAuthorization on media sessions
+- Client.get_messages for the messages holding the files (used by /link and reference refreshes)
+
+Usage:
+    telegram = FakeTelegram(latency=0.05, bandwidth=20 * MIB, flood_wait_rate=0.001)
+    files = [telegram.add_file(200 * MIB) for _ in range(10)]
+    telegram.install()       # media sessions of FakeClients are FakeSessions from now on
+    telegram.attach(4)       # multi_clients/work_loads now hold 4 FakeClients
+    ... serve web_server() and request telegram.download_path(file) ...
+    telegram.uninstall()
+"""
+import os
+import asyncio
+import logging
+import random
+import itertools
+import urllib.parse
+from typing import Dict, List, Optional, Sequence, Union
+
+from pyrogram import raw
+from pyrogram.errors import (
+    AuthBytesInvalid,
+    AuthKeyUnregistered,
+    FileIdInvalid,
+    FileMigrate,
+    FileReferenceExpired,
+    FloodWait,
+    LimitInvalid,
+    OffsetInvalid,
+)
+from pyrogram.file_id import FileId, FileType, FileUniqueId, FileUniqueType
+
+import WebStreamer.utils.custom_dl as custom_dl
+from WebStreamer.bot import multi_clients, work_loads
+
+MIB = 1024 * 1024
+# Distinct 1 MiB blocks the file contents are made of (a file repeats one of them)
+PATTERN_BLOCKS = 16
+CHANNEL_ID = -1001000000001
+
+
+class FakeFile:
+    def __init__(self, media_id: int, dc_id: int, size: int, mime_type: str, file_name: str, message_id: int):
+        """
+        A file stored on a fake DC. Its bytes are one pattern block repeated, so any range can be
+        checked against `expected` without keeping the file in memory.
+        attributes:
+            reference: the current file_reference, GetFile with an older one fails with FILE_REFERENCE_EXPIRED.
+        """
+        self.media_id = media_id
+        self.access_hash = media_id * 7919
+        self.dc_id = dc_id
+        self.size = size
+        self.mime_type = mime_type
+        self.file_name = file_name
+        self.channel_id = CHANNEL_ID
+        self.message_id = message_id
+        self.file_type = FileType.VIDEO if mime_type.startswith("video/") else FileType.DOCUMENT
+        self.reference = os.urandom(8)
+        self.reference_set_at = 0.0
+        self.block = FakeTelegram.blocks[media_id % PATTERN_BLOCKS]
+
+    @property
+    def file_id(self) -> str:
+        return FileId(
+            file_type=self.file_type,
+            dc_id=self.dc_id,
+            media_id=self.media_id,
+            access_hash=self.access_hash,
+            file_reference=self.reference,
+        ).encode()
+
+    @property
+    def unique_id(self) -> str:
+        return FileUniqueId(file_unique_type=FileUniqueType.DOCUMENT, media_id=self.media_id).encode()
+
+    def read(self, offset: int, limit: int) -> bytes:
+        """Bytes offset..offset+limit, which GetFile keeps inside one 1 MiB block"""
+        end = min(offset + limit, self.size)
+        if offset >= end:
+            return b""
+        start = offset % MIB
+        return self.block[start:start + end - offset]
+
+    def expected(self, first: int, last: int) -> bytes:
+        """The bytes first..last (inclusive) of the file"""
+        parts = []
+        position = first
+        while position <= last:
+            start = position % MIB
+            length = min(MIB - start, last - position + 1)
+            parts.append(self.block[start:start + length])
+            position += length
+        return b"".join(parts)
+
+
+class FakeMedia:
+    """The media attribute (video or document) of a FakeMessage"""
+
+    def __init__(self, file: FakeFile):
+        self.file_id = file.file_id
+        self.file_unique_id = file.unique_id
+        self.file_size = file.size
+        self.file_name = file.file_name
+        self.mime_type = file.mime_type
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, file: Optional[FakeFile] = None):
+        self.id = message_id
+        self.empty = file is None
+        media = FakeMedia(file) if file is not None else None
+        is_video = file is not None and file.file_type == FileType.VIDEO
+        self.video = media if is_video else None
+        self.document = media if not is_video else None
+        self.audio = None
+
+
+class FakeStorage:
+    def __init__(self, dc_id: int, auth_key: bytes):
+        self._dc_id = dc_id
+        self._auth_key = auth_key
+
+    async def dc_id(self) -> int:
+        return self._dc_id
+
+    async def test_mode(self) -> bool:
+        return False
+
+    async def auth_key(self) -> bytes:
+        return self._auth_key
+
+
+class FakeClient:
+    def __init__(self, telegram: "FakeTelegram", index: int, bandwidth: float):
+        """
+        A bot client logged in on the home DC of the fake Telegram.
+        attributes:
+            bandwidth: bytes/sec shared by all media sessions of the client.
+            link_free_at: loop time at which the transfers already queued on the client's link end.
+            flood_until: per DC (0 for the main connection), loop time at which the current FLOOD_WAIT
+                of the client ends.
+            getfile_bytes: bytes the client downloaded with GetFile.
+        """
+        self.telegram = telegram
+        self.index = index
+        self.name = f"fake_client_{index}"
+        self.bandwidth = bandwidth
+        self.storage = FakeStorage(telegram.home_dc, os.urandom(256))
+        self.media_sessions: Dict[int, "FakeSession"] = {}
+        self.link_free_at = 0.0
+        self.flood_until: Dict[int, float] = {}
+        self.getfile_bytes = 0
+
+    async def invoke(self, query, *args, **kwargs):
+        if isinstance(query, raw.functions.auth.ExportAuthorization):
+            return await self.telegram.export_authorization(self, query.dc_id)
+        raise NotImplementedError(f"FakeClient doesn't implement {type(query).__name__}")
+
+    async def get_messages(self, chat_id: int, message_ids: Union[int, List[int]]):
+        await self.telegram.delay(self.telegram.latency)
+        # Same main connection as auth.ExportAuthorization, flood waits of one hold for the other
+        self.telegram.check_flood_wait(self, 0, 0.0)
+        if isinstance(message_ids, int):
+            return self.telegram.message(chat_id, message_ids)
+        return [self.telegram.message(chat_id, message_id) for message_id in message_ids]
+
+
+class FakeSession:
+    def __init__(self, telegram: "FakeTelegram", client: FakeClient, dc_id: int, auth_key: bytes):
+        """A media session of a client to one fake DC, authorized once its auth key is (imported or home DC key)"""
+        self.telegram = telegram
+        self.client = client
+        self.dc_id = dc_id
+        self.auth_key = auth_key
+        self.is_connected = asyncio.Event()
+
+    async def start(self) -> None:
+        await self.telegram.delay(self.telegram.latency)
+        self.is_connected.set()
+
+    async def stop(self) -> None:
+        self.is_connected.clear()
+
+    async def invoke(self, query, *args, **kwargs):
+        if isinstance(query, raw.functions.upload.GetFile):
+            return await self.telegram.get_file(self, query)
+        if isinstance(query, raw.functions.auth.ImportAuthorization):
+            return await self.telegram.import_authorization(self, query)
+        if isinstance(query, raw.functions.users.GetUsers):
+            self.telegram.check_authorized(self)
+            return []
+        raise NotImplementedError(f"FakeSession doesn't implement {type(query).__name__}")
+
+
+class FakeTelegram:
+    # Shared file contents, see FakeFile
+    blocks = [random.Random(seed).randbytes(MIB) for seed in range(PATTERN_BLOCKS)]
+    # Media (and message) IDs are unique in the process: the metadata caches outlive a FakeTelegram
+    media_ids = itertools.count(1)
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.2,
+        bandwidth: float = 20 * MIB,
+        bandwidths: Sequence[float] = (),
+        flood_wait_rate: float = 0.0,
+        flood_wait_seconds: int = 5,
+        export_flood_wait_rate: float = 0.0,
+        reference_lifetime: Optional[float] = None,
+        home_dc: int = 2,
+        seed: Optional[int] = None,
+    ):
+        """
+        The fake DCs and the files on them.
+        attributes:
+            latency: seconds of every round trip, varied by +-`jitter` (a fraction of it).
+            bandwidth: bytes/sec of a client, `bandwidths` overrides it by client index.
+            flood_wait_rate: probability that a GetFile starts a FLOOD_WAIT of `flood_wait_seconds`
+                for the client on that DC (every request during the wait gets the remaining time).
+            export_flood_wait_rate: same for auth.ExportAuthorization.
+            reference_lifetime: seconds after which file references expire on their own (None: only
+                through expire_references).
+            stats: counters of the requests served and the errors injected.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.bandwidths = list(bandwidths)
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.export_flood_wait_rate = export_flood_wait_rate
+        self.reference_lifetime = reference_lifetime
+        self.home_dc = home_dc
+        self.random = random.Random(seed)
+        self.files: Dict[int, FakeFile] = {}
+        self.messages: Dict[int, FakeFile] = {}
+        self.clients: List[FakeClient] = []
+        self.exported: Dict[int, bytes] = {}
+        self.authorized_keys = set()
+        self.original_factories = None
+        self.stats = {
+            "getfile_requests": 0,
+            "getfile_bytes": 0,
+            "flood_waits": 0,
+            "expired_references": 0,
+            "exports": 0,
+            "imports": 0,
+            "get_messages": 0,
+        }
+
+    # Files
+
+    def add_file(self, size: int, dc_id: int = 4, mime_type: str = "video/mp4", file_name: Optional[str] = None) -> FakeFile:
+        media_id = next(self.media_ids)
+        file = FakeFile(media_id, dc_id, size, mime_type, file_name or f"file_{media_id}.mp4", media_id)
+        file.reference_set_at = self.now()
+        self.files[media_id] = file
+        self.messages[file.message_id] = file
+        return file
+
+    def expire_references(self, files: Optional[List[FakeFile]] = None) -> None:
+        """Gives files (all of them by default) a new file_reference, the old one stops working"""
+        for file in files if files is not None else self.files.values():
+            file.reference = os.urandom(8)
+            file.reference_set_at = self.now()
+
+    def message(self, chat_id: int, message_id: int) -> FakeMessage:
+        self.stats["get_messages"] += 1
+        file = self.messages.get(message_id) if chat_id == CHANNEL_ID else None
+        if file is not None:
+            self.refresh_reference(file)
+        return FakeMessage(message_id, file)
+
+    @staticmethod
+    def download_path(file: FakeFile) -> str:
+        return f"/dl/{file.unique_id}/{file.file_id}/{file.size}/{urllib.parse.quote(file.file_name, safe='')}"
+
+    @staticmethod
+    def link_path(file: FakeFile) -> str:
+        return f"/link/{file.channel_id}/{file.message_id}"
+
+    # Clients
+
+    def attach(self, count: int) -> List[FakeClient]:
+        """Replaces multi_clients (and work_loads) with `count` fake clients"""
+        multi_clients.clear()
+        work_loads.clear()
+        self.clients = []
+        for index in range(count):
+            bandwidth = self.bandwidths[index] if index < len(self.bandwidths) else self.bandwidth
+            client = FakeClient(self, index, bandwidth)
+            self.clients.append(client)
+            multi_clients[index] = client
+            work_loads[index] = 0
+        return self.clients
+
+    def install(self) -> "FakeTelegram":
+        """Makes custom_dl create FakeSessions (and skip the auth key handshake) for FakeClients"""
+        create_auth, create_session = custom_dl.create_auth_safe, custom_dl.create_session_safe
+        # The per-DC locks belong to the event loop of a previous run
+        custom_dl._dc_session_locks.clear()
+        self.original_factories = (create_auth, create_session)
+
+        async def create_auth_safe(client, dc_id, test_mode):
+            if not isinstance(client, FakeClient):
+                return await create_auth(client, dc_id, test_mode)
+            await self.delay(self.latency * 2)
+            return os.urandom(256)
+
+        def create_session_safe(client, dc_id, auth_key, test_mode, is_media=True):
+            if not isinstance(client, FakeClient):
+                return create_session(client, dc_id, auth_key, test_mode, is_media)
+            return FakeSession(self, client, dc_id, auth_key)
+
+        custom_dl.create_auth_safe = create_auth_safe
+        custom_dl.create_session_safe = create_session_safe
+        return self
+
+    def uninstall(self) -> None:
+        if self.original_factories is not None:
+            custom_dl.create_auth_safe, custom_dl.create_session_safe = self.original_factories
+            self.original_factories = None
+
+    # Requests
+
+    @staticmethod
+    def now() -> float:
+        try:
+            return asyncio.get_running_loop().time()
+        except RuntimeError:
+            return 0.0
+
+    async def delay(self, seconds: float) -> None:
+        if seconds > 0:
+            await asyncio.sleep(seconds * (1 + self.jitter * (2 * self.random.random() - 1)))
+
+    def check_flood_wait(self, client: FakeClient, dc_id: int, rate: float) -> None:
+        now = self.now()
+        until = client.flood_until.get(dc_id, 0.0)
+        if until <= now and rate and self.random.random() < rate:
+            until = client.flood_until[dc_id] = now + self.flood_wait_seconds
+            self.stats["flood_waits"] += 1
+            logging.debug(f"Fake DC {dc_id} starts a FLOOD_WAIT of {self.flood_wait_seconds}s for client {client.index}")
+        if until > now:
+            raise FloodWait(value=max(1, round(until - now)))
+
+    def check_authorized(self, session: FakeSession) -> None:
+        home_key = session.client.storage._auth_key
+        if session.auth_key != home_key and session.auth_key not in self.authorized_keys:
+            raise AuthKeyUnregistered()
+
+    def refresh_reference(self, file: FakeFile) -> None:
+        if self.reference_lifetime is not None and self.now() - file.reference_set_at > self.reference_lifetime:
+            self.expire_references([file])
+
+    async def export_authorization(self, client: FakeClient, dc_id: int):
+        await self.delay(self.latency)
+        self.check_flood_wait(client, 0, self.export_flood_wait_rate)
+        self.stats["exports"] += 1
+        auth_id = self.random.getrandbits(63)
+        self.exported[auth_id] = os.urandom(32)
+        return raw.types.auth.ExportedAuthorization(id=auth_id, bytes=self.exported[auth_id])
+
+    async def import_authorization(self, session: FakeSession, query):
+        await self.delay(self.latency)
+        if self.exported.pop(query.id, None) != query.bytes:
+            raise AuthBytesInvalid()
+        self.stats["imports"] += 1
+        self.authorized_keys.add(session.auth_key)
+        return raw.types.auth.Authorization(user=raw.types.UserEmpty(id=session.client.index + 1))
+
+    async def get_file(self, session: FakeSession, query):
+        location = query.location
+        file = self.files.get(location.id)
+        if file is None or location.access_hash != file.access_hash:
+            raise FileIdInvalid()
+        if session.dc_id != file.dc_id:
+            raise FileMigrate(value=file.dc_id)
+        self.check_authorized(session)
+        offset, limit = query.offset, query.limit
+        if limit <= 0 or limit > MIB or limit % 4096 or MIB % limit:
+            raise LimitInvalid()
+        if offset % limit or offset < 0:
+            raise OffsetInvalid()
+        self.check_flood_wait(session.client, file.dc_id, self.flood_wait_rate)
+        self.refresh_reference(file)
+        if location.file_reference != file.reference:
+            self.stats["expired_references"] += 1
+            raise FileReferenceExpired()
+
+        data = file.read(offset, limit)
+        # The round trip overlaps with transfers already on the client's link, the transfer doesn't
+        client = session.client
+        now = self.now()
+        done_at = max(now + self.latency * (1 + self.jitter * (2 * self.random.random() - 1)), client.link_free_at)
+        done_at += len(data) / client.bandwidth
+        client.link_free_at = done_at
+        await asyncio.sleep(done_at - now)
+        self.stats["getfile_requests"] += 1
+        self.stats["getfile_bytes"] += len(data)
+        client.getfile_bytes += len(data)
+        return raw.types.upload.File(type=raw.types.storage.FileUnknown(), mtime=0, bytes=data)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test: the real aiohttp server (web_server() with handler cancellation, as in
+production) streams from a local fake Telegram (benchmarks/fake_telegram.py) through the
+multi_clients, schedulers, media session pools, read-ahead and reference refreshes, while
+thousands of concurrent range requests hit /dl.
+
+Every file is first resolved through /link and the /dl requests use the URLs it returned (that
+is also how a reference refresh finds the message of a file). Responses can be checked byte for
+byte with --verify.
+
+Run from the repository root:
+    python benchmarks/load_test.py --clients 4 --concurrency 1000 --requests 5000
+    python benchmarks/load_test.py --flood-wait-rate 0.002 --stale-links --expire-every 30 --verify
+    python benchmarks/load_test.py --serve --port 8080   # only serve, for an external driver
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+os.environ.setdefault("FQDN", "127.0.0.1")
+# Every request is slow under full load, only log the pathological ones
+os.environ.setdefault("SLOW_REQUEST_MS", "60000")
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+from fake_telegram import MIB, FakeTelegram
+from WebStreamer.server import web_server
+
+SEED = 42
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of `values` (0 for no values)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(prefix: str, seconds: list) -> dict:
+    return {
+        f"{prefix}_p50_ms": round(percentile(seconds, 0.5) * 1000, 1),
+        f"{prefix}_p95_ms": round(percentile(seconds, 0.95) * 1000, 1),
+        f"{prefix}_p99_ms": round(percentile(seconds, 0.99) * 1000, 1),
+        f"{prefix}_max_ms": round(max(seconds, default=0) * 1000, 1),
+    }
+
+
+def client_skew(loads: list) -> float:
+    """Busiest client's share of the load relative to an even share (1.0: perfectly even)"""
+    total = sum(loads)
+    return round(max(loads) * len(loads) / total, 2) if total else 0.0
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+    """Serves web_server() the way WebStreamer/__main__.py does, returns the runner (see server_url)"""
+    runner = web.AppRunner(web_server(), handler_cancellation=True)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def server_url(runner: web.AppRunner) -> str:
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}"
+
+
+def fake_telegram(args: argparse.Namespace) -> FakeTelegram:
+    """A FakeTelegram with the files and clients described by the command line, installed"""
+    telegram = FakeTelegram(
+        latency=args.latency,
+        bandwidth=args.bandwidth_mib * MIB,
+        flood_wait_rate=args.flood_wait_rate,
+        flood_wait_seconds=args.flood_wait_seconds,
+        export_flood_wait_rate=args.export_flood_wait_rate,
+        reference_lifetime=args.reference_lifetime,
+        seed=args.seed,
+    )
+    for index in range(args.files):
+        # Files spread over the DCs, so both the home DC and exported authorizations are used
+        telegram.add_file(int(args.file_size_mib * MIB), dc_id=(2, 4, 5)[index % 3] if args.mixed_dcs else 4,
+                          file_name=f"video_{index}.mp4")
+    telegram.install()
+    telegram.attach(args.clients)
+    return telegram
+
+
+async def resolve_links(session: ClientSession, base_url: str, telegram: FakeTelegram) -> dict:
+    """Asks /link for the download URL of every file, returns their paths by media_id"""
+    paths = {}
+    for file in telegram.files.values():
+        async with session.get(base_url + telegram.link_path(file)) as response:
+            body = await response.json()
+            if response.status != 200 or not body["success"]:
+                raise RuntimeError(f"/link failed for {file.file_name}: {response.status} {body}")
+        paths[file.media_id] = urllib.parse.urlsplit(body["download_url"]).path
+    return paths
+
+
+async def expire_references(telegram: FakeTelegram, every: float) -> None:
+    while True:
+        await asyncio.sleep(every)
+        telegram.expire_references()
+
+
+async def fetch(session: ClientSession, url: str, file, first: int, last: int, verify: bool, results: dict) -> None:
+    started = time.monotonic()
+    first_byte = None
+    received = []
+    size = 0
+    try:
+        async with session.get(url, headers={"Range": f"bytes={first}-{last}"}) as response:
+            async for data in response.content.iter_any():
+                if first_byte is None:
+                    first_byte = time.monotonic() - started
+                size += len(data)
+                if verify:
+                    received.append(data)
+            status = response.status
+    except Exception as e:
+        results["statuses"][type(e).__name__] = results["statuses"].get(type(e).__name__, 0) + 1
+        return
+    results["statuses"][status] = results["statuses"].get(status, 0) + 1
+    results["bytes"] += size
+    results["latencies"].append(time.monotonic() - started)
+    if first_byte is not None:
+        results["first_bytes"].append(first_byte)
+    if status == 206 and size != last - first + 1:
+        results["short_responses"] += 1
+    if verify and status == 206 and b"".join(received) != file.expected(first, last):
+        results["corrupt_responses"] += 1
+
+
+async def generate_load(base_url: str, telegram: FakeTelegram, args: argparse.Namespace) -> dict:
+    """Runs args.requests random range requests, args.concurrency at a time, and summarizes them"""
+    rng = random.Random(args.seed)
+    files = list(telegram.files.values())
+    results = {"statuses": {}, "bytes": 0, "latencies": [], "first_bytes": [],
+               "short_responses": 0, "corrupt_responses": 0}
+    max_length = int(args.range_mib * MIB)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    connector = TCPConnector(limit=args.concurrency)
+    async with ClientSession(connector=connector, timeout=ClientTimeout(total=args.timeout)) as session:
+        paths = await resolve_links(session, base_url, telegram)
+        if args.stale_links:
+            telegram.expire_references()
+
+        async def one_request():
+            file = rng.choice(files)
+            first = rng.randrange(file.size)
+            last = min(file.size - 1, first + rng.randrange(1, max_length + 1) - 1)
+            async with semaphore:
+                await fetch(session, base_url + paths[file.media_id], file, first, last, args.verify, results)
+
+        expiry = asyncio.ensure_future(expire_references(telegram, args.expire_every)) if args.expire_every else None
+        started = time.monotonic()
+        try:
+            await asyncio.gather(*(one_request() for _ in range(args.requests)))
+        finally:
+            if expiry is not None:
+                expiry.cancel()
+        elapsed = time.monotonic() - started
+
+    summary = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "clients": args.clients,
+        "elapsed_s": round(elapsed, 2),
+        "requests_per_s": round(args.requests / elapsed, 1),
+        "throughput_mib_per_s": round(results["bytes"] / MIB / elapsed, 1),
+        "statuses": dict(sorted(results["statuses"].items(), key=str)),
+        "short_responses": results["short_responses"],
+    }
+    if args.verify:
+        summary["corrupt_responses"] = results["corrupt_responses"]
+    summary.update(latency_summary("first_byte", results["first_bytes"]))
+    summary.update(latency_summary("latency", results["latencies"]))
+    summary["telegram_mib"] = round(telegram.stats["getfile_bytes"] / MIB, 1)
+    summary["telegram_amplification"] = round(telegram.stats["getfile_bytes"] / max(1, results["bytes"]), 2)
+    summary["client_skew"] = client_skew([client.getfile_bytes for client in telegram.clients])
+    for key in ("getfile_requests", "flood_waits", "expired_references", "exports", "get_messages"):
+        summary[f"telegram_{key}"] = telegram.stats[key]
+    return summary
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=4, help="fake bot clients in multi_clients")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--file-size-mib", type=float, default=512)
+    parser.add_argument("--mixed-dcs", action="store_true", help="spread the files over DCs 2, 4 and 5")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--range-mib", type=float, default=8, help="longest requested range")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per request")
+    parser.add_argument("--verify", action="store_true", help="check the bytes of every 206 response")
+    parser.add_argument("--latency", type=float, default=0.05, help="Telegram round trip in seconds")
+    parser.add_argument("--bandwidth-mib", type=float, default=20, help="MiB/s per client")
+    parser.add_argument("--flood-wait-rate", type=float, default=0.0, help="chance of a FLOOD_WAIT per GetFile")
+    parser.add_argument("--flood-wait-seconds", type=int, default=5)
+    parser.add_argument("--export-flood-wait-rate", type=float, default=0.0)
+    parser.add_argument("--reference-lifetime", type=float, help="seconds until file references expire")
+    parser.add_argument("--expire-every", type=float, default=0, help="expire all file references every N seconds")
+    parser.add_argument("--stale-links", action="store_true",
+                        help="expire the file references once /link handed out the URLs (like links shared long ago)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--serve", action="store_true", help="only serve until interrupted, print the file URLs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+async def main(args: argparse.Namespace) -> dict:
+    telegram = fake_telegram(args)
+    runner = await start_server(args.host, args.port)
+    base_url = server_url(runner)
+    try:
+        if args.serve:
+            print(f"Serving on {base_url}, links of the fake files:")
+            for file in telegram.files.values():
+                print(f"{base_url}{telegram.link_path(file)}")
+            await asyncio.Event().wait()
+        return await generate_load(base_url, telegram, args)
+    finally:
+        await runner.cleanup()
+        telegram.uninstall()
+
+
+def run(**options) -> dict:
+    """Runs a load test with the command line defaults overridden by `options` (e.g. requests=100)"""
+    args = parse_args([])
+    for key, value in options.items():
+        setattr(args, key, value)
+    return asyncio.run(main(args))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        summary = asyncio.run(main(parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,16 @@
+# Placeholder bot settings, so the tests and benchmarks can import WebStreamer without a bot
+import os
+
+PLACEHOLDER_SETTINGS = {
+    "API_ID": "1",
+    "API_HASH": "x",
+    "BOT_TOKEN": "1:x",
+    "BIN_CHANNEL": "-100",
+    "BIN_CHANNEL_WITHOUT_MINUS": "100",
+}
+
+
+def use_placeholder_settings() -> None:
+    """Sets the variables WebStreamer.vars requires, unless they are already in the environment"""
+    for name, value in PLACEHOLDER_SETTINGS.items():
+        os.environ.setdefault(name, value)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Replays an access log recorded with ACCESS_LOG (see WebStreamer/utils/access_log.py) against a
+running instance. Every request starts at its recorded time divided by --speed, whether or not
+the earlier ones finished, sends the recorded Range header and reads as many body bytes as the
+original client did before it went away, so seeks, abandoned streams and bursts on new files
+come back as they happened.
+
+Reports throughput, first-byte and latency percentiles per route, how late the replay started
+requests (the driver must keep up for the numbers to mean anything), and the per-client load
+skew from the instance's /metrics.
+
+With --fake the server runs in-process against the fake Telegram of load_test.py, every recorded
+file becomes a fake file with the same size and DC, so production traffic replays offline.
+
+Run from the repository root:
+    python benchmarks/replay.py access.log.gz --url http://127.0.0.1:8080 --speed 4
+    python benchmarks/replay.py access.log.gz --fake --clients 8 --speed 10
+"""
+import os
+import re
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import urllib.parse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from yarl import URL
+from pyrogram.file_id import FileId
+from fake_telegram import MIB, FakeTelegram
+from load_test import client_skew, latency_summary, percentile, server_url, start_server
+from WebStreamer.utils.access_log import read_access_log
+
+# Per-client counters of /metrics the skew is computed from
+CLIENT_METRICS = {"telegram": "webstreamer_telegram_bytes_total", "streamed": "webstreamer_streamed_bytes_total"}
+SAMPLE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def load_entries(path: str, limit: int = 0, routes=("dl", "link")) -> list:
+    entries = []
+    for entry in read_access_log(path):
+        if entry["path"].split("/")[1] in routes:
+            entries.append(entry)
+            if limit and len(entries) >= limit:
+                break
+    entries.sort(key=lambda entry: entry["time"])
+    return entries
+
+
+def fake_files(entries: list, telegram: FakeTelegram, link_file_size: int) -> list:
+    """
+    Adds a fake file for every file the entries request and returns the entries with their
+    paths rewritten to the fake files: same size, DC and name for /dl, a new file for /link.
+    """
+    paths = {}
+    replayed = []
+    for entry in entries:
+        path = entry["path"]
+        # Paths are logged percent-encoded, a "/" inside the file name is still %2F here
+        parts = path.split("?")[0].split("/")
+        if parts[1] == "dl" and len(parts) == 6:
+            _, _, unique_id, file_id, size, file_name = parts
+            if unique_id not in paths:
+                try:
+                    dc_id = FileId.decode(file_id).dc_id
+                except Exception:
+                    dc_id = 4
+                file = telegram.add_file(int(size) if size.isdigit() and int(size) else link_file_size,
+                                         dc_id=dc_id, file_name=urllib.parse.unquote(file_name))
+                paths[unique_id] = telegram.download_path(file)
+            path = paths[unique_id]
+        elif parts[1] == "link":
+            if path not in paths:
+                paths[path] = telegram.link_path(telegram.add_file(link_file_size))
+            path = paths[path]
+        replayed.append(dict(entry, path=path))
+    return replayed
+
+
+async def client_loads(session: ClientSession, base_url: str) -> dict:
+    """Per-client totals of CLIENT_METRICS from /metrics ({} when the instance doesn't serve it)"""
+    loads = {key: defaultdict(float) for key in CLIENT_METRICS}
+    try:
+        async with session.get(base_url + "/metrics") as response:
+            if response.status != 200:
+                return {}
+            text = await response.text()
+    except Exception as e:
+        logging.warning(f"Can't read {base_url}/metrics: {e}")
+        return {}
+    names = {name: key for key, name in CLIENT_METRICS.items()}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if match and match.group(1) in names:
+            labels = dict(LABEL.findall(match.group(2)))
+            loads[names[match.group(1)]][labels.get("client", "")] += float(match.group(3))
+    return loads
+
+
+def load_summary(before: dict, after: dict) -> dict:
+    summary = {}
+    for key in CLIENT_METRICS:
+        if key not in after:
+            continue
+        # Striped streams are labelled client="striped", their GetFiles carry the real clients
+        loads = {
+            client: after[key][client] - before.get(key, {}).get(client, 0)
+            for client in sorted(after[key], key=lambda client: (not client.isdigit(), client.zfill(8)))
+        }
+        for client, value in loads.items():
+            summary[f"{key}_client_{client}_mib"] = round(value / MIB, 1)
+        summary[f"{key}_client_skew"] = client_skew([value for client, value in loads.items() if client.isdigit()])
+    return summary
+
+
+async def replay_request(session: ClientSession, url: str, entry: dict, results: dict) -> None:
+    route = entry["path"].split("/")[1]
+    headers = {"Range": entry["range"]} if entry["range"] else {}
+    started = time.monotonic()
+    first_byte = None
+    received = 0
+    try:
+        # The recorded path is already percent-encoded, send it as it is
+        async with session.request(entry["method"], URL(url, encoded=True), headers=headers) as response:
+            status = response.status
+            if entry["method"] != "HEAD":
+                async for data in response.content.iter_any():
+                    if first_byte is None:
+                        first_byte = time.monotonic() - started
+                    received += len(data)
+                    if route == "dl" and received >= entry["bytes"]:
+                        break
+            if response.content_length is None or received < response.content_length:
+                # The original client went away here: drop the connection like it did
+                response.close()
+    except Exception as e:
+        status = type(e).__name__
+    route_results = results[route]
+    route_results["statuses"][status] = route_results["statuses"].get(status, 0) + 1
+    route_results["latencies"].append(time.monotonic() - started)
+    if first_byte is not None:
+        route_results["first_bytes"].append(first_byte)
+    results["bytes"] += received
+
+
+async def replay(base_url: str, entries: list, speed: float, timeout: float) -> dict:
+    results = {"bytes": 0, "lags": []}
+    for route in ("dl", "link"):
+        results[route] = {"statuses": {}, "latencies": [], "first_bytes": []}
+    connector = TCPConnector(limit=0)
+    async with ClientSession(connector=connector, timeout=ClientTimeout(total=timeout)) as session:
+        before = await client_loads(session, base_url)
+        tasks = []
+        started = time.monotonic()
+        recorded_start = entries[0]["time"] if entries else 0
+        for entry in entries:
+            due = started + (entry["time"] - recorded_start) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            results["lags"].append(time.monotonic() - due)
+            tasks.append(asyncio.ensure_future(replay_request(session, base_url + entry["path"], entry, results)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+        after = await client_loads(session, base_url)
+
+    recorded = entries[-1]["time"] - recorded_start if entries else 0
+    summary = {
+        "requests": len(entries),
+        "recorded_s": round(recorded, 1),
+        "speed": speed,
+        "elapsed_s": round(elapsed, 2),
+        "requests_per_s": round(len(entries) / elapsed, 1) if elapsed else 0,
+        "throughput_mib_per_s": round(results["bytes"] / MIB / elapsed, 1) if elapsed else 0,
+        "recorded_mib": round(sum(entry["bytes"] for entry in entries) / MIB, 1),
+        "replayed_mib": round(results["bytes"] / MIB, 1),
+        "start_lag_p99_ms": round(percentile(results["lags"], 0.99) * 1000, 1),
+        "start_lag_max_ms": round(max(results["lags"], default=0) * 1000, 1),
+    }
+    for route in ("dl", "link"):
+        route_results = results[route]
+        if not route_results["latencies"]:
+            continue
+        summary[f"{route}_statuses"] = dict(sorted(route_results["statuses"].items(), key=str))
+        if route == "dl":
+            summary.update(latency_summary("dl_first_byte", route_results["first_bytes"]))
+        summary.update(latency_summary(f"{route}_latency", route_results["latencies"]))
+    summary.update(load_summary(before, after))
+    return summary
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="access log recorded with ACCESS_LOG (plain or .gz)")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="instance to replay against")
+    parser.add_argument("--speed", type=float, default=1, help="replay this many times faster than recorded")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N requests")
+    parser.add_argument("--routes", nargs="*", default=["dl", "link"], help="routes to replay")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds per request")
+    parser.add_argument("--fake", action="store_true", help="replay against an in-process server and fake Telegram")
+    parser.add_argument("--clients", type=int, default=4, help="--fake: fake bot clients")
+    parser.add_argument("--latency", type=float, default=0.05, help="--fake: Telegram round trip in seconds")
+    parser.add_argument("--bandwidth-mib", type=float, default=20, help="--fake: MiB/s per client")
+    parser.add_argument("--link-file-size-mib", type=float, default=256, help="--fake: size of files behind /link")
+    return parser.parse_args(argv)
+
+
+async def main(args: argparse.Namespace) -> dict:
+    entries = load_entries(args.log, args.limit, tuple(args.routes))
+    if not args.fake:
+        return await replay(args.url.rstrip("/"), entries, args.speed, args.timeout)
+
+    telegram = FakeTelegram(latency=args.latency, bandwidth=args.bandwidth_mib * MIB)
+    entries = fake_files(entries, telegram, int(args.link_file_size_mib * MIB))
+    telegram.install()
+    telegram.attach(args.clients)
+    runner = await start_server()
+    try:
+        return await replay(server_url(runner), entries, args.speed, args.timeout)
+    finally:
+        await runner.cleanup()
+        telegram.uninstall()
+
+
+def run(log: str, **options) -> dict:
+    """Replays `log` with the command line defaults overridden by `options` (e.g. fake=True, speed=10)"""
+    args = parse_args([log])
+    for key, value in options.items():
+        setattr(args, key, value)
+    return asyncio.run(main(args))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    for key, value in asyncio.run(main(parse_args())).items():
+        print(f"{key}: {value}")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Runs the benchmarks (every benchmarks/bench_*.py exposes run() -> dict), each in its own
+process, and stores the results as JSON with the version, commit and platform they ran on.
+With --compare, timings are checked against a previous results file and the run fails when
+one got slower than the tolerance allows. Both runs also time a fixed pure-Python workload,
+timings are compared relative to it so a slower or busier machine doesn't read as a regression.
+
+Run from the repository root:
+    python benchmarks/run_all.py                      # all benchmarks, results/<version>-<commit>.json
+    python benchmarks/run_all.py --only hot_paths --output new.json --compare benchmarks/results/old.json
+"""
+import os
+import re
+import sys
+import json
+import glob
+import platform
+import argparse
+import datetime
+import subprocess
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+# Results whose name carries a time unit are timings: lower is better
+TIMING = re.compile(r"(^|_)(ns|us|ms|s)(_|$)")
+RUNNER = "import json, runpy, sys; print(json.dumps(runpy.run_path(sys.argv[1])['run']()))"
+
+
+def calibration_ms() -> float:
+    """Best time of a fixed pure-Python workload (dict updates, slicing, sorting) on this machine"""
+    best = None
+    for _ in range(7):
+        started = time.perf_counter()
+        counts = {}
+        data = bytes(range(256)) * 64
+        for i in range(100_000):
+            counts[i & 1023] = counts.get(i & 1023, 0) + len(data[i & 255:(i & 255) + 64])
+        sorted(counts.items(), key=lambda item: item[1])
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_paths(only: list) -> list:
+    paths = sorted(glob.glob(os.path.join(BENCHMARKS_DIR, "bench_*.py")))
+    if only:
+        paths = [path for path in paths if os.path.basename(path)[len("bench_"):-len(".py")] in only]
+    return paths
+
+
+def run_benchmark(path: str) -> dict:
+    """Runs one benchmark module in a fresh interpreter (they change process-wide state) and returns its results"""
+    result = subprocess.run(
+        [sys.executable, "-c", RUNNER, path], cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(path)} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def version() -> str:
+    with open(os.path.join(ROOT_DIR, "WebStreamer", "__init__.py")) as f:
+        match = re.search(r"^__version__ = (.+)$", f.read(), re.MULTILINE)
+    return match.group(1).strip("'\"") if match else "unknown"
+
+
+def relative_speed(results: dict, baseline: dict) -> float:
+    """How much longer the calibration workload took in `results` than in `baseline`"""
+    if not baseline.get("calibration_ms"):
+        return 1.0
+    return results["calibration_ms"] / baseline["calibration_ms"]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns (benchmark, key, baseline, current) for the timings more than `tolerance` slower
+    than the baseline, after scaling the baseline by the calibration times of both runs.
+    """
+    speed = relative_speed(results, baseline)
+    regressions = []
+    for name, values in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name, {})
+        for key, value in values.items():
+            old = previous.get(key)
+            if not TIMING.search(key) or not isinstance(old, (int, float)) or old <= 0:
+                continue
+            if value > old * speed * (1 + tolerance):
+                regressions.append((name, key, old, value))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="*", default=[], help="benchmark names without bench_ (e.g. hot_paths)")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<version>-<commit>.json)")
+    parser.add_argument("--compare", help="previous results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown before a timing regresses")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        "version": version(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "benchmarks": {},
+    }
+    calibrations = [calibration_ms()]
+    for path in benchmark_paths(args.only):
+        name = os.path.basename(path)[len("bench_"):-len(".py")]
+        print(f"Running {name}...", file=sys.stderr)
+        results["benchmarks"][name] = run_benchmark(path)
+        calibrations.append(calibration_ms())
+    results["calibration_ms"] = round(min(calibrations), 2)
+
+    output = args.output or os.path.join(BENCHMARKS_DIR, "results", f"{results['version']}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        speed = relative_speed(results, baseline)
+        print(f"This machine ran the calibration workload {1 / speed:.2f}x as fast as the baseline run")
+        for name, key, old, value in regressions:
+            print(f"REGRESSION {name}.{key}: {old} -> {value} ({(value / (old * speed) - 1) * 100:+.0f}% after calibration)")
+        if regressions:
+            return 1
+        print(f"No timing is more than {args.tolerance:.0%} slower than {baseline['version']}-{baseline['commit']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Tests for the access log of /dl and /link requests (WebStreamer/utils/access_log.py) and its
+replay by benchmarks/replay.py against the fake Telegram DCs.
+"""
+import os
+import sys
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+from test_range_requests import ETAG, SIZE, URL, request
+import replay
+import load_test
+import WebStreamer.utils as utils
+from aiohttp import ClientSession
+import yarl
+from fake_telegram import MIB, FakeTelegram
+from WebStreamer.utils.access_log import CLIENT_CLOSED, AccessLog, format_entry, parse_entry, read_access_log
+
+
+def recorded(path: str, action) -> list:
+    """Runs `action()` with the access log recording to `path`, returns the entries written"""
+    utils.access_log = AccessLog(path, 60)
+    try:
+        action()
+        asyncio.run(utils.access_log.close())
+    finally:
+        utils.access_log = None
+    return list(read_access_log(path))
+
+
+def test_entry_format():
+    line = format_entry(1700000000.1234, "GET", "/dl/a/b/10/x.mp4", "bytes=0-1, 5-", 206, 7, 0.0123)
+    assert line == "1700000000.123\tGET\t/dl/a/b/10/x.mp4\tbytes=0-1,5-\t206\t7\t12.3\n"
+    assert parse_entry(line) == {
+        "time": 1700000000.123, "method": "GET", "path": "/dl/a/b/10/x.mp4", "range": "bytes=0-1,5-",
+        "status": 206, "bytes": 7, "duration_ms": 12.3,
+    }
+    assert parse_entry(format_entry(1.0, "GET", "/link/1/2", None, 200, 0, 0))["range"] is None
+
+
+def test_gzipped_log_is_appended():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "access.log.gz")
+        for _ in range(2):
+            access_log = AccessLog(path, 60)
+
+            async def write():
+                await access_log.start()
+                access_log.record("GET", "/link/1/2", None, 200, 10, 1.0)
+                await access_log.close()
+
+            asyncio.run(write())
+        with open(path, "rb") as f:
+            assert f.read(2) == b"\x1f\x8b"
+        assert [entry["path"] for entry in read_access_log(path)] == ["/link/1/2", "/link/1/2"]
+
+
+def test_dl_requests_are_recorded():
+    with tempfile.TemporaryDirectory() as directory:
+        def requests():
+            request(headers={"Range": "bytes=10-2000000"})
+            request()
+            request(method="HEAD")
+            request(headers={"If-None-Match": ETAG})
+
+        ranged, full, head, not_modified = recorded(os.path.join(directory, "access.log"), requests)
+    assert (ranged["path"], ranged["range"], ranged["status"], ranged["bytes"]) == (URL, "bytes=10-2000000", 206, 1999991)
+    assert (full["range"], full["status"], full["bytes"]) == (None, 200, SIZE)
+    assert (head["method"], head["bytes"]) == ("HEAD", 0)
+    assert (not_modified["status"], not_modified["bytes"]) == (304, 0)
+    assert ranged["time"] <= full["time"] <= head["time"] <= not_modified["time"]
+
+
+def test_disconnects_are_recorded():
+    """A client that stops reading records the bytes written before it went away"""
+    telegram = FakeTelegram(latency=0.001, bandwidth=200 * MIB)
+    file = telegram.add_file(64 * MIB)
+    telegram.install()
+    telegram.attach(1)
+
+    buffers = utils.stream_buffers
+    counters = (buffers.disconnects, buffers.undelivered_bytes, buffers.dropped_read_ahead_bytes)
+
+    async def read_and_leave():
+        runner = await load_test.start_server()
+        try:
+            async with ClientSession() as session:
+                response = await session.get(load_test.server_url(runner) + telegram.download_path(file))
+                await response.content.readexactly(MIB)
+                # Long enough for the read-ahead to fill up behind the full socket buffers
+                await asyncio.sleep(0.2)
+                response.close()
+            # The handler is cancelled once the server sees the connection close
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                if utils.access_log.pending:
+                    break
+        finally:
+            await runner.cleanup()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            [entry] = recorded(os.path.join(directory, "access.log"), lambda: asyncio.run(read_and_leave()))
+    finally:
+        telegram.uninstall()
+    assert entry["status"] == CLIENT_CLOSED
+    assert MIB <= entry["bytes"] < 64 * MIB
+    # One disconnect, and at most the chunk that was being written: dropped read-ahead is counted apart
+    assert buffers.disconnects == counters[0] + 1
+    assert buffers.undelivered_bytes - counters[1] <= MIB
+    assert buffers.dropped_read_ahead_bytes - counters[2] >= MIB
+
+
+def test_paths_are_recorded_as_sent():
+    """File names with spaces, tabs and slashes stay one percent-encoded path segment, in the log and in the replay"""
+    file_name = "my clip\t1/2 %2F.mp4"
+    telegram = FakeTelegram(latency=0.001, bandwidth=200 * MIB)
+    file = telegram.add_file(MIB, file_name=file_name)
+    telegram.install()
+    telegram.attach(1)
+
+    async def download():
+        runner = await load_test.start_server()
+        try:
+            async with ClientSession() as session:
+                url = yarl.URL(load_test.server_url(runner) + telegram.download_path(file), encoded=True)
+                async with session.get(url) as response:
+                    assert response.status == 200
+                    assert await response.read() == file.expected(0, MIB - 1)
+        finally:
+            await runner.cleanup()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "access.log")
+            [entry] = recorded(path, lambda: asyncio.run(download()))
+            assert entry["path"] == telegram.download_path(file)
+            assert "%20" in entry["path"] and "%09" in entry["path"] and "%2F" in entry["path"]
+
+            replayed_telegram = FakeTelegram(latency=0.001)
+            [replayed] = replay.fake_files([entry], replayed_telegram, MIB)
+            [replayed_file] = replayed_telegram.files.values()
+            assert (replayed_file.file_name, replayed_file.size) == (file_name, MIB)
+            assert replayed["path"] == replayed_telegram.download_path(replayed_file)
+
+            summary = replay.run(path, fake=True, clients=1, latency=0.001, bandwidth_mib=200)
+    finally:
+        telegram.uninstall()
+    assert summary["dl_statuses"] == {200: 1}
+    assert summary["replayed_mib"] == summary["recorded_mib"]
+
+
+def test_replay_against_fake_telegram():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "access.log.gz")
+        entries = recorded(path, lambda: load_test.run(
+            latency=0.002, bandwidth_mib=200, files=3, file_size_mib=3.5, range_mib=3, requests=20, concurrency=5,
+        ))
+        summary = replay.run(path, fake=True, speed=5, clients=2, latency=0.002, bandwidth_mib=200, link_file_size_mib=4)
+    assert len(entries) == 23
+    assert summary["requests"] == 23
+    assert summary["dl_statuses"] == {206: 20}
+    assert summary["link_statuses"] == {200: 3}
+    assert summary["replayed_mib"] == summary["recorded_mib"]
+    assert summary["telegram_client_skew"] >= 1
+    assert {"telegram_client_0_mib", "telegram_client_1_mib"} <= set(summary)
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests for the encrypted store of media DC auth keys.
+"""
+import os
+import stat
+import asyncio
+import tempfile
+
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+from WebStreamer.utils.auth_key_store import AuthKeyStore
+
+AUTH_KEY = bytes(range(256))
+
+
+def test_keys_are_stored_owner_only():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "auth_keys.bin")
+        # A readable leftover of an interrupted write must not keep its mode
+        with open(f"{path}.tmp", "wb"):
+            pass
+        os.chmod(f"{path}.tmp", 0o644)
+        umask = os.umask(0)
+        try:
+            asyncio.run(AuthKeyStore(path, "secret").set("bot_1", 4, False, AUTH_KEY))
+        finally:
+            os.umask(umask)
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        assert AuthKeyStore(path, "secret").get("bot_1", 4, False) == AUTH_KEY
+        assert AuthKeyStore(path, "other secret").keys == {}
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for the disk chunk cache: concurrent writes of the same chunk, writes that didn't finish
+and chunks evicted while they are read.
+"""
+import os
+import asyncio
+import tempfile
+import threading
+
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+from WebStreamer.utils.chunk_cache import ChunkCache
+
+CHUNK = bytes(range(256)) * 4096
+
+
+def test_concurrent_puts_write_once():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ChunkCache(directory, 16 * len(CHUNK))
+        writes = []
+        write = cache._write
+
+        def counted_write(path, data):
+            writes.append(path)
+            write(path, data)
+
+        cache._write = counted_write
+
+        async def put_twice():
+            # Two streams of the same chunk: the second put arrives while the first write is in flight
+            cache.put("AgADAQAH", 0, CHUNK)
+            cache.put("AgADAQAH", 0, CHUNK[:10])
+            await asyncio.gather(*cache._writes)
+
+        asyncio.run(put_twice())
+        assert len(writes) == 1
+        assert cache.entries[("AgADAQAH", 0)][0] == len(CHUNK)
+        assert os.listdir(os.path.join(directory, "AgADAQAH")) == ["0"]
+        assert asyncio.run(cache.get("AgADAQAH", 0)) == CHUNK
+
+
+def test_unfinished_writes_are_removed():
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "AgADAQAH"))
+        for name, data in (("0", CHUNK), ("tmpa1b2c3.tmp", CHUNK[:100])):
+            with open(os.path.join(directory, "AgADAQAH", name), "wb") as f:
+                f.write(data)
+        cache = ChunkCache(directory, 16 * len(CHUNK))
+        assert list(cache.entries) == [("AgADAQAH", 0)]
+        assert os.listdir(os.path.join(directory, "AgADAQAH")) == ["0"]
+
+
+def test_chunk_evicted_while_read():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ChunkCache(directory, len(CHUNK))
+        evicted = threading.Event()
+        read = cache._read
+
+        def slow_read(path):
+            data = read(path)
+            evicted.wait(5)
+            return data
+
+        cache._read = slow_read
+
+        async def evict_during_get():
+            cache.put("AgADAQAH", 0, CHUNK)
+            await asyncio.gather(*cache._writes)
+            get = asyncio.ensure_future(cache.get("AgADAQAH", 0))
+            await asyncio.sleep(0)
+            # Another chunk pushes the one being read out of the cache
+            cache.put("AgADAQAH", 1, CHUNK)
+            await asyncio.gather(*cache._writes)
+            evicted.set()
+            return await get
+
+        assert asyncio.run(evict_during_get()) == CHUNK
+        assert list(cache.entries) == [("AgADAQAH", 1)]
+        assert cache.evictions == 1
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Property tests for the GetFile chunk size selection and the range -> part math:
+for random files, ranges and chunk sizes, fetching the planned parts and cutting
+them must give back exactly the requested bytes within the GetFile limits.
+"""
+import random
+
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+from WebStreamer.utils.chunking import (
+    LARGEST_CHUNK_SIZE,
+    SMALLEST_CHUNK_SIZE,
+    cut_chunk,
+    normalize_chunk_size,
+    plan_range,
+    plan_segments,
+)
+
+SEED = 1234
+CASES = 2000
+CHUNK_SIZES = [SMALLEST_CHUNK_SIZE << shift for shift in range(9)]  # 4 KiB .. 1 MiB
+
+
+def file_bytes(size):
+    return bytes((i * 31 + 7) % 251 for i in range(size))
+
+
+def fetch(data, from_bytes, until_bytes, chunk_size):
+    """Reassembles the range the way yield_file does, checking every GetFile request on the way"""
+    offset, first_part_cut, last_part_cut, part_count = plan_range(from_bytes, until_bytes, chunk_size)
+    assert part_count >= 1
+    out = []
+    for current_part in range(1, part_count + 1):
+        part_offset = offset + (current_part - 1) * chunk_size
+        assert part_offset % chunk_size == 0
+        assert part_offset // LARGEST_CHUNK_SIZE == (part_offset + chunk_size - 1) // LARGEST_CHUNK_SIZE
+        assert part_offset < len(data)
+        chunk = data[part_offset:part_offset + chunk_size]
+        out.append(cut_chunk(chunk, current_part, part_count, first_part_cut, last_part_cut))
+    return b"".join(out)
+
+
+def random_range(rng, file_size):
+    from_bytes = rng.randrange(file_size)
+    until_bytes = rng.randrange(from_bytes, file_size)
+    return from_bytes, until_bytes
+
+
+def test_normalize_chunk_size():
+    for size in [0, 1, 4095, 4096, 5000, 65536, 100000, 1048576, 1048577, 10 ** 9]:
+        normalized = normalize_chunk_size(size)
+        assert normalized in CHUNK_SIZES
+        assert normalized <= max(size, SMALLEST_CHUNK_SIZE)
+
+
+def test_plan_range_exhaustive_small():
+    chunk_size = SMALLEST_CHUNK_SIZE
+    data = file_bytes(3 * chunk_size + 5)
+    for from_bytes in range(0, len(data), 97):
+        for until_bytes in range(from_bytes, len(data), 89):
+            assert fetch(data, from_bytes, until_bytes, chunk_size) == data[from_bytes:until_bytes + 1]
+
+
+def test_plan_range_boundaries():
+    chunk_size = SMALLEST_CHUNK_SIZE
+    data = file_bytes(4 * chunk_size)
+    edges = [0, 1, chunk_size - 1, chunk_size, chunk_size + 1, 2 * chunk_size, len(data) - 1]
+    for from_bytes in edges:
+        for until_bytes in edges:
+            if until_bytes >= from_bytes:
+                assert fetch(data, from_bytes, until_bytes, chunk_size) == data[from_bytes:until_bytes + 1]
+
+
+def test_plan_range_random():
+    rng = random.Random(SEED)
+    data = file_bytes(5 * LARGEST_CHUNK_SIZE + 12345)
+    for _ in range(CASES):
+        file_size = rng.randrange(1, len(data) + 1)
+        from_bytes, until_bytes = random_range(rng, file_size)
+        chunk_size = rng.choice(CHUNK_SIZES)
+        got = fetch(data[:file_size], from_bytes, until_bytes, chunk_size)
+        assert got == data[from_bytes:until_bytes + 1], (file_size, from_bytes, until_bytes, chunk_size)
+
+
+def test_plan_segments_random():
+    rng = random.Random(SEED + 1)
+    data = file_bytes(5 * LARGEST_CHUNK_SIZE + 12345)
+    for _ in range(CASES):
+        file_size = rng.randrange(1, len(data) + 1)
+        from_bytes, until_bytes = random_range(rng, file_size)
+        min_chunk_size = rng.choice(CHUNK_SIZES)
+        max_chunk_size = rng.choice(CHUNK_SIZES)
+        ramp_parts = rng.randrange(1, 9)
+        segments = plan_segments(from_bytes, until_bytes, min_chunk_size, max_chunk_size, ramp_parts,
+                                 ramp=rng.random() < 0.8)
+
+        # Segments are contiguous and cover exactly the requested range
+        assert segments[0][0] == from_bytes and segments[-1][1] == until_bytes
+        for (_, end, _), (start, _, _) in zip(segments, segments[1:]):
+            assert start == end + 1
+        for start, end, chunk_size in segments:
+            assert start <= end
+            assert chunk_size in CHUNK_SIZES
+            assert chunk_size <= max(max_chunk_size, min_chunk_size)
+
+        got = b"".join(fetch(data[:file_size], start, end, chunk_size) for start, end, chunk_size in segments)
+        assert got == data[from_bytes:until_bytes + 1]
+
+
+def test_short_ranges_use_small_chunks():
+    # A player probing a few KiB doesn't pay for a full 1 MiB GetFile
+    segments = plan_segments(5 * LARGEST_CHUNK_SIZE + 100, 5 * LARGEST_CHUNK_SIZE + 5000,
+                             64 * 1024, LARGEST_CHUNK_SIZE, 4)
+    assert segments == [(5 * LARGEST_CHUNK_SIZE + 100, 5 * LARGEST_CHUNK_SIZE + 5000, 64 * 1024)]
+
+
+def test_long_ranges_ramp_up():
+    from_bytes = 3 * LARGEST_CHUNK_SIZE + 300000
+    segments = plan_segments(from_bytes, 100 * LARGEST_CHUNK_SIZE, 64 * 1024, LARGEST_CHUNK_SIZE, 4)
+    assert segments == [
+        (from_bytes, 4 * LARGEST_CHUNK_SIZE - 1, 256 * 1024),
+        (4 * LARGEST_CHUNK_SIZE, 100 * LARGEST_CHUNK_SIZE, LARGEST_CHUNK_SIZE),
+    ]
+    assert plan_segments(from_bytes, 100 * LARGEST_CHUNK_SIZE, 64 * 1024, LARGEST_CHUNK_SIZE, 4, ramp=False) == [
+        (from_bytes, 100 * LARGEST_CHUNK_SIZE, LARGEST_CHUNK_SIZE),
+    ]
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
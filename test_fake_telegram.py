@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+End-to-end tests of /link and /dl against the fake Telegram DCs of benchmarks/fake_telegram.py,
+served by the real aiohttp server the way benchmarks/load_test.py runs it.
+"""
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+import load_test
+from fake_telegram import CHANNEL_ID, MIB, FakeTelegram
+from pyrogram import raw
+from pyrogram.errors import FileMigrate, FileReferenceExpired, FloodWait, LimitInvalid
+
+FAST = dict(latency=0.002, bandwidth_mib=200, files=3, file_size_mib=3.5, range_mib=3,
+            requests=30, concurrency=10, verify=True)
+
+
+def test_concurrent_range_requests():
+    summary = load_test.run(mixed_dcs=True, **FAST)
+    assert summary["statuses"] == {206: 30}
+    assert summary["short_responses"] == 0
+    assert summary["corrupt_responses"] == 0
+    # Files on DCs 4 and 5 need exported authorizations, DC 2 is the home DC
+    assert summary["telegram_exports"] >= 2
+    # The 4 clients share the resolved metadata: one get_messages per message
+    assert summary["telegram_get_messages"] == 3
+
+
+def test_expired_references_are_refreshed():
+    summary = load_test.run(stale_links=True, **FAST)
+    assert summary["statuses"] == {206: 30}
+    assert summary["corrupt_responses"] == 0
+    assert summary["telegram_expired_references"] > 0
+    assert summary["telegram_get_messages"] > 3
+
+
+def test_refreshes_update_the_access_hash():
+    """A refresh takes the access_hash of the fresh location too, and new streams of the file use it"""
+    import copy
+    from WebStreamer.utils.custom_dl import ByteStreamer
+
+    telegram = FakeTelegram(latency=0)
+    file = telegram.add_file(MIB)
+    client = telegram.attach(1)[0]
+    telegram.install()
+    streamer = ByteStreamer(client, 0)
+
+    async def run():
+        file_id = await streamer.get_file_properties(file.message_id, CHANNEL_ID)
+        stale_file_id = copy.copy(file_id)
+        file.access_hash += 1
+        telegram.expire_references([file])
+        await streamer.refresh_file_reference(file_id)
+        assert (file_id.file_reference, file_id.access_hash) == (file.reference, file.access_hash)
+        # A stream that started from the old file_id picks up the refreshed location
+        return b"".join([chunk async for chunk in streamer.yield_file(stale_file_id, 0, 0, 0, MIB, 1, MIB)])
+
+    try:
+        assert asyncio.run(run()) == file.expected(0, MIB - 1)
+    finally:
+        telegram.uninstall()
+
+
+def test_clients_share_resolved_file_ids():
+    """A message resolved by one client isn't resolved again by the others"""
+    from WebStreamer.utils.custom_dl import ByteStreamer
+    from WebStreamer.utils.metadata_cache import file_metadata
+
+    telegram = FakeTelegram(latency=0)
+    file = telegram.add_file(MIB)
+    streamers = [ByteStreamer(client, index) for index, client in enumerate(telegram.attach(2))]
+
+    async def resolve():
+        return [await streamer.get_file_properties(file.message_id, CHANNEL_ID) for streamer in streamers]
+
+    first, second = asyncio.run(resolve())
+    assert telegram.stats["get_messages"] == 1
+    assert (second.media_id, second.dc_id, second.file_size) == (file.media_id, file.dc_id, MIB)
+    assert file_metadata.get(CHANNEL_ID, file.message_id)["file_id"] == first.file_id
+    asyncio.run(resolve())
+    assert telegram.stats["get_messages"] == 1
+
+
+def test_links_after_a_restart_need_no_telegram_calls():
+    """With METADATA_DB, /link answers messages resolved before a restart from the index alone"""
+    import tempfile
+    from aiohttp import ClientSession
+    from WebStreamer.server.stream_routes import class_cache
+    from WebStreamer.utils import metadata_cache
+    from WebStreamer.utils.metadata_cache import MetadataStore
+    from WebStreamer.utils.metadata_index import MetadataIndex
+
+    telegram = FakeTelegram(latency=0.001)
+    file = telegram.add_file(3 * MIB)
+
+    async def run(path: str, telegram: FakeTelegram) -> tuple:
+        """
+        One process lifetime: fresh caches and clients, the metadata index opened at `path`.
+        Returns the /link response and the number of clients that were asked to resolve it.
+        """
+        telegram.install()
+        telegram.attach(2)
+        class_cache.clear()
+        metadata_cache.file_metadata = MetadataStore(100, 3600)
+        metadata_cache.metadata_index = MetadataIndex(path, 100, 60)
+        await metadata_cache.metadata_index.start()
+        runner = await load_test.start_server()
+        try:
+            async with ClientSession() as session:
+                async with session.get(load_test.server_url(runner) + telegram.link_path(file)) as response:
+                    assert response.status == 200
+                    return await response.json(), len(class_cache)
+        finally:
+            await runner.cleanup()
+            await metadata_cache.metadata_index.close()
+            telegram.uninstall()
+
+    file_metadata, metadata_index = metadata_cache.file_metadata, metadata_cache.metadata_index
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metadata.db")
+            before = asyncio.run(run(path, telegram))
+            assert telegram.stats["get_messages"] == 1
+            restarted = FakeTelegram(latency=0.001)
+            after = asyncio.run(run(path, restarted))
+    finally:
+        metadata_cache.file_metadata, metadata_cache.metadata_index = file_metadata, metadata_index
+        class_cache.clear()
+    assert (before[1], after[1]) == (1, 0)
+    assert after[0] == before[0]
+    assert after[0]["download_url"].endswith(telegram.download_path(file))
+    assert restarted.stats == dict.fromkeys(restarted.stats, 0)
+
+
+def test_clients_share_getfile_requests():
+    """Two clients streaming the same file at once make one GetFile per chunk between them"""
+    from WebStreamer.server.stream_routes import class_cache, get_byte_streamer
+
+    telegram = FakeTelegram(latency=0.002)
+    file = telegram.add_file(4 * MIB, dc_id=4)
+    telegram.install()
+    clients = telegram.attach(2)
+    class_cache.clear()
+
+    async def stream(index, file_id):
+        chunks = get_byte_streamer(index).yield_file(file_id, index, 0, 0, MIB, 4, MIB)
+        return b"".join([chunk async for chunk in chunks])
+
+    async def run():
+        file_ids = []
+        for index in range(2):
+            streamer = get_byte_streamer(index)
+            file_ids.append(await streamer.get_file_properties(file.message_id, CHANNEL_ID))
+            await streamer.generate_dc_media_session(clients[index], file.dc_id)
+        return await asyncio.gather(stream(0, file_ids[0]), stream(1, file_ids[1]))
+
+    try:
+        assert asyncio.run(run()) == [file.expected(0, file.size - 1)] * 2
+        assert telegram.stats["getfile_requests"] == 4
+    finally:
+        telegram.uninstall()
+        class_cache.clear()
+
+
+def test_flood_wait_quarantines_only_the_flooded_client():
+    """
+    Two clients stream the same file at once, only the one that got the FLOOD_WAIT is quarantined:
+    client 1 joins the GetFile of client 0, gets its FLOOD_WAIT and makes the request itself
+    """
+    from WebStreamer.bot.scheduler import scheduler
+    from WebStreamer.server.stream_routes import class_cache, get_byte_streamer
+
+    telegram = FakeTelegram(latency=0.002, flood_wait_seconds=60)
+    file = telegram.add_file(4 * MIB, dc_id=4)
+    telegram.install()
+    clients = telegram.attach(2)
+    class_cache.clear()
+    scheduler.stats.clear()
+
+    async def stream(index, file_id):
+        chunks = get_byte_streamer(index).yield_file(file_id, index, 0, 0, MIB, 4, MIB, get_streamer=get_byte_streamer)
+        return b"".join([chunk async for chunk in chunks])
+
+    async def run():
+        file_ids = []
+        for index in range(2):
+            streamer = get_byte_streamer(index)
+            file_ids.append(await streamer.get_file_properties(file.message_id, CHANNEL_ID))
+            await streamer.generate_dc_media_session(clients[index], file.dc_id)
+        clients[0].flood_until[file.dc_id] = telegram.now() + 60
+        # Both streams ask for the first chunk at the same time, client 0 first
+        return await asyncio.gather(stream(0, file_ids[0]), stream(1, file_ids[1]))
+
+    try:
+        streamed = asyncio.run(run())
+        assert streamed == [file.expected(0, file.size - 1)] * 2
+        assert not scheduler.is_available(0, file.dc_id)
+        assert scheduler.is_available(1, file.dc_id)
+        # The stream of client 0 moved to client 1
+        assert clients[0].getfile_bytes == 0
+        assert clients[1].getfile_bytes >= file.size
+    finally:
+        telegram.uninstall()
+        class_cache.clear()
+        scheduler.stats.clear()
+
+
+def test_main_connection_flood_waits_quarantine_the_whole_client():
+    """FLOOD_WAITs on auth.ExportAuthorization and get_messages take the client out of every DC"""
+    from WebStreamer.bot.scheduler import scheduler
+    from WebStreamer.server.stream_routes import class_cache, get_byte_streamer
+
+    telegram = FakeTelegram(latency=0.001, flood_wait_seconds=60, export_flood_wait_rate=1)
+    file = telegram.add_file(MIB, dc_id=4)
+    telegram.install()
+    clients = telegram.attach(2)
+    class_cache.clear()
+    scheduler.stats.clear()
+
+    async def flood_wait(call):
+        try:
+            await call
+        except FloodWait as e:
+            return e
+        raise AssertionError("FloodWait not raised")
+
+    async def run():
+        await flood_wait(get_byte_streamer(0).generate_dc_media_session(clients[0], file.dc_id))
+        clients[1].flood_until[0] = telegram.now() + 60
+        await flood_wait(get_byte_streamer(1).get_file_properties(file.message_id, CHANNEL_ID))
+
+    try:
+        asyncio.run(run())
+        for index in range(2):
+            assert not scheduler.is_available(index)
+            assert not scheduler.stats[index].dc_flood_until
+    finally:
+        telegram.uninstall()
+        class_cache.clear()
+        scheduler.stats.clear()
+
+
+def test_striped_downloads_wait_out_flood_waits():
+    """Stripes of a flooded client move to the others, or wait for the quarantine to end"""
+    from WebStreamer.bot.scheduler import scheduler
+    from WebStreamer.vars import Var
+
+    striped = Var.STRIPED_DOWNLOADS
+    Var.STRIPED_DOWNLOADS = True
+    try:
+        summary = load_test.run(latency=0.002, bandwidth_mib=200, files=3, file_size_mib=16, range_mib=12,
+                                requests=40, concurrency=10, verify=True, flood_wait_rate=0.05, flood_wait_seconds=1)
+    finally:
+        Var.STRIPED_DOWNLOADS = striped
+        scheduler.stats.clear()
+    assert summary["telegram_flood_waits"] > 0
+    assert summary["statuses"] == {206: 40}
+    assert summary["short_responses"] == 0
+    assert summary["corrupt_responses"] == 0
+
+
+def test_get_file_rules():
+    telegram = FakeTelegram(latency=0, flood_wait_rate=1, flood_wait_seconds=3)
+    file = telegram.add_file(2 * MIB, dc_id=4)
+    client = telegram.attach(1)[0]
+
+    async def get_file(dc_id, offset, limit, reference=None):
+        session = telegram_session(dc_id)
+        location = raw.types.InputDocumentFileLocation(
+            id=file.media_id, access_hash=file.access_hash,
+            file_reference=reference or file.reference, thumb_size="",
+        )
+        return await session.invoke(raw.functions.upload.GetFile(location=location, offset=offset, limit=limit))
+
+    def telegram_session(dc_id):
+        from fake_telegram import FakeSession
+        return FakeSession(telegram, client, dc_id, client.storage._auth_key)
+
+    async def check(dc_id, offset, limit, error, reference=None):
+        try:
+            await get_file(dc_id, offset, limit, reference)
+        except error as e:
+            return e
+        raise AssertionError(f"{error.__name__} not raised")
+
+    async def run():
+        assert (await check(2, 0, MIB, FileMigrate)).value == 4
+        await check(4, 0, 1000, LimitInvalid)
+        assert (await check(4, 0, MIB, FloodWait)).value == 3
+        telegram.flood_wait_rate = 0
+        # The FLOOD_WAIT lasts, whatever the rate
+        await check(4, 0, MIB, FloodWait)
+        client.flood_until.clear()
+        await check(4, 0, MIB, FileReferenceExpired, reference=b"old")
+        result = await get_file(4, MIB, 512 * 1024)
+        assert result.bytes == file.expected(MIB, MIB + 512 * 1024 - 1)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
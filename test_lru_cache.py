@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded LRU cache (WebStreamer/utils/lru_cache.py): eviction order and expiry.
+"""
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+import WebStreamer.utils.lru_cache as lru_cache
+from WebStreamer.utils.lru_cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(2, 60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # "b" is now the least recently used entry
+    cache.set("c", 3)
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+    cache.set("a", 4)
+    cache.set("d", 5)
+    assert list(cache.entries) == ["a", "d"]
+    assert cache.get("a") == 4
+    assert cache.stats() == {"entries": 2, "max_entries": 2, "hits": 2, "misses": 1, "evictions": 2, "expirations": 0}
+
+
+def test_entries_expire_after_the_ttl():
+    clock = FakeClock()
+    original = lru_cache.time
+    lru_cache.time = clock
+    try:
+        cache = LRUCache(4, 60)
+        cache.set("a", 1)
+        clock.now += 30
+        cache.set("b", 2)
+        clock.now += 29
+        # A hit doesn't extend the TTL
+        assert cache.get("a") == 1
+        clock.now += 1
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+        clock.now += 30
+        assert cache.get("b") is None
+        assert len(cache) == 0
+        assert (cache.expirations, cache.misses) == (2, 2)
+    finally:
+        lru_cache.time = original
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
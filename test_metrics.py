@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus metrics: the text exposition format of counters and histograms,
+and the /metrics endpoint after a download through the /dl route.
+"""
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from test_range_requests import SIZE, request, stream_routes
+from WebStreamer.utils.metrics import MetricsRegistry, metrics
+
+
+def test_counter_and_gauge():
+    registry = MetricsRegistry()
+    counter = registry.counter("bytes_total", "Bytes", ("client", "dc"))
+    gauge = registry.gauge("streams", "Streams")
+    counter.inc((0, 4), 10)
+    counter.inc((0, 4), 5)
+    counter.inc((1, 'quote"d'))
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert registry.render() == (
+        "# HELP bytes_total Bytes\n"
+        "# TYPE bytes_total counter\n"
+        'bytes_total{client="0",dc="4"} 15\n'
+        'bytes_total{client="1",dc="quote\\"d"} 1\n'
+        "# HELP streams Streams\n"
+        "# TYPE streams gauge\n"
+        "streams 1\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency", ("dc",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe((2,), value)
+    lines = registry.render().splitlines()[2:]
+    assert lines == [
+        'latency_seconds_bucket{dc="2",le="0.1"} 2',
+        'latency_seconds_bucket{dc="2",le="1"} 3',
+        'latency_seconds_bucket{dc="2",le="+Inf"} 4',
+        'latency_seconds_sum{dc="2"} 3.65',
+        'latency_seconds_count{dc="2"} 4',
+    ]
+
+
+def test_duplicate_metric_names_are_rejected():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests")
+    try:
+        registry.gauge("requests_total", "Requests")
+        raise AssertionError("a metric name can only be registered once")
+    except ValueError:
+        pass
+
+
+def scrape() -> dict:
+    async def run():
+        app = web.Application()
+        app.add_routes(stream_routes.routes)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get("/metrics")
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            return await response.text()
+
+    samples = {}
+    for line in asyncio.run(run()).splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_metrics_endpoint_after_download():
+    before = scrape()
+    streamed = 'webstreamer_streamed_bytes_total{client="0",dc="4"}'
+    fetched = 'webstreamer_telegram_bytes_total{client="0",dc="4"}'
+    first_bytes = 'webstreamer_time_to_first_byte_seconds_count{client="0",dc="4"}'
+    getfiles = 'webstreamer_getfile_seconds_count{client="0",dc="4"}'
+
+    status, _, body, requests = request(headers={"Range": "bytes=100-"})
+    assert status == 206
+
+    after = scrape()
+    assert after[streamed] - before.get(streamed, 0) == SIZE - 100
+    assert after[fetched] - before.get(fetched, 0) == SIZE
+    assert after[first_bytes] - before.get(first_bytes, 0) == 1
+    assert after[getfiles] - before.get(getfiles, 0) == len(requests)
+    assert after['webstreamer_active_streams{client="0",dc="4"}'] == 0
+    assert after['webstreamer_client_load{client="0"}'] == 0
+    assert 'webstreamer_cache_hits_total{cache="chunk_requests"}' in after
+    assert after["webstreamer_undelivered_bytes_total"] == before["webstreamer_undelivered_bytes_total"]
+    assert "webstreamer_dropped_read_ahead_bytes_total" in after
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+RFC 7233 conformance tests for /dl range requests: single, open, suffix and multipart
+ranges, 416 responses, If-Range and HEAD, plus the conditional requests and caching
+headers of RFC 7232/7234. The route runs on an aiohttp test server with a ByteStreamer
+whose media session serves an in-memory file.
+"""
+import os
+import asyncio
+import tempfile
+import importlib
+from email.parser import BytesParser
+from email.policy import HTTP
+
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from pyrogram import raw
+from pyrogram.file_id import FileId, FileType
+from WebStreamer.bot import multi_clients, work_loads
+import WebStreamer.utils.custom_dl as custom_dl
+from WebStreamer.utils.chunk_cache import ChunkCache
+from WebStreamer.utils.custom_dl import ByteStreamer
+from WebStreamer.utils.file_properties import file_unique_id
+from WebStreamer.utils.lru_cache import LRUCache
+from WebStreamer.utils.ranges import MAX_RANGES, merge_ranges, parse_range_header, RangeNotSatisfiable
+
+stream_routes = importlib.import_module("WebStreamer.server.stream_routes")
+
+MIB = 1024 * 1024
+SIZE = 3 * MIB + 12345
+DATA = bytes((i * 7 + i // 4096) % 256 for i in range(SIZE))
+FILE_ID = FileId(file_type=FileType.DOCUMENT, dc_id=4, media_id=1, access_hash=2, file_reference=b"ref").encode()
+UNIQUE_ID = file_unique_id(FileId.decode(FILE_ID))
+ETAG = f'"{UNIQUE_ID}"'
+URL = f"/dl/{UNIQUE_ID}/{FILE_ID}/{SIZE}/video.mp4"
+
+
+class FakeMediaSession:
+    """Answers upload.GetFile from DATA and records the requested offsets"""
+
+    def __init__(self):
+        self.requests = []
+
+    async def invoke(self, query, **kwargs):
+        self.requests.append((query.offset, query.limit))
+        return raw.types.upload.File(
+            type=raw.types.storage.FileUnknown(), mtime=0, bytes=DATA[query.offset:query.offset + query.limit]
+        )
+
+
+def fake_byte_streamer(session: FakeMediaSession) -> ByteStreamer:
+    client = object()
+    streamer = ByteStreamer.__new__(ByteStreamer)
+    streamer.client = client
+    streamer.index = 0
+    streamer.cached_file_ids = LRUCache(16, 60)
+    streamer.media_session_pools = {}
+
+    async def generate_media_session(client, file_id):
+        return session
+
+    streamer.generate_media_session = generate_media_session
+    multi_clients.clear()
+    multi_clients[0] = client
+    work_loads.clear()
+    work_loads[0] = 0
+    stream_routes.class_cache.clear()
+    stream_routes.class_cache[client] = streamer
+    return streamer
+
+
+def request(method="GET", headers=None, session=None, url=URL):
+    """Runs one request against /dl and returns (status, headers, body, GetFile requests)"""
+    session = session or FakeMediaSession()
+    fake_byte_streamer(session)
+
+    async def run():
+        app = web.Application()
+        app.add_routes(stream_routes.routes)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.request(method, url, headers=headers or {})
+            body = await response.read()
+            return response.status, response.headers, body
+
+    status, response_headers, body = asyncio.run(run())
+    assert work_loads[0] == 0
+    return status, response_headers, body, session.requests
+
+
+def multipart_parts(content_type, body):
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    return [(part["Content-Range"], part.get_payload(decode=True)) for part in message.iter_parts()]
+
+
+def test_full_file_without_range():
+    status, headers, body, _ = request()
+    assert status == 200
+    assert body == DATA
+    assert headers["Content-Length"] == str(SIZE)
+    assert headers["Accept-Ranges"] == "bytes"
+    assert headers["ETag"] == ETAG
+    assert "Content-Range" not in headers
+
+
+def test_single_ranges():
+    for first, last in [(0, 0), (5, 100), (MIB - 3, MIB + 3), (MIB, 3 * MIB - 1), (SIZE - 1, SIZE - 1)]:
+        status, headers, body, _ = request(headers={"Range": f"bytes={first}-{last}"})
+        assert status == 206, (first, last)
+        assert body == DATA[first:last + 1], (first, last)
+        assert headers["Content-Range"] == f"bytes {first}-{last}/{SIZE}"
+        assert headers["Content-Length"] == str(last - first + 1)
+
+
+def test_open_range():
+    status, headers, body, _ = request(headers={"Range": "bytes=300000-"})
+    assert status == 206
+    assert body == DATA[300000:]
+    assert headers["Content-Range"] == f"bytes 300000-{SIZE - 1}/{SIZE}"
+
+
+def test_suffix_range():
+    status, headers, body, _ = request(headers={"Range": "bytes=-500"})
+    assert status == 206
+    assert body == DATA[-500:]
+    assert headers["Content-Range"] == f"bytes {SIZE - 500}-{SIZE - 1}/{SIZE}"
+
+    # A suffix longer than the file selects the whole file
+    status, headers, body, _ = request(headers={"Range": f"bytes=-{SIZE * 2}"})
+    assert status == 206
+    assert body == DATA
+    assert headers["Content-Range"] == f"bytes 0-{SIZE - 1}/{SIZE}"
+
+
+def test_last_byte_past_the_end_is_clamped():
+    status, headers, body, _ = request(headers={"Range": f"bytes={SIZE - 10}-{SIZE + 1000}"})
+    assert status == 206
+    assert body == DATA[-10:]
+    assert headers["Content-Range"] == f"bytes {SIZE - 10}-{SIZE - 1}/{SIZE}"
+
+
+def test_unsatisfiable_ranges():
+    for value in [f"bytes={SIZE}-", f"bytes={SIZE}-{SIZE + 10}", "bytes=-0", f"bytes={SIZE + 5}-,-0"]:
+        status, headers, _, requests = request(headers={"Range": value})
+        assert status == 416, value
+        assert headers["Content-Range"] == f"bytes */{SIZE}"
+        assert requests == []
+
+
+def test_invalid_ranges_are_ignored():
+    for value in ["bytes=10-5", "bytes=abc", "bytes=-", "items=0-10", "bytes=", "bytes=1-2-3"]:
+        status, headers, body, _ = request(headers={"Range": value})
+        assert status == 200, value
+        assert body == DATA
+
+
+def test_range_syntax_variants():
+    status, headers, body, _ = request(headers={"Range": "Bytes = 10-19 , 100-109,"})
+    assert status == 206
+    assert multipart_parts(headers["Content-Type"], body) == [
+        (f"bytes 10-19/{SIZE}", DATA[10:20]),
+        (f"bytes 100-109/{SIZE}", DATA[100:110]),
+    ]
+
+
+def test_multipart_ranges():
+    status, headers, body, requests = request(headers={"Range": "bytes=0-9,1000-1999,-100"})
+    assert status == 206
+    assert headers["Content-Type"].startswith("multipart/byteranges; boundary=")
+    assert headers["Content-Length"] == str(len(body))
+    assert multipart_parts(headers["Content-Type"], body) == [
+        (f"bytes 0-9/{SIZE}", DATA[0:10]),
+        (f"bytes 1000-1999/{SIZE}", DATA[1000:2000]),
+        (f"bytes {SIZE - 100}-{SIZE - 1}/{SIZE}", DATA[-100:]),
+    ]
+
+
+def test_multipart_ranges_across_chunks():
+    ranges = [(10, 20), (MIB - 5, MIB + 5), (2 * MIB + 100, 3 * MIB + 200)]
+    value = "bytes=" + ",".join(f"{first}-{last}" for first, last in ranges)
+    status, headers, body, _ = request(headers={"Range": value})
+    assert status == 206
+    assert multipart_parts(headers["Content-Type"], body) == [
+        (f"bytes {first}-{last}/{SIZE}", DATA[first:last + 1]) for first, last in ranges
+    ]
+
+
+def test_multipart_fetches_shared_chunks_once():
+    _, _, _, requests = request(headers={"Range": "bytes=0-99,5000-5099,60000-60099"})
+    offsets = [offset for offset, _ in requests]
+    assert len(offsets) == len(set(offsets))
+
+
+def test_overlapping_ranges_are_merged():
+    status, headers, body, _ = request(headers={"Range": "bytes=500-600,0-10,5-550"})
+    assert status == 206
+    assert headers["Content-Range"] == f"bytes 0-600/{SIZE}"
+    assert body == DATA[0:601]
+
+
+def test_too_many_ranges():
+    value = "bytes=" + ",".join(f"{i * 1000}-{i * 1000 + 1}" for i in range(MAX_RANGES + 1))
+    status, _, _, _ = request(headers={"Range": value})
+    assert status == 416
+
+
+def test_if_range():
+    status, _, body, _ = request(headers={"Range": "bytes=0-9", "If-Range": ETAG})
+    assert status == 206 and body == DATA[:10]
+    for validator in ['"other"', f"W/{ETAG}", "Wed, 21 Oct 2015 07:28:00 GMT"]:
+        status, _, body, _ = request(headers={"Range": "bytes=0-9", "If-Range": validator})
+        assert status == 200 and body == DATA, validator
+
+
+def test_if_none_match():
+    for validator in [ETAG, f"W/{ETAG}", f'"other", {ETAG}', "*"]:
+        status, headers, body, requests = request(headers={"If-None-Match": validator})
+        assert status == 304, validator
+        assert headers["ETag"] == ETAG
+        assert "immutable" in headers["Cache-Control"]
+        assert body == b"" and requests == []
+    status, _, body, _ = request(headers={"If-None-Match": '"other"'})
+    assert status == 200 and body == DATA
+
+
+def test_cache_control_per_mime_type():
+    _, headers, _, _ = request(headers={"Range": "bytes=0-9"})
+    assert headers["Cache-Control"] == "public, max-age=2592000, immutable"
+    _, headers, _, _ = request(headers={"Range": "bytes=0-9"}, url=URL.replace("video.mp4", "archive.zip"))
+    assert headers["Cache-Control"] == "public, max-age=86400"
+
+
+def test_head():
+    status, headers, body, requests = request("HEAD", headers={"Range": "bytes=10-19"})
+    assert status == 206
+    assert headers["Content-Range"] == f"bytes 10-19/{SIZE}"
+    assert headers["Content-Length"] == "10"
+    assert body == b""
+    assert requests == []
+
+
+def test_mismatched_unique_id_does_not_touch_the_chunk_cache():
+    """A URL pairing a cached file's unique id with another file_id is rejected before any cache access"""
+    other_file_id = FileId(file_type=FileType.DOCUMENT, dc_id=4, media_id=99, access_hash=3, file_reference=b"ref").encode()
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, UNIQUE_ID))
+        with open(os.path.join(directory, UNIQUE_ID, "0"), "wb") as f:
+            f.write(DATA[:MIB])
+        cache = ChunkCache(directory, 64 * MIB)
+        original = custom_dl.chunk_cache
+        custom_dl.chunk_cache = cache
+        try:
+            status, _, _, requests = request(url=f"/dl/{UNIQUE_ID}/{other_file_id}/{SIZE}/video.mp4")
+        finally:
+            custom_dl.chunk_cache = original
+        assert status == 400
+        assert requests == []
+        assert (cache.hits, cache.misses) == (0, 0)
+        assert list(cache.entries) == [(UNIQUE_ID, 0)]
+        assert os.listdir(directory) == [UNIQUE_ID]
+        with open(os.path.join(directory, UNIQUE_ID, "0"), "rb") as f:
+            assert f.read() == DATA[:MIB]
+
+
+def test_open_ranges_are_cached_from_the_first_byte():
+    """The first block of a `bytes=0-` request is fetched in full size chunks, so a second request hits the cache"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ChunkCache(directory, 64 * MIB)
+        session = FakeMediaSession()
+        fake_byte_streamer(session)
+        original = custom_dl.chunk_cache, stream_routes.utils.chunk_cache
+        custom_dl.chunk_cache = stream_routes.utils.chunk_cache = cache
+
+        async def run():
+            app = web.Application()
+            app.add_routes(stream_routes.routes)
+            async with TestClient(TestServer(app)) as client:
+                results = []
+                for _ in range(2):
+                    session.requests.clear()
+                    response = await client.get(URL, headers={"Range": "bytes=0-"})
+                    results.append((await response.read(), list(session.requests)))
+                    await asyncio.gather(*cache._writes)
+                return results
+
+        try:
+            (first_body, first_requests), (second_body, second_requests) = asyncio.run(run())
+        finally:
+            custom_dl.chunk_cache, stream_routes.utils.chunk_cache = original
+        assert first_body == second_body == DATA
+        assert all(limit == MIB for _, limit in first_requests)
+        assert second_requests == []
+        assert cache.hits == 4
+        assert work_loads[0] == 0
+
+
+def test_parse_range_header():
+    assert parse_range_header("bytes=0-0", 10) == [(0, 0)]
+    assert parse_range_header("bytes=-3", 10) == [(7, 9)]
+    assert parse_range_header("bytes=8-", 10) == [(8, 9)]
+    assert parse_range_header("bytes=0-1,100-200", 10) == [(0, 1)]
+    assert parse_range_header("bytes=5-3", 10) is None
+    assert merge_ranges([(0, 10), (200, 300), (11, 20)], 80) == [(0, 20), (200, 300)]
+    try:
+        parse_range_header("bytes=0-5", 0)
+        raise AssertionError("an empty file has no satisfiable range")
+    except RangeNotSatisfiable:
+        pass
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for the media session pool: failing sessions are dropped, the client's own session is kept.
+"""
+import asyncio
+
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+from WebStreamer.utils.session_pool import MAX_SESSION_FAILURES, MediaSessionPool
+
+
+class BrokenSession:
+    """A session whose connection always fails"""
+    def __init__(self):
+        self.is_connected = asyncio.Event()
+        self.is_connected.set()
+        self.stopped = False
+
+    async def invoke(self, query, *args, **kwargs):
+        raise OSError("connection reset")
+
+    async def stop(self):
+        self.stopped = True
+
+
+def test_primary_session_is_never_discarded():
+    async def run():
+        primary, extra = BrokenSession(), BrokenSession()
+
+        async def create_session():
+            return extra
+
+        pool = MediaSessionPool(4, primary, create_session, max_size=2, grow_threshold=0, idle_timeout=60)
+        pool.pick()
+        await pool.growing
+        assert pool.sessions == [primary, extra]
+        pool.grow_threshold = 100
+
+        async def fail(times):
+            for _ in range(times):
+                try:
+                    await pool.invoke(None)
+                except OSError:
+                    pass
+            await asyncio.sleep(0)
+
+        # Both sessions are idle, the primary one gets the requests and keeps failing
+        await fail(2 * MAX_SESSION_FAILURES)
+        assert pool.sessions == [primary, extra]
+        assert not primary.stopped
+        # Once it reports the disconnect the extra session gets the requests and is dropped
+        primary.is_connected.clear()
+        await fail(MAX_SESSION_FAILURES)
+        assert pool.sessions == [primary]
+        assert extra.stopped and not primary.stopped
+        pool.discard(primary)
+        assert pool.sessions == [primary]
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for request coalescing (WebStreamer/utils/single_flight.py): concurrent callers share one
+call, the call is cancelled only once its last waiter leaves, and keys beyond max_keys bypass it.
+"""
+import asyncio
+
+from benchmarks.offline_env import use_placeholder_settings
+use_placeholder_settings()
+
+from WebStreamer.utils.single_flight import SingleFlight
+
+
+class Call:
+    """A factory whose calls wait for `release` and record how they ended"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        self.started += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return b"chunk"
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flight = SingleFlight(8)
+        call = Call()
+        waiters = [asyncio.ensure_future(flight.do("key", call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        call.release.set()
+        results = await asyncio.gather(*waiters)
+        return flight, call, results
+
+    flight, call, results = asyncio.run(run())
+    assert results == [b"chunk"] * 3
+    assert call.started == 1
+    assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 2, "bypassed": 0}
+
+
+def test_call_is_cancelled_with_its_last_waiter():
+    async def run():
+        flight = SingleFlight(8)
+        call = Call()
+        first, second = [asyncio.ensure_future(flight.do("key", call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        # The other waiter still gets the result
+        assert call.cancelled == 0 and "key" in flight.calls
+        call.release.set()
+        assert await second == b"chunk"
+
+        call = Call()
+        waiters = [asyncio.ensure_future(flight.do("key", call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert call.cancelled == 1
+        assert flight.calls == {}
+
+    asyncio.run(run())
+
+
+def test_keys_beyond_max_keys_bypass_sharing():
+    async def run():
+        flight = SingleFlight(1)
+        shared, own = Call(), Call()
+        waiter = asyncio.ensure_future(flight.do("a", shared))
+        await asyncio.sleep(0)
+        bypassing = asyncio.ensure_future(flight.do("b", own))
+        await asyncio.sleep(0)
+        assert list(flight.calls) == ["a"]
+        shared.release.set()
+        own.release.set()
+        assert await asyncio.gather(waiter, bypassing) == [b"chunk", b"chunk"]
+        return flight
+
+    flight = asyncio.run(run())
+    assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 0, "bypassed": 1}
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")
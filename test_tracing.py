@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for per-request tracing: Server-Timing headers of /dl responses and the
+slow-request log record with the phases of the request.
+"""
+import json
+import logging
+
+from test_range_requests import ETAG, request
+from WebStreamer import Var
+from WebStreamer.utils.tracing import RequestTrace, current_trace, finish_trace, start_trace, trace_span
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def traced_request(**kwargs):
+    """Runs one /dl request with every request traced (tracing is off by default)"""
+    sample_rate = Var.TRACE_SAMPLE_RATE
+    Var.TRACE_SAMPLE_RATE = 1
+    try:
+        return request(**kwargs)
+    finally:
+        Var.TRACE_SAMPLE_RATE = sample_rate
+
+
+def slow_requests(threshold_ms: int, **kwargs) -> list:
+    """Runs one /dl request with SLOW_REQUEST_MS set to `threshold_ms`, returns the logged slow-request records"""
+    handler = Records()
+    logging.getLogger().addHandler(handler)
+    threshold = Var.SLOW_REQUEST_MS
+    Var.SLOW_REQUEST_MS = threshold_ms
+    try:
+        traced_request(**kwargs)
+    finally:
+        Var.SLOW_REQUEST_MS = threshold
+        logging.getLogger().removeHandler(handler)
+    prefix = "Slow request: "
+    return [json.loads(message[len(prefix):]) for message in handler.messages if message.startswith(prefix)]
+
+
+def server_timing_phases(headers) -> list:
+    return [entry.split(";")[0] for entry in headers["Server-Timing"].split(", ")]
+
+
+def test_server_timing_header():
+    status, headers, _, _ = traced_request(headers={"Range": "bytes=0-99"})
+    assert status == 206
+    phases = server_timing_phases(headers)
+    assert phases[:2] == ["decode", "select"]
+    # The headers wait for the first chunk, so they carry the Telegram phases too
+    assert {"location", "getfile"} <= set(phases)
+    assert phases[-1] == "total"
+
+
+def test_server_timing_of_multipart_responses():
+    status, headers, _, _ = traced_request(headers={"Range": "bytes=0-9, 3000000-3000009"})
+    assert status == 206
+    assert "getfile" in server_timing_phases(headers)
+
+
+def test_server_timing_on_responses_without_body():
+    status, headers, _, _ = traced_request(headers={"If-None-Match": ETAG})
+    assert status == 304
+    assert "total;dur=" in headers["Server-Timing"]
+    status, headers, _, _ = traced_request(method="HEAD")
+    assert status == 200
+    assert "getfile" not in server_timing_phases(headers)
+
+
+def test_tracing_is_off_by_default():
+    assert Var.TRACE_SAMPLE_RATE == 0
+    _, headers, _, _ = request(headers={"Range": "bytes=0-99"})
+    assert "Server-Timing" not in headers
+
+
+def test_slow_request_log():
+    [record] = slow_requests(0, headers={"Range": "bytes=10-2000000"})
+    assert record["status"] == 206
+    assert record["range"] == "bytes=10-2000000"
+    assert record["client"] == 0 and record["dc"] == 4
+    assert 0 <= record["first_byte_ms"] <= record["total_ms"]
+    # Spans of the read-ahead tasks started by the stream land in the trace of the request
+    assert {"decode", "select", "location", "getfile"} <= set(record["phases"])
+    assert record["phases"]["getfile"]["count"] >= 2
+    assert slow_requests(60000, headers={"Range": "bytes=10-2000000"}) == []
+
+
+def test_spans_outside_a_request_are_ignored():
+    assert current_trace.get() is None
+    with trace_span("getfile"):
+        pass
+    trace = start_trace(1)
+    assert isinstance(trace, RequestTrace)
+    with trace_span("getfile"):
+        pass
+    with trace_span("getfile"):
+        pass
+    finish_trace(trace, 60000)
+    assert current_trace.get() is None
+    assert trace.phases["getfile"][0] == 2
+
+
+if __name__ == "__main__":
+    for test in [value for key, value in list(globals().items()) if key.startswith("test_")]:
+        test()
+        print(f"✓ {test.__name__}")